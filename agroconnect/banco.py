@@ -0,0 +1,108 @@
+"""
+Perfis de banco de dados escolhidos por variável de ambiente (DB_PERFIL), usados em settings.py.
+
+- sqlite (padrão): WAL, synchronous=NORMAL, mmap e busy timeout aplicados em cada conexão,
+  transações IMMEDIATE e conexões persistentes.
+- sqlite-padrao: a configuração padrão do Django, para comparação (benchmark_escrita).
+- postgres: conexões persistentes (CONN_MAX_AGE) com verificação de saúde.
+- postgres-pool: pool de conexões do psycopg 3 (requer psycopg[pool]); sem CONN_MAX_AGE.
+
+Réplicas de leitura (core.replicas) vêm de DB_REPLICAS: caminhos de arquivos SQLite ou hosts
+Postgres separados por vírgula, com a mesma configuração do principal.
+"""
+import copy
+import os
+
+PERFIS = ('sqlite', 'sqlite-padrao', 'postgres', 'postgres-pool')
+
+
+def _env(nome, padrao):
+    return os.environ.get(nome, padrao)
+
+
+def _sqlite(base_dir):
+    # Em WAL leitores não bloqueiam o escritor (e vice-versa); synchronous=NORMAL só perde as
+    # últimas transações numa queda de energia, nunca corrompe o banco
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA mmap_size={int(_env('DB_SQLITE_MMAP', 256 * 1024 * 1024))}",
+        f"PRAGMA cache_size=-{int(_env('DB_SQLITE_CACHE_KB', 20000))}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _env('DB_NAME', base_dir / 'db.sqlite3'),
+        'OPTIONS': {
+            'init_command': ';'.join(pragmas),
+            # Busy timeout: espera o outro escritor em vez de falhar com "database is locked"
+            'timeout': float(_env('DB_TIMEOUT', 20)),
+            # Reserva o banco para escrita no início da transação. Com DEFERRED, uma transação
+            # que leu antes de escrever falha na hora ao disputar o lock, sem esperar o timeout
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': int(_env('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'NAME': _env('DB_TEST_NAME', None)},
+    }
+
+
+def _sqlite_padrao(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _env('DB_NAME', base_dir / 'db.sqlite3'),
+        'TEST': {'NAME': _env('DB_TEST_NAME', None)},
+    }
+
+
+def _postgres(pool):
+    banco = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': _env('DB_NAME', 'agroconnect'),
+        'USER': _env('DB_USER', 'agroconnect'),
+        'PASSWORD': _env('DB_PASSWORD', ''),
+        'HOST': _env('DB_HOST', 'localhost'),
+        'PORT': _env('DB_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+        'TEST': {'NAME': _env('DB_TEST_NAME', None)},
+    }
+    if pool:
+        # O pool já reaproveita as conexões; o Django exige CONN_MAX_AGE = 0 com ele
+        banco['CONN_MAX_AGE'] = 0
+        banco['OPTIONS']['pool'] = {
+            'min_size': int(_env('DB_POOL_MIN', 2)),
+            'max_size': int(_env('DB_POOL_MAX', 10)),
+            'timeout': float(_env('DB_POOL_TIMEOUT', 10)),
+        }
+    else:
+        banco['CONN_MAX_AGE'] = int(_env('DB_CONN_MAX_AGE', 60))
+    return banco
+
+
+def banco_do_ambiente(base_dir):
+    """Configuração do banco 'default' para o perfil em DB_PERFIL."""
+    perfil = _env('DB_PERFIL', 'sqlite')
+    if perfil == 'sqlite':
+        return _sqlite(base_dir)
+    if perfil == 'sqlite-padrao':
+        return _sqlite_padrao(base_dir)
+    if perfil in ('postgres', 'postgres-pool'):
+        return _postgres(pool=perfil == 'postgres-pool')
+    raise ValueError(f"DB_PERFIL desconhecido: {perfil!r} (use {', '.join(PERFIS)}).")
+
+
+def replicas_do_ambiente(principal):
+    """Aliases replica1, replica2... para cada destino em DB_REPLICAS, copiando a configuração do principal."""
+    destinos = [destino.strip() for destino in _env('DB_REPLICAS', '').split(',') if destino.strip()]
+    replicas = {}
+    for i, destino in enumerate(destinos, 1):
+        replica = copy.deepcopy(principal)
+        if principal['ENGINE'] == 'django.db.backends.sqlite3':
+            replica['NAME'] = destino
+        else:
+            replica['HOST'] = destino
+        # Nos testes a réplica aponta para o banco de teste do principal
+        replica['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica{i}'] = replica
+    return replicas
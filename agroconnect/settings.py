@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os 
+import tempfile
+from .banco import banco_do_ambiente, replicas_do_ambiente
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,11 +45,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Latência de toda a cadeia; lê as consultas registradas pelo middleware seguinte
+    'core.middleware.MetricasMiddleware',
+    # Primeiro da lista para contar também as consultas de sessão e autenticação
+    'core.middleware.InstrumentacaoSQLMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Antes da sessão: as gravações da sessão também contam como escrita da requisição
+    'core.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Depois da autenticação (o cabeçalho só vale para staff) e antes do resto da view
+    'core.middleware.PerfiladorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,13 +68,22 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates compilados uma vez por processo. Com DEBUG o runserver limpa o cache
+            # quando um template muda
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.badges',
+                'core.context_processors.eventos',
             ],
         },
     },
@@ -76,13 +95,145 @@ WSGI_APPLICATION = 'agroconnect.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Perfil escolhido por DB_PERFIL (sqlite, sqlite-padrao, postgres, postgres-pool); ver agroconnect/banco.py
 DATABASES = {
+    'default': banco_do_ambiente(BASE_DIR),
+}
+# Réplicas de leitura (DB_REPLICAS), usadas pelas views marcadas com core.replicas.leitura_na_replica
+DATABASES.update(replicas_do_ambiente(DATABASES['default']))
+BANCOS_REPLICA = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.replicas.RoteadorReplicas']
+# Segundos em que as leituras de quem acabou de escrever ficam no principal
+REPLICA_JANELA_PRIMARIO = int(os.environ.get('REPLICA_JANELA_PRIMARIO', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Contexto dos relatórios por fornecedor (core.cache.CacheRelatorios).
+    # Para compartilhar entre processos use o backend de arquivos, ex.:
+    # RELATORIOS_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+    # RELATORIOS_CACHE_LOCATION=/var/tmp/agroconnect_relatorios
+    'relatorios': {
+        'BACKEND': os.environ.get('RELATORIOS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('RELATORIOS_CACHE_LOCATION', 'relatorios'),
+        'TIMEOUT': int(os.environ.get('RELATORIOS_CACHE_TIMEOUT', 600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # Fragmentos de template do catálogo ({% cache %}, versões em core.catalogo). Com mais de um
+    # processo use um backend compartilhado, como em 'relatorios'
+    'template_fragments': {
+        'BACKEND': os.environ.get('FRAGMENTOS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('FRAGMENTOS_CACHE_LOCATION', 'fragmentos'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    # Contadores dos badges por perfil (core.contadores). O incr é atômico no Memcached/Redis.
+    # O LocMemCache padrão só vale para um processo: com vários workers cada um tem os próprios
+    # contadores, que divergem entre si e do banco; em produção defina CONTADORES_CACHE_BACKEND
+    'contadores': {
+        'BACKEND': os.environ.get('CONTADORES_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CONTADORES_CACHE_LOCATION', 'contadores'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
 }
 
+# Tempo máximo (s) de um fragmento; as mudanças no catálogo já trocam a chave antes disso
+FRAGMENTOS_CACHE_TIMEOUT = int(os.environ.get('FRAGMENTOS_CACHE_TIMEOUT', 300))
+
+# Tempo máximo (s) de um contador sem recontagem no banco; limita a defasagem de um contador
+# que saiu do compasso com o banco (ver core.contadores e reconciliar_contadores)
+CONTADORES_CACHE_TIMEOUT = int(os.environ.get('CONTADORES_CACHE_TIMEOUT', 3600))
+
+RELATORIOS_CACHE_MAX_ENTRADAS = int(os.environ.get('RELATORIOS_CACHE_MAX_ENTRADAS', 500))
+# Segundos entre regravações do índice LRU nos acertos do cache de relatórios (por processo)
+RELATORIOS_CACHE_INTERVALO_USO = int(os.environ.get('RELATORIOS_CACHE_INTERVALO_USO', 60))
+
+
+# Instrumentação SQL por requisição (core.middleware.InstrumentacaoSQLMiddleware)
+
+INSTRUMENTACAO_SQL_ATIVA = os.environ.get('INSTRUMENTACAO_SQL_ATIVA', '1') == '1'
+# Acima de quantas execuções da mesma forma de consulta a requisição é registrada como N+1
+INSTRUMENTACAO_SQL_REPETICOES = int(os.environ.get('INSTRUMENTACAO_SQL_REPETICOES', 5))
+
+
+# Métricas no formato do Prometheus em /metrics (core.metricas)
+
+METRICAS_ATIVAS = os.environ.get('METRICAS_ATIVAS', '1') == '1'
+# Um arquivo mmap por processo; esvazie o diretório ao (re)iniciar o serviço (manage.py limpar_metricas)
+METRICAS_DIRETORIO = os.environ.get('METRICAS_DIRETORIO', os.path.join(tempfile.gettempdir(), 'agroconnect-metricas'))
+# Se definido, /metrics exige o cabeçalho "Authorization: Bearer <token>"
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+
+
+# Perfilador por amostragem (core.middleware.PerfiladorMiddleware); desligado, sai da cadeia
+
+PERFILADOR_ATIVO = os.environ.get('PERFILADOR_ATIVO', '0') == '1'
+# Requisições de staff com este cabeçalho são sempre perfiladas
+PERFILADOR_CABECALHO = 'X-Perfilar'
+# Fração das demais requisições perfiladas (0.01 = 1%)
+PERFILADOR_TAXA = float(os.environ.get('PERFILADOR_TAXA', 0))
+PERFILADOR_INTERVALO = float(os.environ.get('PERFILADOR_INTERVALO', 0.001))
+PERFILADOR_DIRETORIO = os.environ.get('PERFILADOR_DIRETORIO', os.path.join(tempfile.gettempdir(), 'agroconnect-perfis'))
+# Mantém só os arquivos mais recentes
+PERFILADOR_MAX_ARQUIVOS = int(os.environ.get('PERFILADOR_MAX_ARQUIVOS', 200))
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # INFO registra todas as requisições; o padrão mostra só as suspeitas de N+1
+        'core.sql': {
+            'handlers': ['console'],
+            'level': os.environ.get('SQL_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
+# Autenticação
+
+AUTHENTICATION_BACKENDS = [
+    # Carrega o Perfil junto com o usuário da sessão
+    'core.autenticacao.PerfilBackend',
+    # Só para as sessões abertas antes do PerfilBackend (a sessão guarda o backend usado no
+    # login); pode sair depois de SESSION_COOKIE_AGE
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Segundos que o usuário da sessão (com o perfil) fica em cache; 0 desliga.
+# Com mais de um processo use um alias de cache compartilhado entre eles.
+PERFIL_CACHE_TIMEOUT = int(os.environ.get('PERFIL_CACHE_TIMEOUT', 0))
+PERFIL_CACHE_ALIAS = os.environ.get('PERFIL_CACHE_ALIAS', 'default')
+
+
+# Views assíncronas
+
+# Liga as versões assíncronas do dashboard e dos relatórios (core.paralelo) nas URLs. Só vale a
+# pena sob ASGI: com WSGI cada requisição a uma view assíncrona abre um event loop próprio.
+VIEWS_ASSINCRONAS = os.environ.get('VIEWS_ASSINCRONAS', '0') == '1'
+# Threads (e conexões com o banco) do pool das consultas em paralelo, por processo
+CONSULTAS_PARALELAS_THREADS = int(os.environ.get('CONSULTAS_PARALELAS_THREADS', 8))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
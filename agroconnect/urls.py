@@ -16,9 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from core.views import home
+from core.views import baixar_perfil, home, perfis_capturados
 
 urlpatterns = [
+    # Antes do admin, que responde 404 para qualquer outra URL sob admin/
+    path('admin/perfis/', perfis_capturados, name='perfis_capturados'),
+    path('admin/perfis/<str:nome>', baixar_perfil, name='baixar_perfil'),
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')), # Inclui logout
     path('', home, name='home'),  # Página inicial
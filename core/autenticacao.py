@@ -0,0 +1,41 @@
+# autenticacao.py
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+
+def _chave(usuario_id):
+    return f'usuario_com_perfil:{usuario_id}'
+
+
+def invalidar_usuario(usuario_id):
+    """Remove o usuário do cache (chamado pelos sinais de User e Perfil)."""
+    if getattr(settings, 'PERFIL_CACHE_TIMEOUT', 0):
+        caches[settings.PERFIL_CACHE_ALIAS].delete(_chave(usuario_id))
+
+
+class PerfilBackend(ModelBackend):
+    """
+    ModelBackend que carrega o usuário da sessão junto com o Perfil (select_related), numa
+    consulta só: `request.user.perfil` deixa de custar uma consulta em cada view.
+
+    Com PERFIL_CACHE_TIMEOUT > 0 o usuário (com o perfil) também fica no cache
+    PERFIL_CACHE_ALIAS e a requisição autenticada só consulta a sessão. Os sinais de
+    User e Perfil (core.signals) apagam a entrada a cada alteração, inclusive troca de
+    senha e o PerfilForm de configurações. Com vários processos o alias precisa ser um
+    cache compartilhado; com LocMemCache um processo não vê a invalidação feita por outro.
+    """
+
+    def get_user(self, user_id):
+        timeout = getattr(settings, 'PERFIL_CACHE_TIMEOUT', 0)
+        usuario = caches[settings.PERFIL_CACHE_ALIAS].get(_chave(user_id)) if timeout else None
+        if usuario is None:
+            UserModel = get_user_model()
+            try:
+                usuario = UserModel._default_manager.select_related('perfil').get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            if timeout:
+                caches[settings.PERFIL_CACHE_ALIAS].set(_chave(user_id), usuario, timeout)
+        return usuario if self.user_can_authenticate(usuario) else None
@@ -0,0 +1,31 @@
+# banco_de_teste.py
+"""
+Banco descartável para os comandos que escrevem no banco para medir (benchmarks e teste de
+carga): criado com o create_test_db do Django, como no runner de testes, e destruído no fim;
+o banco configurado não é alterado.
+
+No SQLite o banco de teste fica num arquivo temporário, e não em memória, para as threads
+dos comandos (cada uma com a própria conexão) enxergarem os mesmos dados.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from django.db import connection, connections
+
+
+@contextmanager
+def banco_de_teste(nome='benchmark'):
+    """Troca o banco 'default' por um banco de teste vazio (só o esquema) enquanto o bloco roda."""
+    with tempfile.TemporaryDirectory() as diretorio:
+        nome_original = connection.settings_dict['NAME']
+        teste = connection.settings_dict.setdefault('TEST', {})
+        nome_teste_original = teste.get('NAME')
+        if connection.vendor == 'sqlite':
+            teste['NAME'] = os.path.join(diretorio, f'{nome}.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teste['NAME'] = nome_teste_original
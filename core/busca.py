@@ -0,0 +1,198 @@
+# busca.py
+import re
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import DEFAULT_DB_ALIAS, connections, OperationalError
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+from .models import Categoria, Produto, ProdutoBusca
+
+# Número máximo de resultados ranqueados devolvidos por uma busca
+LIMITE_RESULTADOS = 500
+
+
+def termos_da_busca(texto):
+    return re.findall(r'\w+', texto or '')
+
+
+class BuscaSimples:
+    """Busca sem índice (LIKE '%termo%'), usada quando o banco não tem suporte a texto completo."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.connection = connections[using]
+
+    def preparar(self):
+        pass
+
+    def reconstruir(self):
+        pass
+
+    def indexar(self, produtos):
+        pass
+
+    def remover(self, ids):
+        pass
+
+    def buscar(self, texto, limite=LIMITE_RESULTADOS):
+        filtro = Q()
+        for termo in termos_da_busca(texto):
+            filtro &= Q(nome__icontains=termo) | Q(descricao__icontains=termo) | Q(categoria__nome__icontains=termo)
+        return list(Produto.objects.using(self.using).filter(filtro).order_by('-data_criacao').values_list('id', flat=True)[:limite])
+
+
+class BuscaSQLite(BuscaSimples):
+    """
+    Índice FTS5 sobre nome, descrição e categoria do produto.
+    O tokenizador remove acentos, então "feijao" encontra "feijão".
+    """
+
+    tabela = 'core_produto_busca'
+    # Pesos do bm25 na ordem das colunas: nome, descricao, categoria
+    pesos = (10.0, 1.0, 3.0)
+
+    def _tabela_existe(self):
+        if getattr(self.connection, '_busca_produtos_pronta', False):
+            return True
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.tabela])
+            existe = cursor.fetchone() is not None
+        self.connection._busca_produtos_pronta = existe
+        return existe
+
+    def preparar(self):
+        if self._tabela_existe():
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.tabela} USING fts5("
+                "nome, descricao, categoria, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        self.connection._busca_produtos_pronta = True
+        self.reconstruir()
+
+    def reconstruir(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.tabela}")
+        produtos = Produto.objects.using(self.using).select_related('categoria').only('id', 'nome', 'descricao', 'categoria__nome')
+        lote = []
+        for produto in produtos.iterator(chunk_size=2000):
+            lote.append(produto)
+            if len(lote) == 2000:
+                self.indexar(lote)
+                lote = []
+        self.indexar(lote)
+
+    def indexar(self, produtos):
+        linhas = [
+            (p.id, p.nome, p.descricao, p.categoria.nome if p.categoria_id else '')
+            for p in produtos
+        ]
+        if not linhas:
+            return
+        self.preparar()
+        # Um único comando por lote, que troca a linha antiga sem deixar o rowid livre no meio
+        # (com DELETE e INSERT separados, dois saves concorrentes podiam inserir o mesmo rowid)
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {self.tabela} (rowid, nome, descricao, categoria) VALUES (%s, %s, %s, %s)",
+                linhas
+            )
+
+    def remover(self, ids):
+        if not ids:
+            return
+        self.preparar()
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.tabela} WHERE rowid = %s", [(i,) for i in ids])
+
+    def buscar(self, texto, limite=LIMITE_RESULTADOS):
+        termos = termos_da_busca(texto)
+        if not termos:
+            return []
+        # Cada termo vira um prefixo entre aspas: 'feij carioca' -> "feij"* "carioca"*
+        consulta = ' '.join('"%s"*' % termo for termo in termos)
+        try:
+            self.preparar()
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT rowid FROM {self.tabela} WHERE {self.tabela} MATCH %s "
+                    f"ORDER BY bm25({self.tabela}, %s, %s, %s) LIMIT %s",
+                    [consulta, *self.pesos, limite]
+                )
+                return [linha[0] for linha in cursor.fetchall()]
+        except OperationalError:
+            # SQLite compilado sem FTS5
+            return super().buscar(texto, limite)
+
+
+class BuscaPostgres(BuscaSimples):
+    """
+    Busca no vetor guardado em ProdutoBusca (índice GIN), ranqueada com ts_rank. O vetor é
+    recalculado no banco, num único INSERT ... ON CONFLICT por lote, pelos mesmos sinais que
+    mantêm o índice do SQLite; a busca não recalcula tsvectors.
+    Para ignorar acentos, configure BUSCA_POSTGRES_CONFIG com uma configuração
+    de texto que use a extensão unaccent (ex.: 'portuguese_unaccent').
+    """
+
+    def _config(self):
+        return getattr(settings, 'BUSCA_POSTGRES_CONFIG', 'portuguese')
+
+    def preparar(self):
+        # Tabela recém-criada pelo migrate: preenche com os produtos que já existem
+        if Produto.objects.using(self.using).exists() and not ProdutoBusca.objects.using(self.using).exists():
+            self.reconstruir()
+
+    def reconstruir(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {ProdutoBusca._meta.db_table}")
+        self._gravar_vetores()
+
+    def indexar(self, produtos):
+        ids = [p.id for p in produtos]
+        if ids:
+            self._gravar_vetores(ids)
+
+    def remover(self, ids):
+        if ids:
+            ProdutoBusca.objects.using(self.using).filter(produto_id__in=list(ids)).delete()
+
+    def _gravar_vetores(self, ids=None):
+        # Lê nome, descrição e categoria do banco: no post_save a linha já tem os valores novos
+        vetor = ' || '.join(
+            f"setweight(to_tsvector(%s::regconfig, coalesce({coluna}, '')), '{peso}')"
+            for coluna, peso in (('p.nome', 'A'), ('c.nome', 'B'), ('p.descricao', 'C'))
+        )
+        # Sempre com WHERE: "JOIN ... ON x ON CONFLICT" seria ambíguo para o parser
+        filtro = 'p.id = ANY(%s)' if ids is not None else 'true'
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {ProdutoBusca._meta.db_table} (produto_id, vetor) "
+                f"SELECT p.id, {vetor} FROM {Produto._meta.db_table} p "
+                f"LEFT JOIN {Categoria._meta.db_table} c ON c.id = p.categoria_id WHERE {filtro} "
+                "ON CONFLICT (produto_id) DO UPDATE SET vetor = EXCLUDED.vetor",
+                [self._config()] * 3 + ([ids] if ids is not None else [])
+            )
+
+    def buscar(self, texto, limite=LIMITE_RESULTADOS):
+        consulta = SearchQuery(texto, config=self._config(), search_type='websearch')
+        return list(
+            ProdutoBusca.objects.using(self.using).filter(vetor=consulta)
+            .annotate(relevancia=SearchRank(F('vetor'), consulta))
+            .order_by('-relevancia')
+            .values_list('produto_id', flat=True)[:limite]
+        )
+
+
+BACKENDS_POR_BANCO = {
+    'sqlite': BuscaSQLite,
+    'postgresql': BuscaPostgres,
+}
+
+
+def busca_produtos(using=DEFAULT_DB_ALIAS):
+    """Backend de busca configurado em BUSCA_PRODUTOS_BACKEND ou escolhido pelo banco em uso."""
+    caminho = getattr(settings, 'BUSCA_PRODUTOS_BACKEND', None)
+    if caminho:
+        return import_string(caminho)(using)
+    return BACKENDS_POR_BANCO.get(connections[using].vendor, BuscaSimples)(using)
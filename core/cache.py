@@ -0,0 +1,114 @@
+# cache.py
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .metricas import contar_cache
+from .replicas import ler_do_primario
+
+
+class CacheRelatorios:
+    """
+    Cache do contexto de relatórios por fornecedor.
+
+    Cada entrada expira pelo TIMEOUT do alias de cache e o número de fornecedores
+    em cache é limitado por `max_entradas`, descartando o menos usado recentemente.
+    A ordem de uso fica em uma chave de índice no próprio cache, então funciona
+    tanto com LocMemCache quanto com FileBasedCache.
+
+    O LRU é aproximado: um acerto só regrava o índice se o fornecedor não foi marcado
+    neste processo nos últimos `intervalo_uso` segundos (RELATORIOS_CACHE_INTERVALO_USO),
+    e a trava só vale dentro do processo; com vários workers uma marcação concorrente
+    pode se perder. No pior caso sai do cache um fornecedor usado há pouco.
+
+    As entradas são geradas sempre no banco principal (`ler_do_primario`), mesmo em views
+    com `@leitura_na_replica`: a invalidação feita por uma escrita não pode ser desfeita por
+    uma réplica atrasada.
+    """
+
+    prefixo = 'relatorio'
+
+    def __init__(self, alias='relatorios', max_entradas=None, intervalo_uso=None):
+        self.alias = alias
+        self.max_entradas = max_entradas or getattr(settings, 'RELATORIOS_CACHE_MAX_ENTRADAS', 500)
+        self.intervalo_uso = (
+            intervalo_uso if intervalo_uso is not None
+            else getattr(settings, 'RELATORIOS_CACHE_INTERVALO_USO', 60)
+        )
+        self._lock = threading.Lock()
+        # fornecedor_id -> última marcação no índice feita por este processo
+        self._marcados = {}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _chave(self, fornecedor_id):
+        return f'{self.prefixo}:{fornecedor_id}'
+
+    @property
+    def _chave_indice(self):
+        return f'{self.prefixo}:lru'
+
+    def _marcar_uso(self, fornecedor_id, forcar=False):
+        # Move o fornecedor para o fim da fila e remove os que passaram do limite. Nos acertos
+        # (forcar=False) só regrava o índice uma vez por intervalo_uso
+        agora = time.monotonic()
+        with self._lock:
+            if not forcar and agora - self._marcados.get(fornecedor_id, float('-inf')) < self.intervalo_uso:
+                return
+            if len(self._marcados) > 2 * self.max_entradas:
+                self._marcados.clear()
+            self._marcados[fornecedor_id] = agora
+            indice = [f for f in self.cache.get(self._chave_indice, []) if f != fornecedor_id]
+            indice.append(fornecedor_id)
+            excedentes = indice[:-self.max_entradas]
+            indice = indice[-self.max_entradas:]
+            self.cache.set(self._chave_indice, indice, None)
+        if excedentes:
+            self.cache.delete_many([self._chave(f) for f in excedentes])
+
+    def _ler(self, fornecedor_id):
+        contexto = self.cache.get(self._chave(fornecedor_id))
+        contar_cache(self.alias, contexto is not None)
+        return contexto
+
+    def _guardar(self, fornecedor_id, contexto):
+        self.cache.set(self._chave(fornecedor_id), contexto)
+
+    def obter(self, fornecedor_id, gerar):
+        """Devolve o contexto em cache ou chama `gerar()` e armazena o resultado."""
+        contexto = self._ler(fornecedor_id)
+        if contexto is None:
+            with ler_do_primario():
+                contexto = gerar()
+            self._guardar(fornecedor_id, contexto)
+            self._marcar_uso(fornecedor_id, forcar=True)
+        else:
+            self._marcar_uso(fornecedor_id)
+        return contexto
+
+    async def aobter(self, fornecedor_id, gerar):
+        """Como `obter`, para views assíncronas: `gerar()` devolve uma corrotina."""
+        contexto = await sync_to_async(self._ler)(fornecedor_id)
+        if contexto is None:
+            with ler_do_primario():
+                contexto = await gerar()
+            await sync_to_async(self._guardar)(fornecedor_id, contexto)
+            await sync_to_async(self._marcar_uso)(fornecedor_id, forcar=True)
+        else:
+            await sync_to_async(self._marcar_uso)(fornecedor_id)
+        return contexto
+
+    def invalidar(self, fornecedor_id):
+        if fornecedor_id is None:
+            return
+        chave = self._chave(fornecedor_id)
+        self.cache.delete(chave)
+        # De novo após o commit: um relatório gerado durante a transação leu os dados antigos
+        transaction.on_commit(lambda: self.cache.delete(chave))
+
+
+cache_relatorios = CacheRelatorios()
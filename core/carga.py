@@ -0,0 +1,523 @@
+# carga.py
+"""
+Gerador de carga local: usuários virtuais executando os fluxos de pedido e de mensagens
+ao mesmo tempo contra a aplicação WSGI (agroconnect/wsgi.py, uma thread por usuário) ou
+ASGI (agroconnect/asgi.py, uma tarefa asyncio por usuário), sem servidor HTTP no meio.
+
+Cada fluxo é um gerador que produz Requisicao e recebe a Resposta correspondente, de modo
+que o mesmo fluxo roda nos dois drivers. Os usuários entram já autenticados (sessão criada
+antes da carga) e mandam o token CSRF em cabeçalho, como um cliente JavaScript faria.
+"""
+import asyncio
+import io
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from .models import Conversa, Perfil, Produto
+
+HOST = 'carga.local'
+
+PAPEIS = ('comprador', 'fornecedor', 'mensagens')
+
+MENSAGENS = ['Ainda tem disponível?', 'Pode enviar amanhã?', 'Pedido confirmado.', 'Obrigado!']
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def ler_mix(texto):
+    """'comprador=6,fornecedor=2,mensagens=2' -> {'comprador': 6, ...}; levanta ValueError se inválido."""
+    mix = {}
+    for parte in filter(None, (parte.strip() for parte in texto.split(','))):
+        papel, _, peso = parte.partition('=')
+        if papel not in PAPEIS:
+            raise ValueError(f"Papel desconhecido: {papel!r} (use {', '.join(PAPEIS)}).")
+        mix[papel] = float(peso or 1)
+        if mix[papel] < 0:
+            raise ValueError(f'Peso negativo para {papel}.')
+    if not sum(mix.values()):
+        raise ValueError('O mix precisa de ao menos um papel com peso positivo.')
+    return mix
+
+
+def distribuir(total, mix):
+    """Quantos usuários de cada papel, proporcional aos pesos (maiores restos primeiro)."""
+    soma = sum(mix.values())
+    cotas = {papel: total * peso / soma for papel, peso in mix.items()}
+    quantidades = {papel: int(cota) for papel, cota in cotas.items()}
+    restantes = sorted(cotas, key=lambda papel: cotas[papel] - quantidades[papel], reverse=True)
+    for papel in restantes[:total - sum(quantidades.values())]:
+        quantidades[papel] += 1
+    return quantidades
+
+
+class Requisicao:
+    def __init__(self, rota, metodo='GET', caminho=None, dados=None, esperado=200):
+        self.rota = rota
+        self.metodo = metodo
+        self.caminho = caminho
+        self.dados = dados or {}
+        self.esperado = esperado
+
+    @property
+    def passo(self):
+        return f'{self.metodo} {self.rota}'
+
+    @property
+    def corpo(self):
+        return urlencode(self.dados).encode() if self.metodo == 'POST' else b''
+
+
+class Resposta:
+    def __init__(self, status, cabecalhos, conteudo):
+        self.status = status
+        self.cabecalhos = cabecalhos
+        self.conteudo = conteudo
+
+    @property
+    def texto(self):
+        return self.conteudo.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.conteudo)
+
+
+class UsuarioVirtual:
+    """Perfil logado com seus cookies (sessão e CSRF) e o que o fluxo do papel precisa."""
+
+    def __init__(self, papel, perfil, sessao, pensar, semente, produtos=(), contatos=()):
+        self.papel = papel
+        self.perfil = perfil
+        self.pensar_medio = pensar
+        self.aleatorio = random.Random(semente)
+        self.produtos = list(produtos)
+        self.contatos = list(contatos)
+        self.ultima_mensagem = {}
+        self.acoes = 0
+        self.csrf = get_random_string(32)
+        self.cookies = SimpleCookie()
+        self.cookies[settings.SESSION_COOKIE_NAME] = sessao
+        self.cookies[settings.CSRF_COOKIE_NAME] = self.csrf
+
+    def cabecalhos(self, requisicao):
+        cabecalhos = {
+            'host': HOST,
+            'cookie': '; '.join(f'{nome}={morsel.value}' for nome, morsel in self.cookies.items() if morsel.value),
+            'x-csrftoken': self.csrf,
+        }
+        if requisicao.metodo == 'POST':
+            cabecalhos['content-type'] = 'application/x-www-form-urlencoded'
+            cabecalhos['content-length'] = str(len(requisicao.corpo))
+        return cabecalhos
+
+    def guardar_cookies(self, resposta):
+        for nome, valor in resposta.cabecalhos:
+            if nome.lower() == 'set-cookie':
+                self.cookies.load(valor)
+
+    def pensar(self):
+        # Tempo entre ações com distribuição exponencial (chegadas de Poisson)
+        return self.aleatorio.expovariate(1 / self.pensar_medio) if self.pensar_medio > 0 else 0
+
+
+# Fluxos ------------------------------------------------------------------------------------------
+
+def fluxo_comprador(usuario):
+    # Vários compradores disputando os mesmos produtos
+    produto_id = usuario.aleatorio.choice(usuario.produtos)
+    yield Requisicao('detalhes_produto', caminho=reverse('detalhes_produto', args=[produto_id]))
+    yield Requisicao(
+        'fazer_pedido', 'POST', reverse('fazer_pedido', args=[produto_id]),
+        {'quantidade': usuario.aleatorio.randint(1, 3)}, esperado=302
+    )
+
+
+def fluxo_fornecedor(usuario):
+    resposta = yield Requisicao('pedidos_pendentes', caminho=reverse('pedidos_pendentes'))
+    if resposta.status != 200:
+        return
+    # Ids dos links "Aceitar" da página, como o fornecedor clicaria
+    prefixo, _, sufixo = reverse('aceitar_pedido', args=[0]).rpartition('0')
+    pendentes = sorted({
+        int(trecho.split(sufixo, 1)[0])
+        for trecho in resposta.texto.split(prefixo)[1:]
+        if trecho.split(sufixo, 1)[0].isdigit()
+    })
+    if pendentes:
+        pedido_id = usuario.aleatorio.choice(pendentes)
+        yield Requisicao('aceitar_pedido', 'POST', reverse('aceitar_pedido', args=[pedido_id]), esperado=302)
+
+
+def fluxo_mensagens(usuario):
+    outro_id = usuario.aleatorio.choice(usuario.contatos)
+    conteudo = usuario.aleatorio.choice(MENSAGENS)
+    if usuario.aleatorio.random() < 0.5:
+        yield Requisicao(
+            'nova_mensagem', 'POST', reverse('nova_mensagem'),
+            {'destinatario': outro_id, 'conteudo': conteudo}, esperado=302
+        )
+    else:
+        yield Requisicao(
+            'detalhes_conversa', 'POST', reverse('detalhes_conversa', args=[outro_id]),
+            {'conteudo': conteudo}, esperado=302
+        )
+    yield Requisicao('detalhes_conversa', caminho=reverse('detalhes_conversa', args=[outro_id]))
+    # Consulta periódica do chat a partir da última mensagem já vista
+    depois = usuario.ultima_mensagem.get(outro_id, 0)
+    resposta = yield Requisicao(
+        'mensagens_novas', caminho=f"{reverse('mensagens_novas', args=[outro_id])}?depois={depois}"
+    )
+    if resposta.status == 200:
+        mensagens = resposta.json()['mensagens']
+        if mensagens:
+            usuario.ultima_mensagem[outro_id] = mensagens[-1]['id']
+
+
+FLUXOS = {
+    'comprador': fluxo_comprador,
+    'fornecedor': fluxo_fornecedor,
+    'mensagens': fluxo_mensagens,
+}
+
+
+def preparar_usuarios(quantidades, produtos_quentes=5, pensar=1.0, semente=42):
+    """
+    Cria os usuários virtuais a partir dos dados do banco (rode gerar_dados_exemplo antes).
+    Compradores pedem os `produtos_quentes` produtos com mais estoque; fornecedores são os
+    donos desses produtos; o papel "mensagens" usa as conversas mais recentes.
+    Levanta ValueError se faltarem dados para algum papel.
+    """
+    aleatorio = random.Random(semente)
+    produtos = list(
+        Produto.objects.filter(quantidade__gt=0).order_by('-quantidade', 'id')
+        .values_list('id', 'fornecedor_id')[:produtos_quentes]
+    )
+    if not produtos and (quantidades.get('comprador') or quantidades.get('fornecedor')):
+        raise ValueError('Nenhum produto com estoque para os fluxos de pedido.')
+
+    candidatos = {'comprador': [], 'fornecedor': [], 'mensagens': []}
+    if quantidades.get('comprador'):
+        candidatos['comprador'] = [
+            (perfil, {'produtos': [produto_id for produto_id, _ in produtos]})
+            for perfil in Perfil.objects.filter(tipo='comprador').select_related('usuario')
+            .annotate(total=Count('pedidos_feitos')).order_by('-total', 'id')[:quantidades['comprador']]
+        ]
+    if quantidades.get('fornecedor'):
+        donos = {fornecedor_id for _, fornecedor_id in produtos}
+        candidatos['fornecedor'] = [
+            (perfil, {}) for perfil in Perfil.objects.filter(id__in=donos).select_related('usuario').order_by('id')
+        ]
+    if quantidades.get('mensagens'):
+        conversas = Conversa.objects.filter(
+            perfil_a__tipo__in=['comprador', 'fornecedor'], perfil_b__tipo__in=['comprador', 'fornecedor']
+        ).select_related('perfil_a__usuario', 'perfil_b__usuario').order_by('-ultima_data')[:quantidades['mensagens']]
+        for i, conversa in enumerate(conversas):
+            perfil, outro = (conversa.perfil_a, conversa.perfil_b) if i % 2 else (conversa.perfil_b, conversa.perfil_a)
+            candidatos['mensagens'].append((perfil, {'contatos': [outro.id]}))
+
+    usuarios = []
+    sessoes = {}
+    for papel in PAPEIS:
+        if not quantidades.get(papel):
+            continue
+        if not candidatos[papel]:
+            raise ValueError(f'Não há dados para o papel {papel}.')
+        for i in range(quantidades[papel]):
+            # Com menos perfis que usuários, o mesmo perfil abre várias sessões simultâneas
+            perfil, contexto = candidatos[papel][i % len(candidatos[papel])]
+            if perfil.id not in sessoes:
+                cliente = Client()
+                cliente.force_login(perfil.usuario)
+                sessoes[perfil.id] = cliente.cookies[settings.SESSION_COOKIE_NAME].value
+            usuarios.append(UsuarioVirtual(
+                papel, perfil, sessoes[perfil.id], pensar, aleatorio.random(), **contexto
+            ))
+    return usuarios
+
+
+# Estatísticas ------------------------------------------------------------------------------------
+
+class Estatisticas:
+    """Latências, status e erros por passo, acumulados por todas as threads/tarefas."""
+
+    def __init__(self, servidor, usuarios):
+        self.servidor = servidor
+        self.usuarios = usuarios
+        self.trava = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.erros = Counter()
+        self.rejeitadas = Counter()
+        self.status = Counter()
+        self.excecoes = Counter()
+        self.bloqueios = 0
+        self.acoes = 0
+        self.inicio = self.fim = None
+
+    def iniciar(self):
+        self.inicio = time.perf_counter()
+        got_request_exception.connect(self._excecao_na_view, dispatch_uid='carga')
+
+    def encerrar(self):
+        self.fim = time.perf_counter()
+        got_request_exception.disconnect(dispatch_uid='carga')
+
+    def _excecao_na_view(self, sender, request=None, **kwargs):
+        # Chamado dentro do except do handler do Django: a exceção está em sys.exc_info()
+        erro = sys.exc_info()[1]
+        with self.trava:
+            self.excecoes[type(erro).__name__] += 1
+            if isinstance(erro, OperationalError) and 'locked' in str(erro):
+                self.bloqueios += 1
+
+    def registrar(self, requisicao, status, segundos):
+        with self.trava:
+            self.latencias[requisicao.passo].append(segundos * 1000)
+            self.status[status] += 1
+            if status == requisicao.esperado:
+                return
+            if requisicao.metodo == 'POST' and status == 200:
+                # Formulário devolvido com erro (ex.: estoque insuficiente): regra de negócio, não falha
+                self.rejeitadas[requisicao.passo] += 1
+            else:
+                self.erros[requisicao.passo] += 1
+
+    def acao_concluida(self):
+        with self.trava:
+            self.acoes += 1
+
+    def como_dict(self):
+        duracao = (self.fim or time.perf_counter()) - self.inicio
+        requisicoes = sum(len(tempos) for tempos in self.latencias.values())
+        todas = [tempo for tempos in self.latencias.values() for tempo in tempos]
+        erros = sum(self.erros.values())
+        return {
+            'servidor': self.servidor,
+            'usuarios': self.usuarios,
+            'duracao_s': round(duracao, 2),
+            'acoes': self.acoes,
+            'requisicoes': requisicoes,
+            'vazao_rps': round(requisicoes / duracao, 2) if duracao else 0,
+            'acoes_por_s': round(self.acoes / duracao, 2) if duracao else 0,
+            'erros': erros,
+            'taxa_erros': round(erros / requisicoes, 4) if requisicoes else 0,
+            'rejeitadas': sum(self.rejeitadas.values()),
+            'bloqueios_sqlite': self.bloqueios,
+            'excecoes': dict(self.excecoes),
+            'status': {str(status): total for status, total in sorted(self.status.items())},
+            'latencia': self._percentis(todas),
+            'passos': {
+                passo: {
+                    'requisicoes': len(tempos),
+                    'erros': self.erros[passo],
+                    'rejeitadas': self.rejeitadas[passo],
+                    **self._percentis(tempos),
+                }
+                for passo, tempos in sorted(self.latencias.items())
+            },
+        }
+
+    @staticmethod
+    def _percentis(tempos):
+        if not tempos:
+            return {}
+        return {
+            **{f'p{p}_ms': round(percentil(tempos, p), 2) for p in (50, 90, 95, 99)},
+            'max_ms': round(max(tempos), 2),
+        }
+
+
+# Drivers -----------------------------------------------------------------------------------------
+
+def _executar_wsgi(aplicacao, usuario, requisicao):
+    caminho, _, consulta = requisicao.caminho.partition('?')
+    corpo = requisicao.corpo
+    environ = {
+        'REQUEST_METHOD': requisicao.metodo,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': caminho,
+        'QUERY_STRING': consulta,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(corpo),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for nome, valor in usuario.cabecalhos(requisicao).items():
+        if nome in ('content-type', 'content-length'):
+            environ[nome.upper().replace('-', '_')] = valor
+        else:
+            environ['HTTP_' + nome.upper().replace('-', '_')] = valor
+
+    inicio = {}
+
+    def start_response(status, cabecalhos, exc_info=None):
+        inicio['status'] = int(status.split(' ', 1)[0])
+        inicio['cabecalhos'] = cabecalhos
+
+    resultado = aplicacao(environ, start_response)
+    try:
+        conteudo = b''.join(resultado)
+    finally:
+        if hasattr(resultado, 'close'):
+            resultado.close()
+    return Resposta(inicio['status'], inicio['cabecalhos'], conteudo)
+
+
+async def _executar_asgi(aplicacao, usuario, requisicao):
+    caminho, _, consulta = requisicao.caminho.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': requisicao.metodo,
+        'scheme': 'http',
+        'path': caminho,
+        'raw_path': caminho.encode(),
+        'query_string': consulta.encode(),
+        'root_path': '',
+        'headers': [(nome.encode(), valor.encode()) for nome, valor in usuario.cabecalhos(requisicao).items()],
+        'client': ('127.0.0.1', 0),
+        'server': (HOST, 80),
+    }
+    corpo_enviado = False
+
+    async def receive():
+        nonlocal corpo_enviado
+        if not corpo_enviado:
+            corpo_enviado = True
+            return {'type': 'http.request', 'body': requisicao.corpo, 'more_body': False}
+        # O Django fica escutando desconexão até a resposta terminar; o cliente nunca desconecta
+        await asyncio.Future()
+
+    inicio = {}
+    partes = []
+
+    async def send(mensagem):
+        if mensagem['type'] == 'http.response.start':
+            inicio['status'] = mensagem['status']
+            inicio['cabecalhos'] = [(nome.decode(), valor.decode()) for nome, valor in mensagem.get('headers', [])]
+        elif mensagem['type'] == 'http.response.body':
+            partes.append(mensagem.get('body', b''))
+
+    await aplicacao(scope, receive, send)
+    return Resposta(inicio['status'], inicio['cabecalhos'], b''.join(partes))
+
+
+def _usuario_wsgi(aplicacao, usuario, estatisticas, parar, acoes):
+    try:
+        while not parar.is_set() and (not acoes or usuario.acoes < acoes):
+            fluxo = FLUXOS[usuario.papel](usuario)
+            try:
+                requisicao = next(fluxo)
+                while True:
+                    inicio = time.perf_counter()
+                    resposta = _executar_wsgi(aplicacao, usuario, requisicao)
+                    estatisticas.registrar(requisicao, resposta.status, time.perf_counter() - inicio)
+                    usuario.guardar_cookies(resposta)
+                    requisicao = fluxo.send(resposta)
+            except StopIteration:
+                pass
+            usuario.acoes += 1
+            estatisticas.acao_concluida()
+            parar.wait(usuario.pensar())
+    finally:
+        # Cada thread abriu a própria conexão
+        connections.close_all()
+
+
+async def _usuario_asgi(aplicacao, usuario, estatisticas, parar, acoes):
+    while not parar.is_set() and (not acoes or usuario.acoes < acoes):
+        fluxo = FLUXOS[usuario.papel](usuario)
+        try:
+            requisicao = next(fluxo)
+            while True:
+                inicio = time.perf_counter()
+                resposta = await _executar_asgi(aplicacao, usuario, requisicao)
+                estatisticas.registrar(requisicao, resposta.status, time.perf_counter() - inicio)
+                usuario.guardar_cookies(resposta)
+                requisicao = fluxo.send(resposta)
+        except StopIteration:
+            pass
+        usuario.acoes += 1
+        estatisticas.acao_concluida()
+        try:
+            await asyncio.wait_for(parar.wait(), usuario.pensar())
+        except asyncio.TimeoutError:
+            pass
+
+
+def rodar_wsgi(usuarios, duracao=None, acoes=None):
+    """Um thread por usuário chamando a aplicação WSGI; para após `duracao` segundos ou `acoes` por usuário."""
+    from agroconnect.wsgi import application
+
+    estatisticas = Estatisticas('wsgi', len(usuarios))
+    parar = threading.Event()
+    threads = [
+        threading.Thread(target=_usuario_wsgi, args=(application, usuario, estatisticas, parar, acoes), daemon=True)
+        for usuario in usuarios
+    ]
+    estatisticas.iniciar()
+    try:
+        for thread in threads:
+            thread.start()
+        limite = time.monotonic() + duracao if duracao else None
+        for thread in threads:
+            thread.join(max(0, limite - time.monotonic()) if limite else None)
+        parar.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        estatisticas.encerrar()
+    return estatisticas
+
+
+def rodar_asgi(usuarios, duracao=None, acoes=None):
+    """Uma tarefa asyncio por usuário chamando a aplicação ASGI; views síncronas rodam no executor do Django."""
+    from agroconnect.asgi import application
+
+    estatisticas = Estatisticas('asgi', len(usuarios))
+
+    async def principal():
+        parar = asyncio.Event()
+        tarefas = [
+            asyncio.create_task(_usuario_asgi(application, usuario, estatisticas, parar, acoes))
+            for usuario in usuarios
+        ]
+        if duracao:
+            await asyncio.wait(tarefas, timeout=duracao)
+            # Como no WSGI, cada usuário termina a ação em andamento antes de parar
+            parar.set()
+        await asyncio.gather(*tarefas)
+
+    estatisticas.iniciar()
+    try:
+        asyncio.run(principal())
+    finally:
+        estatisticas.encerrar()
+    return estatisticas
+
+
+SERVIDORES = {
+    'wsgi': rodar_wsgi,
+    'asgi': rodar_asgi,
+}
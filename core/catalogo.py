@@ -0,0 +1,88 @@
+# catalogo.py
+"""
+Versões do catálogo para o cache de fragmentos dos templates ({% cache %}, alias
+'template_fragments').
+
+As listagens, a grade do dashboard do comprador e a página de cada produto são iguais para
+todos os usuários do mesmo tipo; o HTML fica em cache com o tipo do perfil e a versão do
+catálogo na chave. Os sinais de Produto e Categoria (e a baixa de estoque, que é um UPDATE
+direto) incrementam as versões, então a próxima leitura usa outra chave e renderiza de novo;
+as entradas antigas expiram sozinhas.
+
+Versões:
+- 'produtos': qualquer produto mudou (listagens e grade do dashboard);
+- 'produto:<id>': o produto mudou (página do produto);
+- 'categorias': qualquer categoria mudou (nome na listagem, menu de categorias).
+
+Os templates carregam `cache_catalogo` (core.templatetags), o mesmo {% cache %} com os
+acertos e falhas contados em core.metricas.
+
+Com mais de um processo o alias deve ser compartilhado (ex.: FileBasedCache); com o
+LocMemCache cada processo só vê as próprias invalidações e os demais esperam o timeout.
+"""
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+ALIAS = 'template_fragments'
+
+
+def _cache():
+    return caches[ALIAS]
+
+
+def _nova_versao():
+    # Baseada no relógio: se a chave da versão sair do cache, a recriada não repete um valor antigo
+    return time.time_ns() // 1000
+
+
+def _versoes(*nomes):
+    cache = _cache()
+    chaves = [f'versao:{nome}' for nome in nomes]
+    valores = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in valores:
+            cache.add(chave, _nova_versao(), None)
+            valores[chave] = cache.get(chave)
+    return {nome: valores[chave] for nome, chave in zip(nomes, chaves)}
+
+
+def _incrementar(*nomes):
+    cache = _cache()
+    for nome in nomes:
+        try:
+            cache.incr(f'versao:{nome}')
+        except ValueError:
+            cache.add(f'versao:{nome}', _nova_versao(), None)
+
+
+def _invalidar(*nomes):
+    _incrementar(*nomes)
+    # De novo após o commit: quem leu os dados antigos durante a transação pode ter guardado
+    # o HTML com a versão nova
+    transaction.on_commit(lambda: _incrementar(*nomes))
+
+
+def invalidar_produtos(ids):
+    _invalidar('produtos', *[f'produto:{produto_id}' for produto_id in ids])
+
+
+def invalidar_categorias():
+    _invalidar('categorias')
+
+
+def contexto_cache(perfil, produto_id=None):
+    """
+    Variáveis usadas pelas tags {% cache %} do catálogo: `cache_timeout`, `cache_tipo`,
+    `cache_versao` (produtos e categorias ou, com `produto_id`, o produto e as categorias) e
+    `cache_versao_categorias` (menu de categorias).
+    """
+    produto = f'produto:{produto_id}' if produto_id is not None else 'produtos'
+    versoes = _versoes(produto, 'categorias')
+    return {
+        'cache_timeout': getattr(settings, 'FRAGMENTOS_CACHE_TIMEOUT', 300),
+        'cache_tipo': perfil.tipo,
+        'cache_versao': f"{versoes[produto]}.{versoes['categorias']}",
+        'cache_versao_categorias': versoes['categorias'],
+    }
@@ -0,0 +1,152 @@
+# contadores.py
+"""
+Contadores dos badges de cada perfil, em cache (alias 'contadores'):
+
+- nao_lidas: mensagens recebidas e não lidas;
+- pendentes_comprador: pedidos pendentes feitos pelo perfil;
+- pendentes_fornecedor: pedidos pendentes dos produtos do perfil;
+- estoque_baixo: produtos do perfil abaixo do estoque mínimo.
+
+A leitura é um get_many; o contador que não está no cache é contado no banco, só nas linhas
+do perfil (pelos índices), e guardado. Os sinais (core.signals) somam as variações com
+incr/decr depois do commit. Um contador fora do cache não é recriado na escrita: a próxima
+leitura conta de novo.
+
+O estoque baixo depende do estoque e do mínimo de cada produto, que também mudam por UPDATE
+direto (core.estoque); nesses casos o contador do fornecedor é descartado e recontado.
+
+Uma leitura que conta no banco enquanto outra transação é confirmada pode guardar um valor
+defasado; CONTADORES_CACHE_TIMEOUT limita a duração e `reconciliar_contadores` corrige. A
+contagem é sempre no principal, mesmo nas views com `@leitura_na_replica`: o valor de uma
+réplica atrasada ficaria no cache e os incr/decr seguintes partiriam dele.
+
+O alias precisa ser compartilhado entre os processos (Memcached/Redis). O LocMemCache
+padrão só serve para um processo (runserver, testes): com vários workers cada um guarda e
+soma os próprios contadores, e só os sinais da escrita feita naquele worker chegam a eles.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, F
+from .metricas import contar_cache
+from .replicas import ler_do_primario
+
+ALIAS = 'contadores'
+
+NOMES = ('nao_lidas', 'pendentes_comprador', 'pendentes_fornecedor', 'estoque_baixo')
+
+# Contadores exibidos para cada tipo de perfil
+DO_TIPO = {
+    'comprador': ('nao_lidas', 'pendentes_comprador'),
+    'fornecedor': ('nao_lidas', 'pendentes_fornecedor', 'estoque_baixo'),
+    'transportador': ('nao_lidas',),
+}
+
+
+def _cache():
+    return caches[ALIAS]
+
+
+def _timeout():
+    return getattr(settings, 'CONTADORES_CACHE_TIMEOUT', 3600)
+
+
+def _chave(perfil_id, nome):
+    return f'contador:{perfil_id}:{nome}'
+
+
+def _linhas(nome):
+    # Consulta agrupada por perfil; filtrada por um perfil na leitura e completa na reconciliação
+    from .models import Mensagem, Pedido, Produto
+
+    if nome == 'nao_lidas':
+        return Mensagem.objects.filter(lida=False).values(perfil=F('destinatario_id')), 'destinatario_id'
+    if nome == 'pendentes_comprador':
+        return Pedido.objects.filter(status='pendente').values(perfil=F('comprador_id')), 'comprador_id'
+    if nome == 'pendentes_fornecedor':
+        return Pedido.objects.filter(status='pendente').values(perfil=F('produto__fornecedor_id')), 'produto__fornecedor_id'
+    if nome == 'estoque_baixo':
+        return Produto.objects.filter(quantidade__lt=F('estoque_minimo')).values(perfil=F('fornecedor_id')), 'fornecedor_id'
+    raise ValueError(f'Contador desconhecido: {nome}')
+
+
+def contar_no_banco(nome, perfis=None):
+    """{perfil_id: total} contado no banco principal, para os `perfis` informados ou para todos."""
+    linhas, campo = _linhas(nome)
+    if perfis is not None:
+        linhas = linhas.filter(**{f'{campo}__in': perfis})
+    with ler_do_primario():
+        return {linha['perfil']: linha['total'] for linha in linhas.annotate(total=Count('pk')).order_by()}
+
+
+def obter(perfil_id, nomes=NOMES):
+    """{nome: valor} dos contadores do perfil; os ausentes do cache são contados no banco."""
+    cache = _cache()
+    chaves = {nome: _chave(perfil_id, nome) for nome in nomes}
+    valores = cache.get_many(chaves.values())
+    contadores = {}
+    for nome, chave in chaves.items():
+        contar_cache(ALIAS, chave in valores)
+        if chave in valores:
+            contadores[nome] = valores[chave]
+            continue
+        total = contar_no_banco(nome, [perfil_id]).get(perfil_id, 0)
+        # add: se uma escrita recriou o contador nesse meio-tempo, vale o dela
+        if not cache.add(chave, total, _timeout()):
+            total = cache.get(chave, total)
+        contadores[nome] = total
+    return contadores
+
+
+def _somar(perfil_id, nome, delta):
+    cache = _cache()
+    try:
+        # Memcached não aceita incr negativo
+        if delta > 0:
+            cache.incr(_chave(perfil_id, nome), delta)
+        else:
+            cache.decr(_chave(perfil_id, nome), -delta)
+    except ValueError:
+        # Fora do cache: a próxima leitura conta no banco
+        pass
+
+
+def somar(perfil_id, nome, delta=1):
+    """Soma `delta` ao contador depois do commit da transação atual (na hora, fora de transação)."""
+    if perfil_id is None or not delta:
+        return
+    transaction.on_commit(lambda: _somar(perfil_id, nome, delta))
+
+
+def descartar(perfil_id, nome):
+    """Tira o contador do cache para ser recontado; de novo após o commit, como em core.catalogo."""
+    if perfil_id is None:
+        return
+    _cache().delete(_chave(perfil_id, nome))
+    transaction.on_commit(lambda: _cache().delete(_chave(perfil_id, nome)))
+
+
+def reconciliar(nomes=NOMES, perfis=None, corrigir=True):
+    """
+    Compara os contadores em cache com o banco e, com `corrigir`, grava os valores do banco.
+    Devolve [(perfil_id, nome, em_cache, no_banco)] dos que estavam diferentes; contador
+    ausente do cache não conta como diferença.
+    """
+    from .models import Perfil
+
+    cache = _cache()
+    ids = list(perfis) if perfis is not None else list(Perfil.objects.values_list('id', flat=True))
+    diferencas = []
+    for nome in nomes:
+        no_banco = contar_no_banco(nome, perfis)
+        em_cache = cache.get_many([_chave(perfil_id, nome) for perfil_id in ids])
+        corretos = {}
+        for perfil_id in ids:
+            chave = _chave(perfil_id, nome)
+            total = no_banco.get(perfil_id, 0)
+            if chave in em_cache and em_cache[chave] != total:
+                diferencas.append((perfil_id, nome, em_cache[chave], total))
+            corretos[chave] = total
+        if corrigir:
+            cache.set_many(corretos, _timeout())
+    return diferencas
@@ -0,0 +1,26 @@
+# context_processors.py
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.functional import SimpleLazyObject
+from . import contadores
+
+
+def _badges(request):
+    usuario = getattr(request, 'user', None)
+    if usuario is None or not usuario.is_authenticated:
+        return {}
+    try:
+        perfil = usuario.perfil
+    except AttributeError:
+        # Usuário sem perfil (admin)
+        return {}
+    return contadores.obter(perfil.id, contadores.DO_TIPO.get(perfil.tipo, ('nao_lidas',)))
+
+
+def badges(request):
+    """`badges`: contadores do perfil logado (core.contadores), lidos só se o template usar."""
+    return {'badges': SimpleLazyObject(lambda: _badges(request))}
+
+
+def eventos(request):
+    """`eventos_tempo_real`: só sob ASGI o /eventos/ mantém o stream aberto; sob WSGI ele vira polling."""
+    return {'eventos_tempo_real': isinstance(request, ASGIRequest)}
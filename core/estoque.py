@@ -0,0 +1,119 @@
+# estoque.py
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F
+from . import catalogo, contadores
+from .models import Pedido, Produto
+from .signals import pedido_status_alterado
+
+
+class EstoqueInsuficiente(Exception):
+    pass
+
+
+class PedidoJaProcessado(Exception):
+    pass
+
+
+def baixar_estoque(produto_id, quantidade):
+    """
+    Desconta `quantidade` do estoque em um único UPDATE condicional.
+    Retorna False (sem alterar nada) se não houver estoque suficiente.
+    """
+    if not Produto.objects.filter(
+        pk=produto_id,
+        quantidade__gte=quantidade
+    ).update(quantidade=F('quantidade') - quantidade):
+        return False
+    # UPDATE direto, sem post_save: o estoque aparece nas páginas do catálogo em cache
+    catalogo.invalidar_produtos([produto_id])
+    return True
+
+
+def aceitar_pedido(pedido_id, fornecedor):
+    """
+    Aceita um pedido pendente do fornecedor e baixa o estoque na mesma transação.
+
+    O primeiro comando é o UPDATE condicional do status: ele trava a linha do pedido
+    (ou, no SQLite, reserva o banco para escrita) antes de qualquer leitura, então dois
+    aceites simultâneos do mesmo pedido não passam e não há upgrade de leitura para escrita.
+    """
+    with transaction.atomic():
+        pedidos = Pedido.objects.filter(pk=pedido_id, produto__fornecedor=fornecedor)
+        if not pedidos.filter(status='pendente').update(status='aceito'):
+            if pedidos.exists():
+                raise PedidoJaProcessado(pedido_id)
+            raise Pedido.DoesNotExist(pedido_id)
+        pedido = Pedido.objects.select_related('produto').get(pk=pedido_id)
+        if not baixar_estoque(pedido.produto_id, pedido.quantidade):
+            raise EstoqueInsuficiente(pedido_id)
+        # A baixa pode deixar o produto abaixo do estoque mínimo
+        contadores.descartar(fornecedor.id, 'estoque_baixo')
+        pedido_status_alterado.send(sender=Pedido, alteracoes=[(pedido, 'pendente')])
+    return pedido
+
+
+class ConflitoDeEstoque(Exception):
+    """O estoque mudou durante o processamento em lote; nada foi gravado."""
+
+
+DECISOES_LOTE = ('aceito', 'recusado')
+
+
+def processar_em_lote(pedido_ids, fornecedor, decisao):
+    """
+    Aceita ou recusa vários pedidos do fornecedor em uma única transação.
+
+    Ao aceitar, os pedidos de cada produto são atendidos do mais antigo para o mais novo
+    até acabar o estoque, com uma baixa (UPDATE condicional) por produto. Os status são
+    gravados com bulk_update. Retorna {pedido_id: resultado}, onde resultado é a decisão
+    aplicada, 'estoque_insuficiente', 'ja_processado' ou 'nao_encontrado'.
+    """
+    if decisao not in DECISOES_LOTE:
+        raise ValueError(f"Decisão inválida: {decisao}")
+    resultados = {pedido_id: 'nao_encontrado' for pedido_id in pedido_ids}
+
+    with transaction.atomic():
+        pedidos = Pedido.objects.select_for_update(of=('self',)).select_related('produto').filter(
+            pk__in=pedido_ids,
+            produto__fornecedor=fornecedor
+        ).order_by('data_pedido', 'id')
+
+        pendentes = []
+        for pedido in pedidos:
+            if pedido.status == 'pendente':
+                pendentes.append(pedido)
+            else:
+                resultados[pedido.id] = 'ja_processado'
+
+        if decisao == 'aceito':
+            por_produto = defaultdict(list)
+            for pedido in pendentes:
+                por_produto[pedido.produto_id].append(pedido)
+            disponivel = dict(
+                Produto.objects.select_for_update().filter(pk__in=por_produto).values_list('id', 'quantidade')
+            )
+            aprovados = []
+            for produto_id, lista in por_produto.items():
+                baixa = 0
+                for pedido in lista:
+                    if baixa + pedido.quantidade <= disponivel[produto_id]:
+                        baixa += pedido.quantidade
+                        aprovados.append(pedido)
+                    else:
+                        resultados[pedido.id] = 'estoque_insuficiente'
+                if baixa and not baixar_estoque(produto_id, baixa):
+                    raise ConflitoDeEstoque(produto_id)
+            if aprovados:
+                contadores.descartar(fornecedor.id, 'estoque_baixo')
+        else:
+            aprovados = pendentes
+
+        for pedido in aprovados:
+            pedido.status = decisao
+            resultados[pedido.id] = decisao
+        Pedido.objects.bulk_update(aprovados, ['status'], batch_size=500)
+        if aprovados:
+            pedido_status_alterado.send(sender=Pedido, alteracoes=[(pedido, 'pendente') for pedido in aprovados])
+
+    return resultados
@@ -0,0 +1,104 @@
+# eventos.py
+import asyncio
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from . import contadores
+
+
+class Assinatura:
+    """Fila de eventos de um cliente conectado, consumida pelo loop assíncrono que a criou."""
+
+    def __init__(self, barramento, perfil_id, tamanho_maximo=100):
+        self.barramento = barramento
+        self.perfil_id = perfil_id
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(maxsize=tamanho_maximo)
+
+    def _entregar(self, evento):
+        # Cliente lento: descarta o evento mais antigo em vez de crescer sem limite
+        if self.fila.full():
+            self.fila.get_nowait()
+        self.fila.put_nowait(evento)
+
+    def entregar(self, evento):
+        self.loop.call_soon_threadsafe(self._entregar, evento)
+
+    async def proximo(self, timeout=None):
+        """Próximo evento, ou None se nada chegar em `timeout` segundos."""
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.barramento.cancelar(self)
+
+
+class BarramentoLocal:
+    """
+    Pub/sub em memória do processo. Os eventos chegam apenas aos clientes conectados
+    ao mesmo processo; para vários processos, troque EVENTOS_BACKEND por uma
+    implementação com a mesma interface (assinar/cancelar/publicar/tem_assinantes).
+    """
+
+    def __init__(self):
+        self._assinaturas = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def assinar(self, perfil_id):
+        assinatura = Assinatura(self, perfil_id)
+        with self._lock:
+            self._assinaturas[perfil_id].add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            assinaturas = self._assinaturas.get(assinatura.perfil_id)
+            if assinaturas is not None:
+                assinaturas.discard(assinatura)
+                if not assinaturas:
+                    del self._assinaturas[assinatura.perfil_id]
+
+    def tem_assinantes(self, perfil_id):
+        return perfil_id in self._assinaturas
+
+    def publicar(self, perfil_id, evento):
+        with self._lock:
+            assinaturas = list(self._assinaturas.get(perfil_id, ()))
+        for assinatura in assinaturas:
+            assinatura.entregar(evento)
+
+
+_barramento = None
+_barramento_lock = threading.Lock()
+
+
+def barramento():
+    global _barramento
+    if _barramento is None:
+        with _barramento_lock:
+            if _barramento is None:
+                _barramento = import_string(getattr(settings, 'EVENTOS_BACKEND', 'core.eventos.BarramentoLocal'))()
+    return _barramento
+
+
+def publicar(perfil_id, tipo, **dados):
+    """Publica o evento depois do commit da transação atual, se houver alguém ouvindo."""
+    if perfil_id is None or not barramento().tem_assinantes(perfil_id):
+        return
+    transaction.on_commit(lambda: barramento().publicar(perfil_id, {'tipo': tipo, **dados}))
+
+
+def publicar_nao_lidas(perfil_id):
+    if perfil_id is None or not barramento().tem_assinantes(perfil_id):
+        return
+    transaction.on_commit(lambda: barramento().publicar(perfil_id, {
+        'tipo': 'nao_lidas',
+        'total': contadores.obter(perfil_id, ('nao_lidas',))['nao_lidas']
+    }))
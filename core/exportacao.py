@@ -0,0 +1,127 @@
+# exportacao.py
+import csv
+from datetime import date, datetime, time, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from .models import Pedido, Produto, VendaMensal
+
+# Linhas lidas do banco por vez (.iterator) e linhas de CSV por pedaço enviado ao cliente
+TAMANHO_CHUNK = 2000
+LINHAS_POR_PEDACO = 200
+
+
+class Eco:
+    """Objeto "arquivo" cujo write devolve o texto, para o csv.writer gerar linha a linha."""
+
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(cabecalho, linhas):
+    escritor = csv.writer(Eco())
+    pedaco = [escritor.writerow(cabecalho)]
+    for linha in linhas:
+        pedaco.append(escritor.writerow(linha))
+        if len(pedaco) >= LINHAS_POR_PEDACO:
+            yield ''.join(pedaco)
+            pedaco = []
+    if pedaco:
+        yield ''.join(pedaco)
+
+
+def ler_filtros(parametros):
+    """Lê inicio/fim (AAAA-MM-DD) e status da querystring. Levanta ValueError se forem inválidos."""
+    inicio = date.fromisoformat(parametros['inicio']) if parametros.get('inicio') else None
+    fim = date.fromisoformat(parametros['fim']) if parametros.get('fim') else None
+    if inicio and fim and inicio > fim:
+        raise ValueError("A data inicial deve ser anterior à data final.")
+    status = parametros.get('status') or None
+    if status and status not in dict(Pedido.STATUS_CHOICES):
+        raise ValueError(f"Status inválido: {status}")
+    return {'inicio': inicio, 'fim': fim, 'status': status}
+
+
+def _filtro_datas(campo, inicio, fim):
+    # Intervalo em datetimes locais em vez de __date, para a consulta continuar usando o índice
+    tz = timezone.get_current_timezone()
+    filtro = Q()
+    if inicio:
+        filtro &= Q(**{f'{campo}__gte': timezone.make_aware(datetime.combine(inicio, time.min), tz)})
+    if fim:
+        filtro &= Q(**{f'{campo}__lt': timezone.make_aware(datetime.combine(fim + timedelta(days=1), time.min), tz)})
+    return filtro
+
+
+def exportar_pedidos(fornecedor, inicio=None, fim=None, status=None):
+    pedidos = Pedido.objects.filter(
+        _filtro_datas('data_pedido', inicio, fim),
+        produto__fornecedor=fornecedor,
+    ).select_related('comprador__usuario', 'produto').only(
+        # Só as colunas usadas no arquivo
+        'data_pedido', 'quantidade', 'valor_total', 'status', 'produto__nome', 'comprador__usuario__username'
+    ).order_by('data_pedido', 'id')
+    if status:
+        pedidos = pedidos.filter(status=status)
+
+    cabecalho = ['id', 'data_pedido', 'produto', 'comprador', 'quantidade', 'valor_total', 'status']
+    linhas = (
+        [
+            pedido.id,
+            timezone.localtime(pedido.data_pedido).isoformat(timespec='seconds'),
+            pedido.produto.nome,
+            pedido.comprador.usuario.username,
+            pedido.quantidade,
+            pedido.valor_total,
+            pedido.status,
+        ]
+        for pedido in pedidos.iterator(chunk_size=TAMANHO_CHUNK)
+    )
+    return gerar_csv(cabecalho, linhas)
+
+
+def exportar_produtos(fornecedor, inicio=None, fim=None, status=None):
+    # Mesmas colunas aceitas pela importação (core.importacao), para o arquivo poder voltar ao sistema
+    produtos = Produto.objects.filter(
+        _filtro_datas('data_criacao', inicio, fim),
+        fornecedor=fornecedor,
+    ).select_related('categoria').order_by('id')
+
+    cabecalho = ['nome', 'descricao', 'preco', 'quantidade', 'estoque_minimo', 'categoria']
+    linhas = (
+        [
+            produto.nome,
+            produto.descricao,
+            produto.preco,
+            produto.quantidade,
+            produto.estoque_minimo,
+            produto.categoria.nome if produto.categoria_id else '',
+        ]
+        for produto in produtos.iterator(chunk_size=TAMANHO_CHUNK)
+    )
+    return gerar_csv(cabecalho, linhas)
+
+
+def exportar_receita_mensal(fornecedor, inicio=None, fim=None, status=None):
+    # Lê o resumo mensal (VendaMensal) em vez de agrupar os pedidos
+    vendas = VendaMensal.objects.filter(fornecedor=fornecedor, total_pedidos__gt=0)
+    if inicio:
+        vendas = vendas.filter(Q(ano__gt=inicio.year) | Q(ano=inicio.year, mes__gte=inicio.month))
+    if fim:
+        vendas = vendas.filter(Q(ano__lt=fim.year) | Q(ano=fim.year, mes__lte=fim.month))
+    if status:
+        vendas = vendas.filter(status=status)
+    vendas = vendas.select_related('produto').order_by('ano', 'mes', 'produto_id', 'status')
+
+    cabecalho = ['ano', 'mes', 'produto', 'status', 'pedidos', 'receita']
+    linhas = (
+        [venda.ano, venda.mes, venda.produto.nome, venda.status, venda.total_pedidos, venda.receita]
+        for venda in vendas.iterator(chunk_size=TAMANHO_CHUNK)
+    )
+    return gerar_csv(cabecalho, linhas)
+
+
+EXPORTACOES = {
+    'pedidos': exportar_pedidos,
+    'produtos': exportar_produtos,
+    'receita-mensal': exportar_receita_mensal,
+}
@@ -81,4 +81,43 @@ class PedidoForm(forms.ModelForm):
             raise ValidationError(
                 f"Estoque insuficiente. Disponível: {self.produto.quantidade}"
             )
-        return quantidade
\ No newline at end of file
+        return quantidade
+
+class ImportacaoProdutoForm(ProdutoForm):
+    """
+    Valida uma linha do arquivo de importação com as mesmas regras do ProdutoForm.
+    A categoria vem pelo nome e é resolvida no dicionário `categorias` (nome em minúsculas -> Categoria).
+    """
+    estoque_minimo = forms.IntegerField(required=False, min_value=0)
+    categoria = forms.CharField(required=False)
+
+    class Meta(ProdutoForm.Meta):
+        fields = ProdutoForm.Meta.fields + ['estoque_minimo']
+
+    def __init__(self, *args, categorias=None, **kwargs):
+        self.categorias = categorias or {}
+        super().__init__(*args, **kwargs)
+
+    def clean_estoque_minimo(self):
+        estoque_minimo = self.cleaned_data['estoque_minimo']
+        # Célula vazia mantém o valor atual (ou o padrão do modelo, em produtos novos)
+        return self.instance.estoque_minimo if estoque_minimo is None else estoque_minimo
+
+    def clean_categoria(self):
+        nome = self.cleaned_data['categoria']
+        if not nome:
+            return None
+        try:
+            return self.categorias[nome.lower()]
+        except KeyError:
+            raise ValidationError(f"Categoria não encontrada: {nome}")
+
+
+class ImportarProdutosForm(forms.Form):
+    FORMATOS = (
+        ('', 'Detectar pela extensão'),
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    )
+    arquivo = forms.FileField()
+    formato = forms.ChoiceField(choices=FORMATOS, required=False)
@@ -0,0 +1,172 @@
+# importacao.py
+import copy
+import csv
+import io
+import json
+from itertools import islice
+from django.db import transaction
+from .forms import ImportacaoProdutoForm
+from .models import Categoria, Produto
+from .signals import produtos_importados
+
+FORMATOS = ('csv', 'jsonl')
+TAMANHO_LOTE = 500
+# Quantos erros ficam guardados no resultado; os demais só são contados (e passados a `ao_errar`)
+MAX_ERROS_RELATORIO = 1000
+CAMPOS_ATUALIZADOS = ['descricao', 'preco', 'quantidade', 'estoque_minimo', 'categoria']
+
+
+class ArquivoInvalido(Exception):
+    pass
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.linhas = 0
+        self.criados = 0
+        self.atualizados = 0
+        self.inalterados = 0
+        self.total_erros = 0
+        self.erros = []
+        # Motivo de a leitura ter parado no meio do arquivo; os lotes anteriores já foram gravados
+        self.interrupcao = None
+
+    def registrar_erro(self, linha, erros):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS_RELATORIO:
+            self.erros.append({'linha': linha, 'erros': erros})
+
+    def como_dict(self):
+        return {
+            'linhas': self.linhas,
+            'criados': self.criados,
+            'atualizados': self.atualizados,
+            'inalterados': self.inalterados,
+            'total_erros': self.total_erros,
+            'erros': self.erros,
+            'interrupcao': self.interrupcao,
+        }
+
+
+def formato_do_arquivo(nome):
+    return 'jsonl' if nome.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def ler_linhas(arquivo, formato):
+    """
+    Lê o arquivo (binário) linha a linha e gera (número da linha, dados).
+    Linhas que não puderam ser lidas geram (número, None).
+    """
+    if formato not in FORMATOS:
+        raise ArquivoInvalido(f"Formato desconhecido: {formato}")
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    try:
+        if formato == 'csv':
+            yield from _ler_csv(texto)
+        else:
+            yield from _ler_jsonl(texto)
+    finally:
+        # Não fecha o arquivo original (ele pertence a quem chamou)
+        texto.detach()
+
+
+def _ler_csv(texto):
+    leitor = csv.DictReader(texto)
+    if not leitor.fieldnames or 'nome' not in [c.strip().lower() for c in leitor.fieldnames]:
+        raise ArquivoInvalido('O cabeçalho do CSV precisa ter ao menos a coluna "nome".')
+    leitor.fieldnames = [c.strip().lower() for c in leitor.fieldnames]
+    for dados in leitor:
+        # Colunas sobrando ficam em None; não fazem parte do produto
+        dados.pop(None, None)
+        yield leitor.line_num, dados
+
+
+def _ler_jsonl(texto):
+    for numero, linha in enumerate(texto, start=1):
+        if not linha.strip():
+            continue
+        try:
+            dados = json.loads(linha)
+        except ValueError:
+            yield numero, None
+            continue
+        yield numero, dados if isinstance(dados, dict) else None
+
+
+def importar_produtos(linhas, fornecedor, tamanho_lote=TAMANHO_LOTE, ao_errar=None):
+    """
+    Cria ou atualiza produtos do fornecedor a partir de `linhas` ((número, dados), ver ler_linhas).
+
+    Produtos são identificados pelo nome dentro do fornecedor. As linhas são processadas em lotes
+    de `tamanho_lote`: uma consulta para achar os existentes, um bulk_create, um bulk_update e a
+    atualização do índice de busca por lote, cada lote na sua transação; nenhuma consulta por
+    linha. A memória usada não cresce com o tamanho do arquivo.
+
+    Se o arquivo deixa de ser UTF-8 no meio, as linhas lidas até ali são importadas e a leitura
+    para: o resultado parcial volta com `interrupcao` preenchido.
+    """
+    resultado = ResultadoImportacao()
+    categorias = {c.nome.lower(): c for c in Categoria.objects.all()}
+    linhas = iter(linhas)
+    ultima_linha = 0
+    while True:
+        lote = []
+        try:
+            lote.extend(islice(linhas, tamanho_lote))
+        except UnicodeDecodeError as erro:
+            resultado.interrupcao = (
+                f'Trecho do arquivo que não está em UTF-8 ({erro.reason}); a importação parou '
+                f'depois da linha {lote[-1][0] if lote else ultima_linha}.'
+            )
+        if lote:
+            ultima_linha = lote[-1][0]
+            resultado.linhas += len(lote)
+            _importar_lote(lote, fornecedor, categorias, resultado, ao_errar)
+        if not lote or resultado.interrupcao:
+            return resultado
+
+
+def _valores(produto):
+    return [getattr(produto, produto._meta.get_field(campo).attname) for campo in CAMPOS_ATUALIZADOS]
+
+
+def _importar_lote(lote, fornecedor, categorias, resultado, ao_errar):
+    nomes = {str(dados.get('nome') or '').strip() for _, dados in lote if dados}
+    existentes = {}
+    for produto in Produto.objects.filter(fornecedor=fornecedor, nome__in=nomes).select_related('categoria').order_by('id'):
+        existentes.setdefault(produto.nome, produto)
+
+    # Nome -> produto do lote; repetições do mesmo nome atualizam o mesmo objeto
+    produtos = {}
+    for numero, dados in lote:
+        if dados is None:
+            erros = {'__all__': ['Linha inválida.']}
+        else:
+            nome = str(dados.get('nome') or '').strip()
+            instancia = produtos.get(nome) or existentes.get(nome)
+            # O form altera a instância mesmo quando a linha é inválida, então valida sobre uma cópia
+            instancia = copy.copy(instancia) if instancia else Produto(fornecedor=fornecedor)
+            form = ImportacaoProdutoForm(dados, instance=instancia, categorias=categorias)
+            if form.is_valid():
+                if 'categoria' in dados:
+                    form.instance.categoria = form.cleaned_data['categoria']
+                produtos[form.instance.nome] = form.instance
+                continue
+            erros = {campo: list(mensagens) for campo, mensagens in form.errors.items()}
+        resultado.registrar_erro(numero, erros)
+        if ao_errar:
+            ao_errar(numero, erros)
+
+    novos = [p for p in produtos.values() if p.pk is None]
+    # Sincronizações de catálogo costumam reenviar tudo; linhas iguais ao banco não geram UPDATE
+    alterados = [p for p in produtos.values() if p.pk is not None and _valores(p) != _valores(existentes[p.nome])]
+    if novos or alterados:
+        with transaction.atomic():
+            Produto.objects.bulk_create(novos)
+            Produto.objects.bulk_update(alterados, CAMPOS_ATUALIZADOS)
+            # bulk_create/bulk_update não disparam post_save; índice de busca e caches vêm por este sinal
+            produtos_importados.send(sender=Produto, fornecedor=fornecedor, produtos=novos + alterados)
+    resultado.criados += len(novos)
+    resultado.atualizados += len(alterados)
+    resultado.inalterados += len(produtos) - len(novos) - len(alterados)
+
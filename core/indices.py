@@ -0,0 +1,38 @@
+# indices.py
+"""
+Criação dos índices declarados em Meta.indexes nas tabelas que já existem.
+
+O projeto não tem migrações: o esquema vem de `migrate --run-syncdb`, que cria os índices
+junto com uma tabela nova mas não altera tabela existente. Um banco criado antes de um
+índice entrar em Meta.indexes ficaria sem ele; `criar_ausentes` compara os nomes
+declarados com os do banco e cria só os que faltam, então pode rodar a cada migrate
+(ver core.signals) e pelo comando `criar_indices`.
+"""
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections, router
+
+
+def ausentes(using=DEFAULT_DB_ALIAS, app_label='core'):
+    """[(modelo, índice)] declarados em Meta.indexes que não existem nas tabelas do banco."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        tabelas = set(connection.introspection.table_names(cursor))
+        faltando = []
+        for modelo in apps.get_app_config(app_label).get_models():
+            tabela = modelo._meta.db_table
+            # Tabela ainda não criada: o syncdb cria os índices com ela
+            if tabela not in tabelas or not router.allow_migrate_model(using, modelo):
+                continue
+            existentes = connection.introspection.get_constraints(cursor, tabela)
+            faltando.extend((modelo, indice) for indice in modelo._meta.indexes if indice.name not in existentes)
+    return faltando
+
+
+def criar_ausentes(using=DEFAULT_DB_ALIAS, app_label='core'):
+    """Cria os índices ausentes (ver `ausentes`) e devolve a lista dos criados."""
+    faltando = ausentes(using, app_label)
+    if faltando:
+        with connections[using].schema_editor() as editor:
+            for modelo, indice in faltando:
+                editor.add_index(modelo, indice)
+    return faltando
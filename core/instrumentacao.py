@@ -0,0 +1,92 @@
+# instrumentacao.py
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+
+# Listas de IN com tamanhos diferentes são a mesma consulta
+_LISTA_IN = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMEROS = re.compile(r'\b\d+\b')
+
+
+def forma_sql(sql):
+    """Forma da consulta: o SQL sem os valores (placeholders, listas de IN e números literais)."""
+    return _NUMEROS.sub('?', _LISTA_IN.sub('IN (...)', sql))
+
+
+class RegistroConsultas:
+    """
+    Wrapper de execução (connection.execute_wrapper) que conta consultas, soma o tempo
+    gasto no banco e agrupa as consultas pela forma, para achar padrões N+1. Pode ser usado
+    por conexões de várias threads ao mesmo tempo (ver core.paralelo).
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.segundos = 0.0
+        self.formas = Counter()
+        self._trava = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            forma = forma_sql(sql)
+            with self._trava:
+                self.segundos += duracao
+                self.total += 1
+                self.formas[forma] += 1
+
+    @property
+    def milissegundos(self):
+        return self.segundos * 1000
+
+    def repetidas(self, minimo=2):
+        """Formas executadas `minimo` vezes ou mais, da mais repetida para a menos."""
+        return [(forma, vezes) for forma, vezes in self.formas.most_common() if vezes >= minimo]
+
+    def como_dict(self, minimo_repeticoes=2):
+        return {
+            'consultas': self.total,
+            'db_ms': round(self.milissegundos, 2),
+            'repetidas': [{'sql': forma, 'vezes': vezes} for forma, vezes in self.repetidas(minimo_repeticoes)],
+        }
+
+
+@contextmanager
+def registrar_consultas():
+    """Registra as consultas de todos os bancos configurados feitas dentro do bloco (nesta thread)."""
+    registro = RegistroConsultas()
+    with ExitStack() as pilha:
+        for conexao in connections.all():
+            pilha.enter_context(conexao.execute_wrapper(registro))
+        yield registro
+
+
+class OrcamentoExcedido(AssertionError):
+    pass
+
+
+@contextmanager
+def orcamento_de_consultas(maximo=None, repeticoes=None):
+    """
+    Falha (OrcamentoExcedido) se o bloco fizer mais de `maximo` consultas ou repetir
+    a mesma forma de consulta mais de `repeticoes` vezes. Para testes:
+
+        with orcamento_de_consultas(maximo=8, repeticoes=1):
+            self.client.get(url)
+    """
+    with registrar_consultas() as registro:
+        yield registro
+    problemas = []
+    if maximo is not None and registro.total > maximo:
+        problemas.append(f'{registro.total} consultas (orçamento: {maximo})')
+    if repeticoes is not None:
+        for forma, vezes in registro.repetidas(repeticoes + 1):
+            problemas.append(f'{vezes}x (limite: {repeticoes}): {forma}')
+    if problemas:
+        raise OrcamentoExcedido('Orçamento de consultas excedido:\n' + '\n'.join(problemas))
@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from agroconnect.banco import PERFIS
+from core import carga
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a vazão de escrita dos perfis de banco (DB_PERFIL): para cada perfil, um processo '
+        'cria um banco de teste, gera dados de exemplo e roda o teste de carga com usuários que só '
+        'escrevem (fazer_pedido, aceitar_pedido, nova_mensagem), sem tempo de pensar. Os perfis '
+        'Postgres usam as variáveis DB_* e criam o banco de teste test_<DB_NAME>.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--perfil', action='append', choices=PERFIS,
+                            help='Perfil comparado; pode repetir (padrão: sqlite-padrao e sqlite).')
+        parser.add_argument('--usuarios', type=int, default=16, help='Usuários simultâneos.')
+        parser.add_argument('--mix', default='comprador=4,fornecedor=2,mensagens=4')
+        parser.add_argument('--duracao', type=float, default=10, help='Duração da carga em segundos.')
+        parser.add_argument('--escala', type=float, default=0.05, help='Escala do gerar_dados_exemplo.')
+        parser.add_argument('--json', action='store_true', help='Saída em JSON.')
+        parser.add_argument('--filho', action='store_true', help='Uso interno: roda um perfil neste processo.')
+
+    def handle(self, *args, **options):
+        if options['filho']:
+            self.stdout.write(json.dumps(self._rodar_perfil(options)))
+            return
+
+        resultados = {}
+        for perfil in options['perfil'] or ['sqlite-padrao', 'sqlite']:
+            resultados[perfil] = self._em_subprocesso(perfil, options)
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+        else:
+            self._imprimir(resultados)
+
+    def _em_subprocesso(self, perfil, options):
+        # As settings do banco são lidas na inicialização: cada perfil roda em um processo próprio
+        with tempfile.TemporaryDirectory() as diretorio:
+            ambiente = {**os.environ, 'DB_PERFIL': perfil}
+            if perfil.startswith('sqlite'):
+                ambiente['DB_TEST_NAME'] = os.path.join(diretorio, 'benchmark.sqlite3')
+            comando = [
+                sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_escrita', '--filho',
+                '--usuarios', str(options['usuarios']), '--mix', options['mix'],
+                '--duracao', str(options['duracao']), '--escala', str(options['escala']),
+            ]
+            processo = subprocess.run(comando, env=ambiente, capture_output=True, text=True)
+        if processo.returncode:
+            return {'falha': processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else 'erro'}
+        return json.loads(processo.stdout.strip().splitlines()[-1])
+
+    def _rodar_perfil(self, options):
+        try:
+            quantidades = carga.distribuir(options['usuarios'], carga.ler_mix(options['mix']))
+        except ValueError as erro:
+            raise CommandError(erro)
+
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with open(os.devnull, 'w') as nulo:
+                call_command('gerar_dados_exemplo', escala=options['escala'], stdout=nulo)
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=[carga.HOST]):
+                usuarios = carga.preparar_usuarios(quantidades, produtos_quentes=3, pensar=0)
+                resultado = carga.rodar_wsgi(usuarios, duracao=options['duracao']).como_dict()
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+        escritas = sum(
+            passo['requisicoes'] for nome, passo in resultado['passos'].items() if nome.startswith('POST')
+        )
+        return {
+            'escritas': escritas,
+            'escritas_por_s': round(escritas / resultado['duracao_s'], 2),
+            **{chave: resultado[chave] for chave in (
+                'vazao_rps', 'acoes_por_s', 'latencia', 'erros', 'taxa_erros', 'bloqueios_sqlite', 'passos'
+            )},
+        }
+
+    def _imprimir(self, resultados):
+        self.stdout.write(
+            f"{'perfil':<15} {'escritas/s':>10} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'erros':>7} {'travado':>8}"
+        )
+        for perfil, r in resultados.items():
+            if 'falha' in r:
+                self.stdout.write(self.style.ERROR(f"{perfil:<15} falhou: {r['falha']}"))
+                continue
+            self.stdout.write(
+                f"{perfil:<15} {r['escritas_por_s']:>10} {r['vazao_rps']:>8} {r['latencia']['p50_ms']:>7.1f}ms "
+                f"{r['latencia']['p95_ms']:>7.1f}ms {r['latencia']['p99_ms']:>7.1f}ms {r['erros']:>7} "
+                f"{r['bloqueios_sqlite']:>8}"
+            )
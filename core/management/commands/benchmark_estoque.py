@@ -0,0 +1,163 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError, connections
+from core import estoque
+from core.banco_de_teste import banco_de_teste
+from core.models import Pedido, Perfil, Produto
+
+
+def aceitar_ingenuo(pedido_id, fornecedor):
+    # Algoritmo anterior da view aceitar_pedido: lê, subtrai em Python e salva a linha inteira
+    pedido = Pedido.objects.select_related('produto').get(pk=pedido_id, produto__fornecedor=fornecedor)
+    if pedido.status != 'pendente':
+        raise estoque.PedidoJaProcessado(pedido_id)
+    if pedido.produto.quantidade < pedido.quantidade:
+        raise estoque.EstoqueInsuficiente(pedido_id)
+    pedido.produto.quantidade -= pedido.quantidade
+    pedido.produto.save()
+    pedido.status = 'aceito'
+    pedido.save()
+
+
+MODOS = {
+    'atomico': estoque.aceitar_pedido,
+    'ingenuo': aceitar_ingenuo,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Aceita muitos pedidos de um único produto em várias threads e mede vazão, sobrevenda e '
+        'unidades aceitas sem baixa no estoque (atualizações perdidas). '
+        'Roda num banco de teste criado e destruído pelo próprio comando (no SQLite, um arquivo '
+        'temporário); o banco configurado não é alterado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pedidos', type=int, default=500)
+        parser.add_argument('--estoque', type=int, default=250)
+        parser.add_argument('--quantidade', type=int, default=1, help='Quantidade de cada pedido.')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--modo', choices=sorted(MODOS), action='append',
+                            help='Algoritmo a medir (pode repetir). Padrão: atomico e ingenuo.')
+        parser.add_argument('--json', action='store_true', help='Saída em JSON.')
+
+    def handle(self, *args, **options):
+        with banco_de_teste('benchmark_estoque'):
+            resultados = [self._executar(modo, options) for modo in options['modo'] or ['atomico', 'ingenuo']]
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+        for r in resultados:
+            self.stdout.write(
+                f"{r['modo']:>8}: {r['aceitos']} aceitos, {r['estoque_insuficiente']} sem estoque, "
+                f"{r['erros_bloqueio']} bloqueios, {r['erros_integridade']} violações de integridade, "
+                f"{r['outros_erros']} outros erros | "
+                f"{r['pedidos_por_segundo']:.1f} pedidos/s em {r['segundos']:.2f}s | "
+                f"estoque final {r['estoque_final']}, sobrevenda {r['sobrevenda']}, "
+                f"sem baixa no estoque {r['sem_baixa']}"
+            )
+            for classe, (total, mensagem) in r['erros_por_tipo'].items():
+                self.stderr.write(f'          {classe}: {total}x, ex.: {mensagem}')
+
+    def _executar(self, modo, options):
+        fornecedor, produto, ids = self._preparar(options)
+        fila = queue.Queue()
+        for pedido_id in ids:
+            fila.put(pedido_id)
+        contagem = Counter()
+        # Classe da exceção -> [ocorrências, primeira mensagem], para os erros que não são de bloqueio
+        erros = {}
+        lock = threading.Lock()
+        aceitar = MODOS[modo]
+
+        def trabalhador():
+            try:
+                while True:
+                    try:
+                        pedido_id = fila.get_nowait()
+                    except queue.Empty:
+                        return
+                    erro = None
+                    try:
+                        aceitar(pedido_id, fornecedor)
+                        resultado = 'aceitos'
+                    except estoque.EstoqueInsuficiente:
+                        resultado = 'estoque_insuficiente'
+                    except estoque.PedidoJaProcessado:
+                        resultado = 'ja_processado'
+                    except IntegrityError as e:
+                        # Restrição do banco violada por escritas concorrentes; listada por classe abaixo
+                        erro = e
+                        resultado = 'erros_integridade'
+                    except OperationalError as e:
+                        erro = None if 'locked' in str(e) else e
+                        resultado = 'erros_bloqueio' if erro is None else 'outros_erros'
+                    except Exception as e:
+                        erro = e
+                        resultado = 'outros_erros'
+                    with lock:
+                        contagem[resultado] += 1
+                        if erro is not None:
+                            classe = f'{type(erro).__module__}.{type(erro).__qualname__}'
+                            erros.setdefault(classe, [0, str(erro)])[0] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=trabalhador) for _ in range(options['threads'])]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        segundos = time.perf_counter() - inicio
+
+        produto.refresh_from_db()
+        vendidos = sum(Pedido.objects.filter(produto=produto, status='aceito').values_list('quantidade', flat=True))
+        resultado = {
+            'modo': modo,
+            'threads': options['threads'],
+            'pedidos': len(ids),
+            'estoque_inicial': options['estoque'],
+            'aceitos': contagem['aceitos'],
+            'estoque_insuficiente': contagem['estoque_insuficiente'],
+            'ja_processado': contagem['ja_processado'],
+            'erros_bloqueio': contagem['erros_bloqueio'],
+            'erros_integridade': contagem['erros_integridade'],
+            'outros_erros': contagem['outros_erros'],
+            'erros_por_tipo': erros,
+            'segundos': segundos,
+            'pedidos_por_segundo': len(ids) / segundos if segundos else 0,
+            'estoque_final': produto.quantidade,
+            # Unidades aceitas além do estoque inicial (ou estoque que ficou negativo)
+            'sobrevenda': max(0, vendidos - options['estoque'], -produto.quantidade),
+            # Unidades aceitas que não saíram do estoque: saves que sobrescreveram a baixa de outro
+            'sem_baixa': vendidos - (options['estoque'] - produto.quantidade),
+        }
+        return resultado
+
+    def _preparar(self, options):
+        sufixo = uuid.uuid4().hex[:8]
+        fornecedor = Perfil.objects.create(
+            usuario=User.objects.create(username=f'bench_fornecedor_{sufixo}'),
+            tipo='fornecedor', telefone='0', endereco='benchmark'
+        )
+        comprador = Perfil.objects.create(
+            usuario=User.objects.create(username=f'bench_comprador_{sufixo}'),
+            tipo='comprador', telefone='0', endereco='benchmark'
+        )
+        produto = Produto.objects.create(
+            fornecedor=fornecedor, nome=f'Produto benchmark {sufixo}', descricao='benchmark',
+            preco=1, quantidade=options['estoque']
+        )
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(produto=produto, comprador=comprador, quantidade=options['quantidade'], valor_total=options['quantidade'])
+            for _ in range(options['pedidos'])
+        ])
+        return fornecedor, produto, [pedido.id for pedido in pedidos]
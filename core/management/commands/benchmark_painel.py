@@ -0,0 +1,157 @@
+import asyncio
+import json
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from core import views
+from core.models import Perfil
+
+# (tipo de usuário, view síncrona, view assíncrona, caminho)
+CASOS = [
+    ('fornecedor', views.dashboard, views.dashboard_assincrono, '/dashboard/'),
+    ('comprador', views.dashboard, views.dashboard_assincrono, '/dashboard/'),
+    ('fornecedor', views.relatorios, views.relatorios_assincrono, '/relatorios/'),
+]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def _resumo(tempos):
+    return {
+        'mediana_ms': round(statistics.median(tempos), 3),
+        'p95_ms': round(percentil(tempos, 95), 3),
+        'min_ms': round(min(tempos), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o tempo até a resposta do dashboard e dos relatórios nas versões síncrona (consultas '
+        'em sequência) e assíncrona (consultas em paralelo, core.paralelo). As views são chamadas '
+        'direto, sem middlewares; a assíncrona roda num event loop, como sob ASGI. Os relatórios são '
+        'medidos sem cache. Rode sobre dados gerados por gerar_dados_exemplo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=20, help='Medições por caso (após 1 aquecimento).')
+        parser.add_argument('--latencia-banco', type=float, default=0, metavar='MS',
+                            help='Atraso somado a cada consulta, simulando um banco na rede (padrão: 0).')
+        parser.add_argument('--json', action='store_true', help='Saída em JSON.')
+
+    def handle(self, *args, **options):
+        usuarios = self._usuarios()
+        atraso = options['latencia_banco'] / 1000
+
+        def atrasar(execute, sql, params, many, context):
+            time.sleep(atraso)
+            return execute(sql, params, many, context)
+
+        def instalar(sender, connection, **kwargs):
+            connection.execute_wrappers.append(atrasar)
+
+        if atraso:
+            # Conexões já abertas nesta thread e as que as threads das views ainda vão abrir
+            for conexao in connections.all(initialized_only=True):
+                conexao.execute_wrappers.append(atrasar)
+            connection_created.connect(instalar, dispatch_uid='benchmark_painel')
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                resultados = {}
+                for tipo, sincrona, assincrona, caminho in CASOS:
+                    usuario = usuarios[tipo]
+                    nome = f'{tipo}:{caminho.strip("/")}'
+                    sinc = self._medir_sincrona(sincrona, caminho, usuario, options['repeticoes'])
+                    assinc = asyncio.run(self._medir_assincrona(assincrona, caminho, usuario, options['repeticoes']))
+                    resultados[nome] = {
+                        'sincrona': _resumo(sinc),
+                        'assincrona': _resumo(assinc),
+                        'ganho': round(1 - statistics.median(assinc) / statistics.median(sinc), 3),
+                    }
+        finally:
+            if atraso:
+                connection_created.disconnect(dispatch_uid='benchmark_painel')
+                for conexao in connections.all(initialized_only=True):
+                    if atrasar in conexao.execute_wrappers:
+                        conexao.execute_wrappers.remove(atrasar)
+
+        relatorio = {
+            'repeticoes': options['repeticoes'],
+            'latencia_banco_ms': options['latencia_banco'],
+            'usuarios': {tipo: usuario.username for tipo, usuario in usuarios.items()},
+            'resultados': resultados,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(relatorio, indent=2))
+        else:
+            self._imprimir(relatorio)
+
+    def _usuarios(self):
+        usuarios = {}
+        for tipo, campo in (('fornecedor', 'produto__pedidos'), ('comprador', 'pedidos_feitos')):
+            perfil = Perfil.objects.filter(tipo=tipo).annotate(total=Count(campo)).order_by('-total', 'id').first()
+            if perfil is None:
+                raise CommandError(f'Nenhum perfil do tipo {tipo}; rode gerar_dados_exemplo antes.')
+            # Como o PerfilBackend: o perfil vem junto com o usuário
+            usuarios[tipo] = User.objects.select_related('perfil').get(pk=perfil.usuario_id)
+        return usuarios
+
+    def _requisicao(self, caminho, usuario):
+        request = RequestFactory().get(caminho)
+        request.user = usuario
+
+        async def auser():
+            return usuario
+
+        request.auser = auser
+        return request
+
+    def _limpar_relatorios(self, caminho):
+        if caminho == '/relatorios/':
+            caches['relatorios'].clear()
+
+    def _medir_sincrona(self, view, caminho, usuario, repeticoes):
+        tempos = []
+        for i in range(repeticoes + 1):
+            self._limpar_relatorios(caminho)
+            request = self._requisicao(caminho, usuario)
+            inicio = time.perf_counter()
+            view(request)
+            if i:
+                tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos
+
+    async def _medir_assincrona(self, view, caminho, usuario, repeticoes):
+        tempos = []
+        for i in range(repeticoes + 1):
+            self._limpar_relatorios(caminho)
+            request = self._requisicao(caminho, usuario)
+            inicio = time.perf_counter()
+            await view(request)
+            if i:
+                tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos
+
+    def _imprimir(self, relatorio):
+        self.stdout.write(
+            f"Latência simulada por consulta: {relatorio['latencia_banco_ms']}ms, "
+            f"{relatorio['repeticoes']} repetições"
+        )
+        self.stdout.write(
+            f"{'caso':<24} {'síncrona':>10} {'p95':>9} {'assíncrona':>11} {'p95':>9} {'ganho':>7}"
+        )
+        for nome, r in relatorio['resultados'].items():
+            sinc, assinc = r['sincrona'], r['assincrona']
+            self.stdout.write(
+                f"{nome:<24} {sinc['mediana_ms']:>8.1f}ms {sinc['p95_ms']:>7.1f}ms "
+                f"{assinc['mediana_ms']:>9.1f}ms {assinc['p95_ms']:>7.1f}ms {r['ganho']:>+7.0%}"
+            )
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import statistics
+import time
+import django
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from core import urls as core_urls
+from core.banco_de_teste import banco_de_teste
+from core.instrumentacao import registrar_consultas
+from core.models import Conversa, Pedido, Perfil, Produto
+
+# Rotas que alteram dados em GET ou só aceitam POST
+ROTAS_IGNORADAS = {'aceitar_pedido', 'recusar_pedido', 'remover_produto', 'processar_pedidos_lote'}
+
+# Querystring de rotas que precisam de parâmetros (preenchida com os mesmos argumentos das rotas)
+QUERYSTRINGS = {
+    'mensagens_anteriores': 'antes={mensagem_id}',
+    'mensagens_novas': 'depois={mensagem_id}',
+    'exportar': 'status=entregue',
+}
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência (mediana/p95) e número de consultas de cada rota de core/urls.py pelo test client, '
+        'logado como cada tipo de usuário, e compara com um baseline salvo. Roda num banco de teste criado '
+        'e destruído pelo próprio comando, com dados de gerar_dados_exemplo (--escala, mesma semente a cada '
+        'execução); algumas rotas alteram dados em GET (abrir uma conversa marca as mensagens como lidas).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=20, help='Medições por rota (após 1 aquecimento).')
+        parser.add_argument('--rota', action='append', help='Mede só esta rota (nome); pode repetir.')
+        parser.add_argument('--tipo', action='append', choices=[tipo for tipo, _ in Perfil.TIPO_USUARIO],
+                            help='Mede só este tipo de usuário; pode repetir.')
+        parser.add_argument('--usuario', action='append', default=[], metavar='TIPO=USERNAME',
+                            help='Usuário usado para o tipo (padrão: o perfil com mais pedidos).')
+        parser.add_argument('--sem-cache', action='store_true', help='Limpa os caches antes de cada requisição.')
+        parser.add_argument('--saida', help='Grava o resultado em JSON neste arquivo (pode servir de baseline).')
+        parser.add_argument('--baseline', help='Arquivo JSON de uma execução anterior para comparar.')
+        parser.add_argument('--tolerancia', type=float, default=0.2,
+                            help='Aumento relativo da mediana considerado regressão (padrão: 0.2 = 20%%).')
+        parser.add_argument('--minimo-ms', type=float, default=2.0,
+                            help='Diferença absoluta mínima da mediana (ms) para contar como regressão.')
+        parser.add_argument('--falhar', action='store_true', help='Termina com erro se houver regressões.')
+        parser.add_argument('--json', action='store_true', help='Saída em JSON.')
+        parser.add_argument('--escala', type=float, default=0.2, help='Escala do gerar_dados_exemplo no banco de teste.')
+        parser.add_argument('--banco-configurado', action='store_true',
+                            help='Mede sobre o banco configurado e os dados que ele já tem. ATENÇÃO: as rotas '
+                                 'medidas alteram dados; use só com uma cópia.')
+
+    def handle(self, *args, **options):
+        if options['banco_configurado']:
+            relatorio = self._executar(options)
+        else:
+            with banco_de_teste('benchmark_views'):
+                with open(os.devnull, 'w') as nulo:
+                    call_command('gerar_dados_exemplo', escala=options['escala'], stdout=nulo)
+                relatorio = self._executar(options)
+
+        if options['saida']:
+            with open(options['saida'], 'w') as arquivo:
+                json.dump(relatorio, arquivo, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(relatorio, indent=2))
+        else:
+            self._imprimir(relatorio)
+
+        regressoes = [item for item in relatorio.get('comparacao', []) if item['regressao']]
+        if regressoes and options['falhar']:
+            raise CommandError(f'{len(regressoes)} rota(s) mais lenta(s) ou com mais consultas que o baseline.')
+
+    def _executar(self, options):
+        usuarios = self._usuarios(options)
+        rotas = [
+            padrao for padrao in core_urls.urlpatterns
+            if padrao.name and padrao.name not in ROTAS_IGNORADAS and (not options['rota'] or padrao.name in options['rota'])
+        ]
+
+        resultados = {}
+        # Os erros aparecem no status de cada rota; o log de cada requisição só atrapalharia a saída
+        loggers = [logging.getLogger(nome) for nome in ('core.sql', 'django.request')]
+        niveis = [logger.level for logger in loggers]
+        for logger in loggers:
+            logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                for tipo, perfil in usuarios.items():
+                    cliente = Client(raise_request_exception=False)
+                    cliente.force_login(perfil.usuario)
+                    argumentos = self._argumentos(perfil)
+                    vistas = set()
+                    for padrao in rotas:
+                        url = reverse(padrao.name, kwargs={nome: argumentos[nome] for nome in padrao.pattern.converters})
+                        if padrao.name in QUERYSTRINGS:
+                            url += '?' + QUERYSTRINGS[padrao.name].format(**argumentos)
+                        if url in vistas:
+                            continue
+                        vistas.add(url)
+                        resultados[f'{tipo}:{padrao.name}'] = self._medir(cliente, url, options)
+        finally:
+            for logger, nivel in zip(loggers, niveis):
+                logger.setLevel(nivel)
+
+        relatorio = {
+            'data': timezone.now().isoformat(timespec='seconds'),
+            'django': django.get_version(),
+            'banco': connection.vendor,
+            'repeticoes': options['repeticoes'],
+            'usuarios': {tipo: perfil.usuario.username for tipo, perfil in usuarios.items()},
+            'resultados': resultados,
+        }
+        if options['baseline']:
+            with open(options['baseline']) as arquivo:
+                base = json.load(arquivo)['resultados']
+            relatorio['comparacao'] = self._comparar(base, resultados, options)
+        return relatorio
+
+    def _usuarios(self, options):
+        escolhidos = dict(item.split('=', 1) for item in options['usuario'])
+        usuarios = {}
+        for tipo in options['tipo'] or [tipo for tipo, _ in Perfil.TIPO_USUARIO]:
+            perfis = Perfil.objects.filter(tipo=tipo).select_related('usuario')
+            if tipo in escolhidos:
+                perfil = perfis.filter(usuario__username=escolhidos[tipo]).first()
+            else:
+                campo = {'fornecedor': 'produto__pedidos', 'comprador': 'pedidos_feitos', 'transportador': 'transporte'}[tipo]
+                perfil = perfis.annotate(total=Count(campo)).order_by('-total', 'id').first()
+            if perfil is None:
+                raise CommandError(f'Nenhum perfil do tipo {tipo}; rode gerar_dados_exemplo antes.')
+            usuarios[tipo] = perfil
+        return usuarios
+
+    def _argumentos(self, perfil):
+        # Valores para os parâmetros das rotas, escolhidos entre os dados do próprio usuário
+        if perfil.tipo == 'fornecedor':
+            pedido = Pedido.objects.filter(produto__fornecedor=perfil).order_by('-id').first()
+            produto = Produto.objects.filter(fornecedor=perfil).order_by('-id').first()
+        else:
+            pedido = Pedido.objects.filter(comprador=perfil).order_by('-id').first()
+            produto = Produto.objects.filter(quantidade__gt=0).order_by('-id').first()
+        conversa = Conversa.da_caixa(perfil).first()
+        outro = conversa.outro(perfil) if conversa else perfil
+        fornecedor_id = perfil.id if perfil.tipo == 'fornecedor' else (
+            Perfil.objects.filter(tipo='fornecedor').values_list('id', flat=True).first()
+        )
+        return {
+            'produto_id': produto.id if produto else 0,
+            'pedido_id': pedido.id if pedido else 0,
+            'fornecedor_id': fornecedor_id or 0,
+            'usuario_id': outro.id,
+            # Última mensagem da conversa: "anteriores" devolve uma página cheia, "novas" nenhuma
+            'mensagem_id': conversa.ultima_mensagem_id if conversa else 0,
+            'tipo': 'pedidos',
+        }
+
+    def _medir(self, cliente, url, options):
+        tempos, consultas, db_ms = [], [], []
+        status = None
+        for i in range(options['repeticoes'] + 1):
+            if options['sem_cache']:
+                for cache in caches.all():
+                    cache.clear()
+            with registrar_consultas() as registro:
+                inicio = time.perf_counter()
+                resposta = cliente.get(url)
+                if resposta.streaming:
+                    for _ in resposta.streaming_content:
+                        pass
+                segundos = time.perf_counter() - inicio
+            status = resposta.status_code
+            if i == 0:
+                # Aquecimento: templates compilados, caches e conexões abertas
+                continue
+            tempos.append(segundos * 1000)
+            consultas.append(registro.total)
+            db_ms.append(registro.milissegundos)
+        return {
+            'url': url,
+            'status': status,
+            'mediana_ms': round(statistics.median(tempos), 3),
+            'p95_ms': round(percentil(tempos, 95), 3),
+            'min_ms': round(min(tempos), 3),
+            'consultas': statistics.median_low(consultas),
+            'db_ms': round(statistics.median(db_ms), 3),
+        }
+
+    def _comparar(self, base, resultados, options):
+        comparacao = []
+        for chave, atual in resultados.items():
+            anterior = base.get(chave)
+            if not anterior:
+                continue
+            diferenca = atual['mediana_ms'] - anterior['mediana_ms']
+            variacao = diferenca / anterior['mediana_ms'] if anterior['mediana_ms'] else 0
+            mais_lenta = variacao > options['tolerancia'] and diferenca > options['minimo_ms']
+            comparacao.append({
+                'rota': chave,
+                'mediana_ms': atual['mediana_ms'],
+                'mediana_baseline_ms': anterior['mediana_ms'],
+                'variacao': round(variacao, 3),
+                'consultas': atual['consultas'],
+                'consultas_baseline': anterior['consultas'],
+                'regressao': mais_lenta or atual['consultas'] > anterior['consultas'],
+            })
+        return comparacao
+
+    def _imprimir(self, relatorio):
+        self.stdout.write(f"{'rota':<42} {'status':>6} {'mediana':>9} {'p95':>9} {'consultas':>9} {'db':>8}")
+        for chave, r in relatorio['resultados'].items():
+            self.stdout.write(
+                f"{chave:<42} {r['status']:>6} {r['mediana_ms']:>7.1f}ms {r['p95_ms']:>7.1f}ms "
+                f"{r['consultas']:>9} {r['db_ms']:>6.1f}ms"
+            )
+        for item in relatorio.get('comparacao', []):
+            if item['regressao']:
+                self.stdout.write(self.style.ERROR(
+                    f"Regressão em {item['rota']}: {item['mediana_baseline_ms']:.1f}ms -> {item['mediana_ms']:.1f}ms "
+                    f"({item['variacao']:+.0%}), consultas {item['consultas_baseline']} -> {item['consultas']}"
+                ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from core import indices
+
+
+class Command(BaseCommand):
+    help = (
+        'Cria nas tabelas existentes os índices de Meta.indexes que faltam (o migrate --run-syncdb só '
+        'os cria com tabelas novas). Com --verificar apenas lista os ausentes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Alias do banco de dados.')
+        parser.add_argument('--verificar', action='store_true', help='Não cria; sai com erro se faltar algum índice.')
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            faltando = indices.ausentes(options['database'])
+        else:
+            faltando = indices.criar_ausentes(options['database'])
+        for modelo, indice in faltando:
+            self.stdout.write(f'{modelo._meta.db_table}: {indice.name} ({", ".join(indice.fields)})')
+        if options['verificar']:
+            if faltando:
+                raise CommandError(f'{len(faltando)} índices ausentes.')
+            self.stdout.write(self.style.SUCCESS('Todos os índices declarados existem no banco.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(faltando)} índices criados.'))
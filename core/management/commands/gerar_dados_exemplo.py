@@ -0,0 +1,225 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from core.models import Avaliacao, Categoria, Mensagem, Pedido, Perfil, Produto, Transporte
+
+CATEGORIAS = [
+    'Grãos', 'Hortaliças', 'Frutas', 'Laticínios', 'Carnes', 'Ovos', 'Café', 'Mel',
+    'Sementes', 'Adubos', 'Rações', 'Ferramentas', 'Flores', 'Temperos', 'Tubérculos', 'Farinhas',
+]
+PRODUTOS = [
+    'Feijão', 'Milho', 'Arroz', 'Batata', 'Mandioca', 'Tomate', 'Cebola', 'Alface', 'Banana', 'Manga',
+    'Papaia', 'Queijo', 'Leite', 'Iogurte', 'Frango', 'Cabrito', 'Ovos', 'Café', 'Mel', 'Abóbora',
+    'Cenoura', 'Couve', 'Pimenta', 'Alho', 'Batata-doce', 'Inhame', 'Goiaba', 'Laranja', 'Limão', 'Coco',
+]
+VARIEDADES = ['orgânico', 'da safra', 'selecionado', 'tipo 1', 'a granel', 'caseiro', 'fresco', 'premium']
+
+
+@contextmanager
+def datas_manuais(*campos):
+    # auto_now/auto_now_add sobrescrevem a data no bulk_create; desliga enquanto os dados são gerados
+    originais = [(campo, campo.auto_now, campo.auto_now_add) for campo in campos]
+    for campo in campos:
+        campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in originais:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera um conjunto de dados realista para desenvolvimento e benchmarks: fornecedores, compradores, '
+        'transportadores, categorias, produtos, pedidos (em 12 meses), mensagens e avaliações. '
+        'Tudo é inserido com bulk_create e os resumos (vendas mensais, conversas, avaliações, busca) são recalculados no fim.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', type=float, default=1.0, help='Multiplica todas as quantidades padrão.')
+        parser.add_argument('--fornecedores', type=int, default=20)
+        parser.add_argument('--compradores', type=int, default=200)
+        parser.add_argument('--transportadores', type=int, default=10)
+        parser.add_argument('--produtos-por-fornecedor', type=int, default=25)
+        parser.add_argument('--pedidos', type=int, default=20000)
+        parser.add_argument('--mensagens', type=int, default=10000)
+        parser.add_argument('--fracao-avaliada', type=float, default=0.3,
+                            help='Fração dos pedidos entregues que recebem avaliação.')
+        parser.add_argument('--meses', type=int, default=12, help='Período coberto pelos pedidos e mensagens.')
+        parser.add_argument('--prefixo', default='demo', help='Prefixo dos nomes de usuário gerados.')
+        parser.add_argument('--senha', default='demo12345', help='Senha de todos os usuários gerados.')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador aleatório.')
+        parser.add_argument('--lote', type=int, default=2000, help='Tamanho do lote do bulk_create.')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=f"{options['prefixo']}_").exists():
+            raise CommandError(f"Já existem usuários com o prefixo '{options['prefixo']}'; use outro --prefixo.")
+
+        escala = options['escala']
+        quantidade = {
+            chave: max(1, round(options[chave] * escala))
+            for chave in ('fornecedores', 'compradores', 'transportadores', 'pedidos', 'mensagens')
+        }
+        self.aleatorio = random.Random(options['semente'])
+        self.lote = options['lote']
+        self.agora = timezone.now()
+        self.inicio = self.agora - timedelta(days=30 * options['meses'])
+
+        with transaction.atomic(), datas_manuais(
+            Produto._meta.get_field('data_criacao'),
+            Pedido._meta.get_field('data_pedido'),
+            Mensagem._meta.get_field('data_envio'),
+            Avaliacao._meta.get_field('data_criacao'),
+            Avaliacao._meta.get_field('atualizado_em'),
+        ):
+            perfis = self._perfis(options['prefixo'], options['senha'], quantidade)
+            categorias = self._categorias()
+            produtos = self._produtos(perfis['fornecedor'], categorias, options['produtos_por_fornecedor'])
+            pedidos = self._pedidos(produtos, perfis['comprador'], quantidade['pedidos'])
+            transportes = self._transportes(pedidos, perfis['transportador'])
+            avaliacoes = self._avaliacoes(pedidos, options['fracao_avaliada'])
+            mensagens = self._mensagens(perfis['fornecedor'], perfis['comprador'], quantidade['mensagens'])
+
+        # Os sinais não rodam no bulk_create; os resumos são reconstruídos de uma vez
+        for comando in ('recalcular_vendas_mensais', 'reconstruir_conversas', 'recalcular_avaliacoes', 'reindexar_produtos'):
+            call_command(comando, stdout=self.stdout)
+        caches['relatorios'].clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(len(lista) for lista in perfis.values())} perfis, {len(categorias)} categorias, "
+            f"{len(produtos)} produtos, {len(pedidos)} pedidos, {len(transportes)} transportes, "
+            f"{avaliacoes} avaliações e {mensagens} mensagens gerados. Senha dos usuários: {options['senha']}"
+        ))
+
+    def _data(self, inicio=None):
+        inicio = inicio or self.inicio
+        return inicio + (self.agora - inicio) * self.aleatorio.random()
+
+    def _perfis(self, prefixo, senha, quantidade):
+        senha = make_password(senha)
+        tipos = [
+            tipo
+            for tipo, chave in (('fornecedor', 'fornecedores'), ('comprador', 'compradores'), ('transportador', 'transportadores'))
+            for _ in range(quantidade[chave])
+        ]
+        usuarios = User.objects.bulk_create(
+            [
+                User(username=f'{prefixo}_{tipo}_{i}', email=f'{prefixo}_{tipo}_{i}@example.com', password=senha)
+                for i, tipo in enumerate(tipos)
+            ],
+            batch_size=self.lote
+        )
+        perfis = Perfil.objects.bulk_create(
+            [
+                Perfil(usuario=usuario, tipo=tipo, telefone=f'9{self.aleatorio.randrange(10 ** 6):06d}', endereco='Praia, Santiago')
+                for usuario, tipo in zip(usuarios, tipos)
+            ],
+            batch_size=self.lote
+        )
+        return {tipo: [perfil for perfil in perfis if perfil.tipo == tipo] for tipo, _ in Perfil.TIPO_USUARIO}
+
+    def _categorias(self):
+        existentes = {categoria.nome: categoria for categoria in Categoria.objects.all()}
+        novas = Categoria.objects.bulk_create([Categoria(nome=nome) for nome in CATEGORIAS if nome not in existentes])
+        return list(existentes.values()) + novas
+
+    def _produtos(self, fornecedores, categorias, por_fornecedor):
+        produtos = []
+        for fornecedor in fornecedores:
+            for i in range(por_fornecedor):
+                nome = f'{self.aleatorio.choice(PRODUTOS)} {self.aleatorio.choice(VARIEDADES)} {i + 1}'
+                produtos.append(Produto(
+                    fornecedor=fornecedor,
+                    categoria=self.aleatorio.choice(categorias + [None]),
+                    nome=nome,
+                    descricao=f'{nome} produzido por {fornecedor.usuario.username}.',
+                    preco=Decimal(self.aleatorio.randrange(50, 50000)) / 100,
+                    # Alguns produtos esgotados ou abaixo do estoque mínimo
+                    quantidade=self.aleatorio.choice([0, 5, 8] + [self.aleatorio.randrange(10, 1000)] * 7),
+                    estoque_minimo=10,
+                    data_criacao=self._data(),
+                ))
+        return Produto.objects.bulk_create(produtos, batch_size=self.lote)
+
+    def _pedidos(self, produtos, compradores, quantidade):
+        pedidos = []
+        for _ in range(quantidade):
+            produto = self.aleatorio.choice(produtos)
+            data = self._data(max(self.inicio, produto.data_criacao))
+            # Pedidos antigos já foram resolvidos; os recentes ainda podem estar pendentes
+            dias = (self.agora - data).days
+            if dias > 30:
+                status = self.aleatorio.choices(['entregue', 'recusado', 'aceito'], [80, 15, 5])[0]
+            else:
+                status = self.aleatorio.choices(['pendente', 'aceito', 'entregue', 'recusado'], [40, 30, 20, 10])[0]
+            unidades = self.aleatorio.randrange(1, 20)
+            pedidos.append(Pedido(
+                produto=produto,
+                comprador=self.aleatorio.choice(compradores),
+                quantidade=unidades,
+                valor_total=produto.preco * unidades,
+                data_pedido=data,
+                status=status,
+            ))
+        return Pedido.objects.bulk_create(pedidos, batch_size=self.lote)
+
+    def _transportes(self, pedidos, transportadores):
+        transportes = []
+        for pedido in pedidos:
+            if pedido.status not in ('aceito', 'entregue'):
+                continue
+            inicio = pedido.data_pedido + timedelta(days=self.aleatorio.randrange(1, 4))
+            entregue = pedido.status == 'entregue'
+            transportes.append(Transporte(
+                pedido=pedido,
+                transportador=self.aleatorio.choice(transportadores),
+                status='entregue' if entregue else 'em_transito',
+                data_inicio=inicio,
+                data_entrega=inicio + timedelta(days=self.aleatorio.randrange(1, 5)) if entregue else None,
+            ))
+        return Transporte.objects.bulk_create(transportes, batch_size=self.lote)
+
+    def _avaliacoes(self, pedidos, fracao):
+        avaliacoes = []
+        for pedido in pedidos:
+            if pedido.status != 'entregue' or self.aleatorio.random() >= fracao:
+                continue
+            data = min(self.agora, pedido.data_pedido + timedelta(days=self.aleatorio.randrange(2, 15)))
+            avaliacoes.append(Avaliacao(
+                pedido=pedido,
+                avaliador_id=pedido.comprador_id,
+                fornecedor_id=pedido.produto.fornecedor_id,
+                nota=self.aleatorio.choices([1, 2, 3, 4, 5], [5, 5, 15, 35, 40])[0],
+                comentario=self.aleatorio.choice(['', 'Entrega rápida.', 'Produto de qualidade.', 'Chegou com atraso.']),
+                data_criacao=data,
+                atualizado_em=data,
+            ))
+        return len(Avaliacao.objects.bulk_create(avaliacoes, batch_size=self.lote))
+
+    def _mensagens(self, fornecedores, compradores, quantidade):
+        # Poucas conversas longas e muitas curtas, como na prática
+        pares = [(self.aleatorio.choice(compradores), self.aleatorio.choice(fornecedores)) for _ in range(max(1, quantidade // 20))]
+        recentes = self.agora - timedelta(days=7)
+        mensagens = []
+        for _ in range(quantidade):
+            comprador, fornecedor = self.aleatorio.choice(pares[:max(1, len(pares) // 5)] if self.aleatorio.random() < 0.5 else pares)
+            remetente, destinatario = (comprador, fornecedor) if self.aleatorio.random() < 0.5 else (fornecedor, comprador)
+            data = self._data()
+            mensagens.append(Mensagem(
+                remetente=remetente,
+                destinatario=destinatario,
+                conteudo=self.aleatorio.choice(['Olá, ainda tem disponível?', 'Sim, pode encomendar.', 'Qual o prazo de entrega?', 'Obrigado!']),
+                data_envio=data,
+                lida=data < recentes or self.aleatorio.random() < 0.5,
+            ))
+        # Em ordem cronológica, para os ids acompanharem as datas (a paginação do chat usa os ids)
+        mensagens.sort(key=lambda mensagem: mensagem.data_envio)
+        return len(Mensagem.objects.bulk_create(mensagens, batch_size=self.lote))
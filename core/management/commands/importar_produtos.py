@@ -0,0 +1,51 @@
+import csv
+import json
+from django.core.management.base import BaseCommand, CommandError
+from core import importacao
+from core.models import Perfil
+
+
+class Command(BaseCommand):
+    help = 'Importa (cria ou atualiza) produtos de um fornecedor a partir de um arquivo CSV ou JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--fornecedor', required=True, help='Nome de usuário do fornecedor.')
+        parser.add_argument('--formato', choices=importacao.FORMATOS, help='Padrão: detectado pela extensão.')
+        parser.add_argument('--lote', type=int, default=importacao.TAMANHO_LOTE, help='Linhas por lote.')
+        parser.add_argument('--relatorio', help='Grava os erros de todas as linhas neste arquivo CSV.')
+
+    def handle(self, *args, **options):
+        try:
+            fornecedor = Perfil.objects.get(usuario__username=options['fornecedor'], tipo='fornecedor')
+        except Perfil.DoesNotExist:
+            raise CommandError(f"Fornecedor não encontrado: {options['fornecedor']}")
+
+        formato = options['formato'] or importacao.formato_do_arquivo(options['arquivo'])
+        relatorio = open(options['relatorio'], 'w', newline='', encoding='utf-8') if options['relatorio'] else None
+        try:
+            ao_errar = None
+            if relatorio:
+                escritor = csv.writer(relatorio)
+                escritor.writerow(['linha', 'erros'])
+                ao_errar = lambda linha, erros: escritor.writerow([linha, json.dumps(erros, ensure_ascii=False)])
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importacao.importar_produtos(
+                    importacao.ler_linhas(arquivo, formato), fornecedor, options['lote'], ao_errar
+                )
+        except importacao.ArquivoInvalido as erro:
+            raise CommandError(str(erro))
+        finally:
+            if relatorio:
+                relatorio.close()
+
+        if not relatorio:
+            for erro in resultado.erros:
+                self.stderr.write(f"Linha {erro['linha']}: {json.dumps(erro['erros'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.linhas} linhas: {resultado.criados} criados, '
+            f'{resultado.atualizados} atualizados, {resultado.inalterados} inalterados, '
+            f'{resultado.total_erros} com erro.'
+        ))
+        if resultado.interrupcao:
+            raise CommandError(resultado.interrupcao)
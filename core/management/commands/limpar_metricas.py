@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.metricas import registro
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga os arquivos de métricas de todos os processos (METRICAS_DIRETORIO). '
+        'Rode ao (re)iniciar o serviço, antes de subir os workers.'
+    )
+
+    def handle(self, *args, **options):
+        registro.limpar()
+        self.stdout.write(self.style.SUCCESS(f'Métricas apagadas em {registro.diretorio}.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from core.models import ResumoAvaliacoes
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o resumo de avaliações (contagem, soma e histograma) de cada fornecedor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fornecedor', type=int, help='Recalcula apenas o fornecedor (id do Perfil) informado.')
+
+    def handle(self, *args, **options):
+        fornecedores = [options['fornecedor']] if options['fornecedor'] else None
+        total = ResumoAvaliacoes.recalcular(fornecedores)
+        self.stdout.write(self.style.SUCCESS(f'Resumo de avaliações recalculado para {total} fornecedores.'))
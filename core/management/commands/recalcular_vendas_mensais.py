@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from core.models import Pedido, VendaMensal
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o consolidado de vendas mensais (VendaMensal) a partir dos pedidos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fornecedor', type=int, help='Recalcula apenas o fornecedor (id do Perfil) informado.')
+        parser.add_argument('--lote', type=int, default=1000, help='Tamanho do lote do bulk_create.')
+
+    def handle(self, *args, **options):
+        pedidos = Pedido.objects.all()
+        consolidado = VendaMensal.objects.all()
+        if options['fornecedor']:
+            pedidos = pedidos.filter(produto__fornecedor_id=options['fornecedor'])
+            consolidado = consolidado.filter(fornecedor_id=options['fornecedor'])
+
+        linhas = pedidos.annotate(
+            ano=ExtractYear('data_pedido'),
+            mes=ExtractMonth('data_pedido')
+        ).values('produto__fornecedor_id', 'produto_id', 'ano', 'mes', 'status').annotate(
+            receita=Sum('valor_total'),
+            total=Count('id')
+        ).order_by()
+
+        with transaction.atomic():
+            consolidado.delete()
+            VendaMensal.objects.bulk_create(
+                (
+                    VendaMensal(
+                        fornecedor_id=linha['produto__fornecedor_id'],
+                        produto_id=linha['produto_id'],
+                        ano=linha['ano'],
+                        mes=linha['mes'],
+                        status=linha['status'],
+                        receita=linha['receita'] or 0,
+                        total_pedidos=linha['total']
+                    )
+                    for linha in linhas.iterator()
+                ),
+                batch_size=options['lote']
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'{consolidado.count()} linhas de vendas mensais recalculadas.'))
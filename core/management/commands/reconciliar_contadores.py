@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import contadores
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula no banco os contadores dos badges (core.contadores) e grava no cache, corrigindo os '
+        'que divergiram. Com --verificar apenas lista as diferenças.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--perfil', type=int, help='Reconcilia apenas o perfil (id do Perfil) informado.')
+        parser.add_argument('--contador', action='append', choices=contadores.NOMES,
+                            help='Contador a reconciliar (pode repetir; padrão: todos).')
+        parser.add_argument('--verificar', action='store_true', help='Não grava; sai com erro se houver diferenças.')
+
+    def handle(self, *args, **options):
+        perfis = [options['perfil']] if options['perfil'] else None
+        nomes = options['contador'] or contadores.NOMES
+        diferencas = contadores.reconciliar(nomes, perfis, corrigir=not options['verificar'])
+        for perfil_id, nome, em_cache, no_banco in diferencas:
+            self.stdout.write(f'Perfil {perfil_id}, {nome}: {em_cache} em cache, {no_banco} no banco')
+        if options['verificar']:
+            if diferencas:
+                raise CommandError(f'{len(diferencas)} contadores divergentes.')
+            self.stdout.write(self.style.SUCCESS('Contadores em cache conferem com o banco.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Contadores reconciliados; {len(diferencas)} corrigidos.'))
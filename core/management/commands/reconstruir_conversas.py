@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Conversa, Mensagem
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o resumo de conversas (Conversa) a partir das mensagens existentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Tamanho do lote do bulk_create.')
+
+    def handle(self, *args, **options):
+        # Uma passada pelas mensagens em ordem cronológica; memória proporcional ao número de conversas
+        resumos = {}
+        mensagens = Mensagem.objects.order_by('data_envio', 'id').values_list(
+            'id', 'remetente_id', 'destinatario_id', 'data_envio', 'lida'
+        )
+        for mensagem_id, remetente_id, destinatario_id, data_envio, lida in mensagens.iterator(chunk_size=5000):
+            perfil_a_id, perfil_b_id = Conversa.par(remetente_id, destinatario_id)
+            conversa = resumos.setdefault((perfil_a_id, perfil_b_id), Conversa(
+                perfil_a_id=perfil_a_id,
+                perfil_b_id=perfil_b_id
+            ))
+            conversa.ultima_mensagem_id = mensagem_id
+            conversa.ultima_data = data_envio
+            if not lida:
+                if destinatario_id == perfil_a_id:
+                    conversa.nao_lidas_a += 1
+                else:
+                    conversa.nao_lidas_b += 1
+
+        with transaction.atomic():
+            Conversa.objects.all().delete()
+            Conversa.objects.bulk_create(resumos.values(), batch_size=options['lote'])
+
+        self.stdout.write(self.style.SUCCESS(f'{len(resumos)} conversas reconstruídas.'))
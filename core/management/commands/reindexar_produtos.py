@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from core.busca import busca_produtos
+
+
+class Command(BaseCommand):
+    help = 'Recria o índice de busca de produtos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Alias do banco de dados.')
+
+    def handle(self, *args, **options):
+        busca = busca_produtos(options['database'])
+        busca.preparar()
+        busca.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Índice de busca reconstruído ({type(busca).__name__}).'))
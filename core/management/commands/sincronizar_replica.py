@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from core.replicas import copiar_sqlite, replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia o banco SQLite principal para os arquivos das réplicas (DB_REPLICAS). Faz o papel '
+        'da replicação em desenvolvimento e testes, com o atraso que se quiser entre uma cópia e outra. '
+        'Com Postgres use a replicação do próprio banco.'
+    )
+
+    def handle(self, *args, **options):
+        if not replicas():
+            raise CommandError('Nenhuma réplica configurada; defina DB_REPLICAS.')
+        if settings.DATABASES[DEFAULT_DB_ALIAS]['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Só réplicas SQLite são copiadas por este comando.')
+        for alias in replicas():
+            copiar_sqlite(DEFAULT_DB_ALIAS, settings.DATABASES[alias]['NAME'])
+            self.stdout.write(self.style.SUCCESS(f"{alias}: copiado para {settings.DATABASES[alias]['NAME']}."))
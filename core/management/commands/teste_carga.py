@@ -0,0 +1,108 @@
+import json
+import os
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from core import carga
+from core.banco_de_teste import banco_de_teste
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga local: usuários virtuais fazendo pedidos, aceitando pedidos e trocando mensagens '
+        'ao mesmo tempo contra as aplicações WSGI e ASGI. Mede vazão, percentis de latência, taxa de erros '
+        'e erros de banco travado do SQLite. Roda num banco de teste criado e destruído pelo próprio comando, '
+        'com dados de gerar_dados_exemplo (--escala); o banco configurado só é usado com --banco-configurado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servidor', action='append', choices=list(carga.SERVIDORES),
+                            help='Aplicação testada (padrão: wsgi e asgi, uma depois da outra).')
+        parser.add_argument('--usuarios', type=int, default=20, help='Usuários simultâneos.')
+        parser.add_argument('--mix', default='comprador=6,fornecedor=2,mensagens=2',
+                            help='Peso de cada papel entre os usuários (comprador, fornecedor, mensagens).')
+        parser.add_argument('--duracao', type=float, default=30, help='Duração de cada rodada em segundos.')
+        parser.add_argument('--acoes', type=int, help='Encerra cada usuário após este número de ações.')
+        parser.add_argument('--pensar', type=float, default=1.0,
+                            help='Tempo médio de pensar entre ações, em segundos (0 = sem pausa).')
+        parser.add_argument('--produtos-quentes', type=int, default=5,
+                            help='Quantos produtos os compradores disputam.')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--escala', type=float, default=0.1, help='Escala do gerar_dados_exemplo no banco de teste.')
+        parser.add_argument('--banco-configurado', action='store_true',
+                            help='Usa o banco configurado e os dados que ele já tem. ATENÇÃO: grava pedidos e '
+                                 'mensagens nele; use só com uma cópia.')
+        parser.add_argument('--debug', action='store_true',
+                            help='Mantém o DEBUG das settings (o log de consultas do DEBUG distorce as medidas).')
+        parser.add_argument('--saida', help='Grava o resultado em JSON neste arquivo.')
+        parser.add_argument('--json', action='store_true', help='Saída em JSON.')
+
+    def handle(self, *args, **options):
+        try:
+            quantidades = carga.distribuir(options['usuarios'], carga.ler_mix(options['mix']))
+        except ValueError as erro:
+            raise CommandError(erro)
+        if not options['duracao'] and not options['acoes']:
+            raise CommandError('Informe --duracao ou --acoes.')
+
+        if options['banco_configurado']:
+            resultados = self._rodadas(quantidades, options)
+        else:
+            with banco_de_teste('teste_carga'):
+                with open(os.devnull, 'w') as nulo:
+                    call_command('gerar_dados_exemplo', escala=options['escala'], stdout=nulo)
+                resultados = self._rodadas(quantidades, options)
+
+        if options['saida']:
+            with open(options['saida'], 'w') as arquivo:
+                json.dump(resultados, arquivo, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+
+    def _rodadas(self, quantidades, options):
+        ajustes = {'ALLOWED_HOSTS': [carga.HOST]}
+        if not options['debug']:
+            ajustes['DEBUG'] = False
+        resultados = []
+        with override_settings(**ajustes):
+            for servidor in options['servidor'] or list(carga.SERVIDORES):
+                # Usuários novos a cada rodada, com a mesma semente: as rodadas fazem o mesmo trabalho
+                try:
+                    usuarios = carga.preparar_usuarios(
+                        quantidades, options['produtos_quentes'], options['pensar'], options['semente']
+                    )
+                except ValueError as erro:
+                    raise CommandError(f'{erro} Rode gerar_dados_exemplo antes.')
+                estatisticas = carga.SERVIDORES[servidor](usuarios, options['duracao'] or None, options['acoes'])
+                resultado = estatisticas.como_dict()
+                resultado['mix'] = quantidades
+                resultados.append(resultado)
+                if not options['json']:
+                    self._imprimir(resultado)
+        return resultados
+
+    def _imprimir(self, r):
+        mix = ', '.join(f'{quantidade} {papel}' for papel, quantidade in r['mix'].items() if quantidade)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{r['servidor'].upper()}: {r['usuarios']} usuários ({mix})"))
+        self.stdout.write(
+            f"  {r['requisicoes']} requisições e {r['acoes']} ações em {r['duracao_s']}s: "
+            f"{r['vazao_rps']} req/s, {r['acoes_por_s']} ações/s"
+        )
+        if r['latencia']:
+            self.stdout.write(
+                f"  latência p50 {r['latencia']['p50_ms']}ms, p95 {r['latencia']['p95_ms']}ms, "
+                f"p99 {r['latencia']['p99_ms']}ms, máx {r['latencia']['max_ms']}ms"
+            )
+        estilo = self.style.ERROR if r['erros'] or r['bloqueios_sqlite'] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"  erros: {r['erros']} ({r['taxa_erros']:.2%}), banco travado: {r['bloqueios_sqlite']}, "
+            f"rejeitadas pela regra de negócio: {r['rejeitadas']}"
+        ))
+        if r['excecoes']:
+            self.stdout.write('  exceções: ' + ', '.join(f'{nome} x{total}' for nome, total in r['excecoes'].items()))
+        self.stdout.write(f"  {'passo':<30} {'req':>6} {'erros':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'máx':>9}")
+        for passo, p in r['passos'].items():
+            self.stdout.write(
+                f"  {passo:<30} {p['requisicoes']:>6} {p['erros']:>6} {p['p50_ms']:>7.1f}ms "
+                f"{p['p95_ms']:>7.1f}ms {p['p99_ms']:>7.1f}ms {p['max_ms']:>7.1f}ms"
+            )
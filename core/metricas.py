@@ -0,0 +1,262 @@
+# metricas.py
+"""
+Métricas da aplicação no formato texto do Prometheus (GET /metrics).
+
+Cada processo grava os próprios valores num arquivo mapeado em memória (mmap) em
+METRICAS_DIRETORIO, um arquivo por pid: os workers nunca disputam o mesmo arquivo e
+dentro do processo a trava só cobre a soma de um float. A exposição lê todos os arquivos
+do diretório e soma os valores, então qualquer worker responde pelo conjunto.
+
+Como no modo multiprocesso do prometheus_client, o diretório deve ser esvaziado ao
+(re)iniciar o serviço; arquivos de processos encerrados continuam somando até lá.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+from django.conf import settings
+
+PREFIXO = 'agroconnect'
+
+# Buckets de latência (segundos), do padrão do Prometheus com mais resolução abaixo de 100 ms
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_CABECALHO = struct.Struct('<i4x')
+_TAMANHO = struct.Struct('<i')
+_VALOR = struct.Struct('<d')
+_TAMANHO_INICIAL = 64 * 1024
+
+
+class ArquivoMetricas:
+    """
+    Dicionário chave -> float num arquivo mmap. Layout: 8 bytes com o total usado e, em
+    seguida, entradas [tamanho da chave (4 bytes)][chave utf-8 alinhada a 8][valor double].
+    O total usado só avança depois de a entrada estar escrita, então leitores de outros
+    processos nunca veem uma entrada pela metade.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._trava = threading.Lock()
+        self._arquivo = open(caminho, 'a+b')
+        if os.fstat(self._arquivo.fileno()).st_size == 0:
+            self._arquivo.truncate(_TAMANHO_INICIAL)
+        self._tamanho = os.fstat(self._arquivo.fileno()).st_size
+        self._mmap = mmap.mmap(self._arquivo.fileno(), self._tamanho)
+        self._posicoes = {}
+        self._usado = _CABECALHO.unpack_from(self._mmap, 0)[0] or _CABECALHO.size
+        for chave, _, posicao in self._entradas(self._mmap, self._usado):
+            self._posicoes[chave] = posicao
+
+    @staticmethod
+    def _entradas(dados, usado):
+        posicao = _CABECALHO.size
+        while posicao < usado:
+            tamanho = _TAMANHO.unpack_from(dados, posicao)[0]
+            inicio = posicao + _TAMANHO.size
+            chave = bytes(dados[inicio:inicio + tamanho]).decode()
+            posicao_valor = inicio + tamanho + (-(_TAMANHO.size + tamanho) % 8)
+            yield chave, _VALOR.unpack_from(dados, posicao_valor)[0], posicao_valor
+            posicao = posicao_valor + _VALOR.size
+
+    @classmethod
+    def ler(cls, caminho):
+        """Pares (chave, valor) de um arquivo, possivelmente em uso por outro processo."""
+        with open(caminho, 'rb') as arquivo:
+            dados = arquivo.read()
+        if len(dados) < _CABECALHO.size:
+            return []
+        usado = min(_CABECALHO.unpack_from(dados, 0)[0], len(dados))
+        return [(chave, valor) for chave, valor, _ in cls._entradas(dados, usado)]
+
+    def _nova_entrada(self, chave):
+        codificada = chave.encode()
+        preenchimento = -(_TAMANHO.size + len(codificada)) % 8
+        tamanho_entrada = _TAMANHO.size + len(codificada) + preenchimento + _VALOR.size
+        while self._usado + tamanho_entrada > self._tamanho:
+            self._tamanho *= 2
+            self._mmap.close()
+            self._arquivo.truncate(self._tamanho)
+            self._mmap = mmap.mmap(self._arquivo.fileno(), self._tamanho)
+        posicao = self._usado
+        _TAMANHO.pack_into(self._mmap, posicao, len(codificada))
+        self._mmap[posicao + _TAMANHO.size:posicao + _TAMANHO.size + len(codificada)] = codificada
+        posicao_valor = posicao + _TAMANHO.size + len(codificada) + preenchimento
+        _VALOR.pack_into(self._mmap, posicao_valor, 0.0)
+        self._usado += tamanho_entrada
+        _CABECALHO.pack_into(self._mmap, 0, self._usado)
+        self._posicoes[chave] = posicao_valor
+        return posicao_valor
+
+    def somar(self, chave, valor):
+        with self._trava:
+            posicao = self._posicoes.get(chave)
+            if posicao is None:
+                posicao = self._nova_entrada(chave)
+            _VALOR.pack_into(self._mmap, posicao, _VALOR.unpack_from(self._mmap, posicao)[0] + valor)
+
+
+class Registro:
+    """Métricas declaradas e o arquivo deste processo (reaberto se o processo mudar após um fork)."""
+
+    def __init__(self):
+        self.metricas = []
+        self._arquivo = None
+        self._dono = None
+        self._trava = threading.Lock()
+
+    @property
+    def diretorio(self):
+        return settings.METRICAS_DIRETORIO
+
+    def arquivo(self):
+        dono = (os.getpid(), self.diretorio)
+        if self._dono != dono:
+            with self._trava:
+                if self._dono != dono:
+                    os.makedirs(self.diretorio, exist_ok=True)
+                    self._arquivo = ArquivoMetricas(os.path.join(self.diretorio, f'metricas_{dono[0]}.db'))
+                    self._dono = dono
+        return self._arquivo
+
+    def somar(self, amostra, rotulos, valor):
+        self.arquivo().somar(json.dumps([amostra, sorted(rotulos.items())]), valor)
+
+    def coletar(self):
+        """{amostra: {rotulos (tupla ordenada): valor}} somado entre todos os processos."""
+        valores = defaultdict(lambda: defaultdict(float))
+        try:
+            nomes = os.listdir(self.diretorio)
+        except FileNotFoundError:
+            return valores
+        for nome in nomes:
+            if not (nome.startswith('metricas_') and nome.endswith('.db')):
+                continue
+            try:
+                entradas = ArquivoMetricas.ler(os.path.join(self.diretorio, nome))
+            except FileNotFoundError:
+                continue
+            for chave, valor in entradas:
+                amostra, rotulos = json.loads(chave)
+                valores[amostra][tuple(map(tuple, rotulos))] += valor
+        return valores
+
+    def exposicao(self):
+        """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)."""
+        valores = self.coletar()
+        linhas = []
+        for metrica in self.metricas:
+            linhas.append(f'# HELP {metrica.nome} {metrica.ajuda}')
+            linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+            linhas.extend(metrica.linhas(valores))
+        return '\n'.join(linhas) + '\n'
+
+    def limpar(self):
+        """Apaga os arquivos de todos os processos (para o início do serviço e para testes)."""
+        with self._trava:
+            self._arquivo = self._dono = None
+            try:
+                nomes = os.listdir(self.diretorio)
+            except FileNotFoundError:
+                return
+            for nome in nomes:
+                if nome.startswith('metricas_') and nome.endswith('.db'):
+                    os.remove(os.path.join(self.diretorio, nome))
+
+
+registro = Registro()
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _amostra(nome, rotulos, valor):
+    texto = ','.join(f'{rotulo}="{_escapar(v)}"' for rotulo, v in rotulos)
+    return f'{nome}{{{texto}}} {_numero(valor)}' if texto else f'{nome} {_numero(valor)}'
+
+
+def _numero(valor):
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return repr(int(valor)) if float(valor).is_integer() else repr(valor)
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = f'{PREFIXO}_{nome}'
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        registro.metricas.append(self)
+
+    def somar(self, valor=1, **rotulos):
+        registro.somar(self.nome, rotulos, valor)
+
+    def linhas(self, valores):
+        for rotulos, valor in sorted(valores.get(self.nome, {}).items()):
+            yield _amostra(self.nome, rotulos, valor)
+
+
+class Histograma:
+    """
+    Histograma com buckets fixos. Cada observação soma 1 só no primeiro bucket que a comporta;
+    os valores acumulados (le) são montados na exposição.
+    """
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_LATENCIA):
+        self.nome = f'{PREFIXO}_{nome}'
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        registro.metricas.append(self)
+
+    def observar(self, valor, **rotulos):
+        limite = next(limite for limite in self.buckets if valor <= limite)
+        registro.somar(f'{self.nome}_bucket', {**rotulos, 'le': _numero(limite)}, 1)
+        registro.somar(f'{self.nome}_sum', rotulos, valor)
+        registro.somar(f'{self.nome}_count', rotulos, 1)
+
+    def linhas(self, valores):
+        por_serie = defaultdict(dict)
+        for rotulos, valor in valores.get(f'{self.nome}_bucket', {}).items():
+            serie = tuple(item for item in rotulos if item[0] != 'le')
+            por_serie[serie][dict(rotulos)['le']] = valor
+        for serie in sorted(por_serie):
+            acumulado = 0
+            for limite in self.buckets:
+                acumulado += por_serie[serie].get(_numero(limite), 0)
+                yield _amostra(f'{self.nome}_bucket', serie + (('le', _numero(limite)),), acumulado)
+            yield _amostra(f'{self.nome}_sum', serie, valores[f'{self.nome}_sum'].get(serie, 0))
+            yield _amostra(f'{self.nome}_count', serie, valores[f'{self.nome}_count'].get(serie, 0))
+
+
+# Métricas da aplicação ---------------------------------------------------------------------------
+
+LATENCIA = Histograma(
+    'requisicao_segundos', 'Latência das requisições por rota (nome da URL).', ('view', 'metodo')
+)
+RESPOSTAS = Contador(
+    'respostas_total', 'Respostas por rota e status HTTP.', ('view', 'status')
+)
+CONSULTAS = Contador(
+    'consultas_sql_total', 'Consultas SQL executadas, por rota.', ('view',)
+)
+TEMPO_CONSULTAS = Contador(
+    'consultas_sql_segundos_total', 'Tempo gasto no banco, por rota.', ('view',)
+)
+TRANSICOES_PEDIDO = Contador(
+    'pedido_transicoes_total', 'Mudanças de status de pedidos confirmadas no banco.', ('de', 'para')
+)
+CACHE = Contador(
+    'cache_consultas_total', 'Leituras de cache por cache e resultado (acerto/falha).', ('cache', 'resultado')
+)
+
+
+def contar_cache(nome, acerto):
+    CACHE.somar(cache=nome, resultado='acerto' if acerto else 'falha')
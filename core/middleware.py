@@ -0,0 +1,211 @@
+# middleware.py
+import logging
+import random
+import sys
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from . import metricas, perfilador
+from .instrumentacao import registrar_consultas
+
+logger = logging.getLogger('core.sql')
+
+
+class InstrumentacaoSQLMiddleware:
+    """
+    Mede as consultas SQL de cada requisição: quantidade, tempo no banco e formas repetidas.
+
+    O resultado vai no cabeçalho Server-Timing (visível no DevTools do navegador) e em um log
+    estruturado no logger `core.sql`: INFO para toda requisição e WARNING quando alguma forma
+    de consulta se repete mais de INSTRUMENTACAO_SQL_REPETICOES vezes (padrão N+1).
+
+    Em respostas em streaming só entram as consultas feitas antes de a resposta ser devolvida.
+
+    Síncrono e assíncrono, como os demais middlewares deste módulo: sob ASGI as views
+    assíncronas rodam no event loop, sem o Django adaptar a cadeia com sync_to_async. No
+    caminho assíncrono o wrapper de execução é posto na thread síncrona da requisição, onde
+    o ORM roda as consultas (e de onde core.paralelo o copia para as threads do pool).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ativa = getattr(settings, 'INSTRUMENTACAO_SQL_ATIVA', True)
+        self.repeticoes = getattr(settings, 'INSTRUMENTACAO_SQL_REPETICOES', 5)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.ativa:
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with registrar_consultas() as registro:
+            # Lido pelo MetricasMiddleware
+            request.registro_sql = registro
+            response = self.get_response(request)
+        return self._concluir(request, response, registro, inicio)
+
+    async def __acall__(self, request):
+        if not self.ativa:
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        # Entrada e saída do registro na thread das consultas da requisição
+        pilha = ExitStack()
+        registro = await sync_to_async(pilha.enter_context)(registrar_consultas())
+        try:
+            request.registro_sql = registro
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(pilha.close)()
+        return self._concluir(request, response, registro, inicio)
+
+    def _concluir(self, request, response, registro, inicio):
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        response['Server-Timing'] = ', '.join(filter(None, [
+            response.get('Server-Timing'),
+            f'db;dur={registro.milissegundos:.2f};desc="{registro.total} consultas"',
+            f'app;dur={total_ms:.2f}',
+        ]))
+
+        dados = {
+            'metodo': request.method,
+            'caminho': request.path,
+            'view': request.resolver_match.view_name if request.resolver_match else None,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            **registro.como_dict(self.repeticoes + 1),
+        }
+        nivel = logging.WARNING if dados['repetidas'] else logging.INFO
+        logger.log(
+            nivel,
+            '%(metodo)s %(caminho)s: %(consultas)d consultas, %(db_ms).2f ms no banco',
+            dados,
+            extra={'sql': dados}
+        )
+        return response
+
+
+class MetricasMiddleware:
+    """
+    Alimenta as métricas de /metrics (core.metricas): latência e status por rota e, quando o
+    InstrumentacaoSQLMiddleware está ativo, número de consultas e tempo no banco por rota.
+    Fica antes do InstrumentacaoSQLMiddleware para ler o registro de consultas que ele deixa
+    na requisição.
+    """
+
+    METODOS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS_ATIVAS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        self._registrar(request, response, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        # Gravação nos arquivos mmap, sem bloquear o event loop de forma perceptível
+        self._registrar(request, response, time.perf_counter() - inicio)
+        return response
+
+    def _registrar(self, request, response, segundos):
+        # Só rotas conhecidas viram rótulo, para URLs arbitrárias não criarem séries novas
+        view = request.resolver_match.view_name if request.resolver_match else 'sem-rota'
+        metodo = request.method if request.method in self.METODOS else 'outro'
+        metricas.LATENCIA.observar(segundos, view=view, metodo=metodo)
+        metricas.RESPOSTAS.somar(view=view, status=response.status_code)
+        registro = getattr(request, 'registro_sql', None)
+        if registro is not None:
+            metricas.CONSULTAS.somar(registro.total, view=view)
+            metricas.TEMPO_CONSULTAS.somar(registro.segundos, view=view)
+
+
+class PerfiladorMiddleware:
+    """
+    Perfil por amostragem de requisições escolhidas: as que trazem o cabeçalho
+    PERFILADOR_CABECALHO vindas de um usuário staff, e uma fração PERFILADOR_TAXA de todas.
+    O perfil cobre o que roda abaixo deste middleware (view, ORM e renderização do template)
+    e é gravado em PERFILADOR_DIRETORIO no formato collapsed; o nome do arquivo volta no
+    cabeçalho X-Perfil. A lista fica em /admin/perfis/.
+
+    Com PERFILADOR_ATIVO desligado o middleware sai da cadeia (MiddlewareNotUsed): custo zero.
+
+    Sob ASGI, com a cadeia assíncrona, a amostragem é da thread do event loop: entram os
+    frames da view assíncrona e, enquanto ela espera (banco, sync_to_async), as amostras
+    contam como `(aguardando)`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFILADOR_ATIVO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.cabecalho = getattr(settings, 'PERFILADOR_CABECALHO', 'X-Perfilar')
+        self.taxa = getattr(settings, 'PERFILADOR_TAXA', 0)
+        self.intervalo = getattr(settings, 'PERFILADOR_INTERVALO', 0.001)
+        self.diretorio = settings.PERFILADOR_DIRETORIO
+        self.maximo = getattr(settings, 'PERFILADOR_MAX_ARQUIVOS', 200)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._perfilar(request, lambda: request.user):
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with perfilador.Amostrador(sys._getframe(), self.intervalo) as amostrador:
+            response = self.get_response(request)
+        return self._gravar(request, response, inicio, amostrador)
+
+    async def __acall__(self, request):
+        if self.cabecalho in request.headers:
+            usuario = await request.auser()
+            perfilar = self._perfilar(request, lambda: usuario)
+        else:
+            perfilar = self._perfilar(request, None)
+        if not perfilar:
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        # Frame da corrotina: o mesmo objeto a cada vez que ela volta a rodar no event loop
+        with perfilador.Amostrador(sys._getframe(), self.intervalo, fora='(aguardando)') as amostrador:
+            response = await self.get_response(request)
+        return await sync_to_async(self._gravar)(request, response, inicio, amostrador)
+
+    def _gravar(self, request, response, inicio, amostrador):
+        milissegundos = (time.perf_counter() - inicio) * 1000
+        response['X-Perfil'] = perfilador.gravar(
+            self.diretorio, request, response, milissegundos, amostrador.colapsado(), self.maximo
+        )
+        return response
+
+    def _perfilar(self, request, usuario):
+        # O usuário só é carregado quando o cabeçalho vem na requisição
+        if self.cabecalho in request.headers and usuario().is_staff:
+            return True
+        return self.taxa > 0 and random.random() < self.taxa
@@ -1,7 +1,14 @@
 # models.py
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
+from datetime import datetime
 from django.core.validators import MinValueValidator, MaxValueValidator
+from . import contadores
 
 # Modelo para Fornecedores, Transportadores e Compradores
 class Perfil(models.Model):
@@ -49,9 +56,36 @@ class Produto(models.Model):
     )
     data_criacao = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Catálogo (quantidade > 0 ordenado por data) e estoque baixo do fornecedor
+            models.Index(fields=['quantidade', 'data_criacao'], name='produto_disponiveis'),
+            models.Index(fields=['fornecedor', 'quantidade'], name='produto_forn_estoque'),
+        ]
+
     def __str__(self):
         return self.nome
 
+class ProdutoBusca(models.Model):
+    """
+    Vetor de busca (tsvector) de cada produto, para core.busca.BuscaPostgres: nome, categoria
+    e descrição com pesos A, B e C, gravados por `indexar` a cada alteração (mesmos sinais do
+    índice FTS5 do SQLite). Tabela à parte para o vetor não vir junto em toda consulta de
+    Produto; só existe no PostgreSQL.
+    """
+    # Sem CASCADE: no SQLite a tabela não existe e a exclusão de um produto não pode consultá-la;
+    # a linha sai por BuscaPostgres.remover (post_delete)
+    produto = models.OneToOneField(
+        Produto, primary_key=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    vetor = SearchVectorField()
+
+    class Meta:
+        required_db_vendor = 'postgresql'
+        indexes = [
+            GinIndex(fields=['vetor'], name='produto_busca_vetor'),
+        ]
+
 # Modelo para Pedidos
 class Pedido(models.Model):
     STATUS_CHOICES = [
@@ -75,6 +109,13 @@ class Pedido(models.Model):
     data_pedido = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
 
+    class Meta:
+        indexes = [
+            # Pedidos do fornecedor chegam pelo produto; status e data completam os filtros e a ordenação
+            models.Index(fields=['produto', 'status', 'data_pedido'], name='pedido_produto_status_data'),
+            models.Index(fields=['comprador', 'data_pedido'], name='pedido_comprador_data'),
+        ]
+
     def __str__(self):
         return f"Pedido #{self.id} - {self.produto.nome}"
 
@@ -110,22 +151,29 @@ class Mensagem(models.Model):
         return f"De {self.remetente} para {self.destinatario} - {self.data_envio}"
     class Meta:
         ordering = ['-data_envio']
+        indexes = [
+            models.Index(fields=['destinatario', 'remetente', 'lida'], name='mensagem_dest_rem_lida'),
+        ]
         
     def mark_as_read(self):
         if not self.lida:
             self.lida = True
-            self.save()
+            self.save(update_fields=['lida'])
+            Conversa.marcar_lidas(self.destinatario_id, self.remetente_id, quantidade=1)
+            contadores.somar(self.destinatario_id, 'nao_lidas', -1)
     
     @classmethod
     def get_conversations(cls, user):
-        return cls.objects.filter(
-            Q(remetente=user) | Q(destinatario=user)
-        ).distinct('remetente', 'destinatario')
+        return Conversa.da_caixa(user)
     
 
 class Avaliacao(models.Model):
     class Meta:
         unique_together = ('pedido', 'avaliador')  # Uma avaliação por pedido
+        indexes = [
+            models.Index(fields=['fornecedor', 'nota'], name='avaliacao_forn_nota'),
+            models.Index(fields=['fornecedor', 'data_criacao'], name='avaliacao_forn_recentes'),
+        ]
     
     NOTA_CHOICES = [
         (1, '★☆☆☆☆'),
@@ -167,3 +215,260 @@ class Avaliacao(models.Model):
     def nota_estrelas(self):
         return '★' * self.nota + '☆' * (5 - self.nota)
 
+
+
+
+# Contagem, soma e histograma (1 a 5 estrelas) das avaliações de cada fornecedor, mantidos pelos sinais de Avaliacao
+class ResumoAvaliacoes(models.Model):
+    fornecedor = models.OneToOneField(
+        Perfil,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='resumo_avaliacoes'
+    )
+    total = models.IntegerField(default=0)
+    soma = models.IntegerField(default=0)
+    nota_1 = models.IntegerField(default=0)
+    nota_2 = models.IntegerField(default=0)
+    nota_3 = models.IntegerField(default=0)
+    nota_4 = models.IntegerField(default=0)
+    nota_5 = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Avaliações de {self.fornecedor}: {self.total}"
+
+    @property
+    def media(self):
+        return self.soma / self.total if self.total else 0
+
+    @property
+    def histograma(self):
+        """Lista de (nota, quantidade, percentual) da maior para a menor nota."""
+        return [
+            (nota, getattr(self, f'nota_{nota}'), getattr(self, f'nota_{nota}') * 100 / self.total if self.total else 0)
+            for nota in range(5, 0, -1)
+        ]
+
+    @classmethod
+    def do_fornecedor(cls, fornecedor):
+        # Fornecedores ainda sem avaliações não têm linha; devolve um resumo zerado sem gravar
+        return cls.objects.filter(fornecedor=fornecedor).first() or cls(fornecedor=fornecedor)
+
+    @classmethod
+    def registrar(cls, fornecedor_id, nota, quantidade=1):
+        """Soma (ou subtrai, com quantidade negativa) avaliações com a `nota` informada."""
+        valores = {
+            'total': F('total') + quantidade,
+            'soma': F('soma') + nota * quantidade,
+            f'nota_{nota}': F(f'nota_{nota}') + quantidade,
+        }
+        if cls.objects.filter(fornecedor_id=fornecedor_id).update(**valores) or quantidade < 0:
+            # Sem linha para subtrair: o fornecedor está sendo excluído junto com as avaliações
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(fornecedor_id=fornecedor_id, total=quantidade, soma=nota * quantidade,
+                                   **{f'nota_{nota}': quantidade})
+        except IntegrityError:
+            # Outro processo criou a linha entre o update e o create
+            cls.objects.filter(fornecedor_id=fornecedor_id).update(**valores)
+
+    @classmethod
+    def recalcular(cls, fornecedores=None):
+        """Reconstrói os resumos a partir das avaliações (todos ou só dos `fornecedores` informados)."""
+        avaliacoes = Avaliacao.objects.all()
+        resumos = cls.objects.all()
+        if fornecedores is not None:
+            avaliacoes = avaliacoes.filter(fornecedor__in=fornecedores)
+            resumos = resumos.filter(fornecedor__in=fornecedores)
+
+        novos = {}
+        linhas = avaliacoes.values('fornecedor_id', 'nota').annotate(quantidade=Count('id')).order_by()
+        for linha in linhas:
+            resumo = novos.setdefault(linha['fornecedor_id'], cls(fornecedor_id=linha['fornecedor_id']))
+            resumo.total += linha['quantidade']
+            resumo.soma += linha['nota'] * linha['quantidade']
+            setattr(resumo, f"nota_{linha['nota']}", linha['quantidade'])
+
+        with transaction.atomic():
+            resumos.delete()
+            cls.objects.bulk_create(novos.values(), batch_size=1000)
+        return len(novos)
+
+# Consolidado mensal de vendas por fornecedor/produto, mantido pelos sinais de Pedido
+class VendaMensal(models.Model):
+    fornecedor = models.ForeignKey(
+        Perfil,
+        on_delete=models.CASCADE,
+        related_name='vendas_mensais'
+    )
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='vendas_mensais'
+    )
+    ano = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=20, choices=Pedido.STATUS_CHOICES)
+    receita = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_pedidos = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('produto', 'ano', 'mes', 'status')
+        indexes = [
+            models.Index(fields=['fornecedor', 'ano', 'mes'], name='venda_mensal_forn_periodo'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto} - {self.mes:02d}/{self.ano} ({self.status})"
+
+    @classmethod
+    def registrar(cls, fornecedor_id, produto_id, data, status, receita, pedidos):
+        """Soma (ou subtrai, com valores negativos) pedidos no consolidado do mês de `data`."""
+        if isinstance(data, datetime):
+            data = timezone.localtime(data)
+        chave = dict(produto_id=produto_id, ano=data.year, mes=data.month, status=status)
+        atualizados = cls.objects.filter(**chave).update(
+            receita=F('receita') + receita,
+            total_pedidos=F('total_pedidos') + pedidos
+        )
+        if not atualizados:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        fornecedor_id=fornecedor_id,
+                        receita=receita,
+                        total_pedidos=pedidos,
+                        **chave
+                    )
+            except IntegrityError:
+                # Outro processo criou a linha entre o update e o create
+                cls.objects.filter(**chave).update(
+                    receita=F('receita') + receita,
+                    total_pedidos=F('total_pedidos') + pedidos
+                )
+
+    @classmethod
+    def serie_mensal(cls, fornecedor, meses):
+        """Retorna {(ano, mes): {'receita': ..., 'pedidos': ...}} para os meses pedidos em uma única consulta."""
+        periodo = Q()
+        for ano, mes in meses:
+            periodo |= Q(ano=ano, mes=mes)
+        linhas = cls.objects.filter(periodo, fornecedor=fornecedor).values('ano', 'mes').annotate(
+            receita_mes=Sum('receita'),
+            pedidos_mes=Sum('total_pedidos')
+        )
+        serie = {(ano, mes): {'receita': 0, 'pedidos': 0} for ano, mes in meses}
+        for linha in linhas:
+            serie[(linha['ano'], linha['mes'])] = {
+                'receita': linha['receita_mes'] or 0,
+                'pedidos': linha['pedidos_mes'] or 0,
+            }
+        return serie
+
+
+# Resumo de cada conversa entre dois perfis, mantido a cada nova mensagem
+class Conversa(models.Model):
+    # O par é sempre guardado com o menor id em perfil_a
+    perfil_a = models.ForeignKey(
+        Perfil,
+        on_delete=models.CASCADE,
+        related_name='conversas_a'
+    )
+    perfil_b = models.ForeignKey(
+        Perfil,
+        on_delete=models.CASCADE,
+        related_name='conversas_b'
+    )
+    ultima_mensagem = models.ForeignKey(
+        Mensagem,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    ultima_data = models.DateTimeField(null=True, blank=True)
+    nao_lidas_a = models.IntegerField(default=0)
+    nao_lidas_b = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('perfil_a', 'perfil_b')
+        indexes = [
+            models.Index(fields=['perfil_a', '-ultima_data'], name='conversa_a_recentes'),
+            models.Index(fields=['perfil_b', '-ultima_data'], name='conversa_b_recentes'),
+        ]
+
+    def __str__(self):
+        return f"Conversa entre {self.perfil_a} e {self.perfil_b}"
+
+    @staticmethod
+    def par(perfil1_id, perfil2_id):
+        return (perfil1_id, perfil2_id) if perfil1_id < perfil2_id else (perfil2_id, perfil1_id)
+
+    @classmethod
+    def _filtro_par(cls, perfil1_id, perfil2_id):
+        perfil_a_id, perfil_b_id = cls.par(perfil1_id, perfil2_id)
+        return cls.objects.filter(perfil_a_id=perfil_a_id, perfil_b_id=perfil_b_id)
+
+    def outro(self, perfil):
+        return self.perfil_b if perfil.id == self.perfil_a_id else self.perfil_a
+
+    def nao_lidas_para(self, perfil):
+        return self.nao_lidas_a if perfil.id == self.perfil_a_id else self.nao_lidas_b
+
+    @classmethod
+    def da_caixa(cls, perfil):
+        """Conversas do perfil, da mais recente para a mais antiga, em uma única consulta."""
+        return cls.objects.filter(
+            Q(perfil_a=perfil) | Q(perfil_b=perfil)
+        ).select_related(
+            'perfil_a__usuario', 'perfil_b__usuario', 'ultima_mensagem'
+        ).order_by('-ultima_data')
+
+    @classmethod
+    def registrar_mensagem(cls, mensagem):
+        perfil_a_id, perfil_b_id = cls.par(mensagem.remetente_id, mensagem.destinatario_id)
+        campo_nao_lidas = 'nao_lidas_a' if mensagem.destinatario_id == perfil_a_id else 'nao_lidas_b'
+        with transaction.atomic():
+            conversa, _ = cls.objects.select_for_update().get_or_create(
+                perfil_a_id=perfil_a_id,
+                perfil_b_id=perfil_b_id
+            )
+            atualizacao = {}
+            if conversa.ultima_data is None or mensagem.data_envio >= conversa.ultima_data:
+                atualizacao.update(ultima_mensagem=mensagem, ultima_data=mensagem.data_envio)
+            if not mensagem.lida:
+                atualizacao[campo_nao_lidas] = F(campo_nao_lidas) + 1
+            if atualizacao:
+                cls.objects.filter(pk=conversa.pk).update(**atualizacao)
+
+    @classmethod
+    def marcar_lidas(cls, leitor_id, outro_id, quantidade=None):
+        """Zera (ou desconta `quantidade` de) as não lidas do leitor na conversa com `outro_id`."""
+        perfil_a_id, _ = cls.par(leitor_id, outro_id)
+        campo = 'nao_lidas_a' if leitor_id == perfil_a_id else 'nao_lidas_b'
+        valor = 0 if quantidade is None else Greatest(F(campo) - quantidade, 0)
+        cls._filtro_par(leitor_id, outro_id).update(**{campo: valor})
+
+    @classmethod
+    def recalcular(cls, perfil1_id, perfil2_id):
+        """Recalcula o resumo de uma conversa a partir das mensagens."""
+        perfil_a_id, perfil_b_id = cls.par(perfil1_id, perfil2_id)
+        mensagens = Mensagem.objects.filter(
+            Q(remetente_id=perfil_a_id, destinatario_id=perfil_b_id) |
+            Q(remetente_id=perfil_b_id, destinatario_id=perfil_a_id)
+        )
+        ultima = mensagens.order_by('-data_envio', '-id').first()
+        if ultima is None:
+            cls._filtro_par(perfil_a_id, perfil_b_id).delete()
+            return
+        cls.objects.update_or_create(
+            perfil_a_id=perfil_a_id,
+            perfil_b_id=perfil_b_id,
+            defaults={
+                'ultima_mensagem': ultima,
+                'ultima_data': ultima.data_envio,
+                'nao_lidas_a': mensagens.filter(destinatario_id=perfil_a_id, lida=False).count(),
+                'nao_lidas_b': mensagens.filter(destinatario_id=perfil_b_id, lida=False).count(),
+            }
+        )
@@ -0,0 +1,140 @@
+# paginacao.py
+import base64
+import datetime
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class CursorInvalido(Exception):
+    pass
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # O DjangoJSONEncoder corta datas em milissegundos; o cursor precisa do valor exato
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class PaginaKeyset:
+    """Página de resultados com os cursores para a página anterior e a próxima."""
+
+    def __init__(self, objetos, cursor_anterior=None, cursor_proximo=None):
+        self.objetos = objetos
+        self.cursor_anterior = cursor_anterior
+        self.cursor_proximo = cursor_proximo
+
+    @property
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    @property
+    def has_next(self):
+        return self.cursor_proximo is not None
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    def __bool__(self):
+        return bool(self.objetos)
+
+
+class PaginadorKeyset:
+    """
+    Paginação por chave (keyset): cada página filtra a partir dos valores de ordenação
+    do último item visto em vez de usar OFFSET, então o custo não depende da profundidade
+    da página. A ordenação deve terminar em um campo único (ex.: ('-data_pedido', '-id')).
+    """
+
+    def __init__(self, queryset, ordenacao, por_pagina=10):
+        self.queryset = queryset
+        self.ordenacao = ordenacao
+        self.por_pagina = por_pagina
+        self.campos = [campo.lstrip('-') for campo in ordenacao]
+        self.descendente = [campo.startswith('-') for campo in ordenacao]
+
+    # Cursores ----------------------------------------------------------------------------------
+
+    def _codificar(self, objeto, direcao):
+        valores = [getattr(objeto, campo) for campo in self.campos]
+        dados = json.dumps({'d': direcao, 'v': valores}, cls=_CursorEncoder)
+        return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+    def _decodificar(self, cursor):
+        try:
+            dados = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            direcao, valores = dados['d'], dados['v']
+            if direcao not in ('p', 'a') or len(valores) != len(self.campos):
+                raise ValueError
+            return direcao, [self._converter(campo, valor) for campo, valor in zip(self.campos, valores)]
+        except (ValueError, TypeError, KeyError, ValidationError):
+            # Cursor adulterado: valores que o campo não aceita (to_python) também caem aqui
+            raise CursorInvalido(cursor)
+
+    def _converter(self, campo, valor):
+        try:
+            field = self.queryset.model._meta.get_field(campo)
+        except FieldDoesNotExist:
+            # Anotações (ex.: posição de relevância) são usadas como vieram
+            return valor
+        return field.to_python(valor)
+
+    # Consulta ----------------------------------------------------------------------------------
+
+    def _filtro_apos(self, valores, invertido):
+        # (a, b) depois de (x, y)  =>  a > x OR (a = x AND b > y), respeitando a direção de cada campo
+        filtro = Q()
+        for i, campo in enumerate(self.campos):
+            descendente = self.descendente[i] != invertido
+            condicao = Q(**{f'{campo}__{"lt" if descendente else "gt"}': valores[i]})
+            for anterior, valor in zip(self.campos[:i], valores[:i]):
+                condicao &= Q(**{anterior: valor})
+            filtro |= condicao
+        return filtro
+
+    def pagina(self, cursor=None):
+        direcao, valores = 'p', None
+        if cursor:
+            try:
+                direcao, valores = self._decodificar(cursor)
+            except CursorInvalido:
+                direcao, valores = 'p', None
+
+        invertido = direcao == 'a'
+        ordenacao = [
+            campo.lstrip('-') if campo.startswith('-') else f'-{campo}'
+            for campo in self.ordenacao
+        ] if invertido else list(self.ordenacao)
+
+        queryset = self.queryset.order_by(*ordenacao)
+        if valores is not None:
+            queryset = queryset.filter(self._filtro_apos(valores, invertido))
+        objetos = list(queryset[:self.por_pagina + 1])
+        tem_mais = len(objetos) > self.por_pagina
+        objetos = objetos[:self.por_pagina]
+
+        if invertido:
+            objetos.reverse()
+            tem_anterior, tem_proxima = tem_mais, True
+        else:
+            tem_anterior, tem_proxima = valores is not None, tem_mais
+
+        return PaginaKeyset(
+            objetos,
+            cursor_anterior=self._codificar(objetos[0], 'a') if objetos and tem_anterior else None,
+            cursor_proximo=self._codificar(objetos[-1], 'p') if objetos and tem_proxima else None,
+        )
+
+
+def paginar(request, queryset, ordenacao, por_pagina=10):
+    """Página indicada pelo parâmetro `cursor` e os demais filtros da URL para montar os links."""
+    pagina = PaginadorKeyset(queryset, ordenacao, por_pagina).pagina(request.GET.get('cursor'))
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
+    return pagina, parametros.urlencode()
@@ -0,0 +1,88 @@
+# paralelo.py
+"""
+Consultas independentes executadas ao mesmo tempo, para as views assíncronas.
+
+O ORM assíncrono do Django (acount, aget...) passa cada consulta por sync_to_async com
+thread_sensitive=True: num `asyncio.gather` elas continuam rodando uma depois da outra, na
+mesma thread. Aqui cada consulta vai para uma thread do pool (CONSULTAS_PARALELAS_THREADS),
+com conexão própria, e as respostas são aguardadas juntas: o tempo fica perto do da consulta
+mais lenta, e não da soma. O driver do banco (sqlite3, psycopg) solta o GIL enquanto espera.
+
+Cada thread do pool mantém a própria conexão, reaproveitada conforme CONN_MAX_AGE como numa
+requisição comum; o pool soma até CONSULTAS_PARALELAS_THREADS conexões por processo.
+
+Dentro de uma transação (atomic, ATOMIC_REQUESTS, TestCase) as outras conexões não enxergam
+o que ainda não foi confirmado; nesse caso as consultas rodam em sequência na conexão da
+requisição.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+_pool = None
+_trava = threading.Lock()
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _trava:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'CONSULTAS_PARALELAS_THREADS', 8),
+                    thread_name_prefix='consultas',
+                )
+    return _pool
+
+
+def _estado_da_requisicao():
+    # Roda na thread da requisição: transação aberta e wrappers de execução (instrumentação SQL,
+    # orçamentos de consultas), que passam para as conexões das threads do pool
+    conexoes = connections.all(initialized_only=True)
+    em_transacao = any(conexao.in_atomic_block for conexao in conexoes)
+    wrappers = {conexao.alias: list(conexao.execute_wrappers) for conexao in conexoes if conexao.execute_wrappers}
+    return em_transacao, wrappers
+
+
+def _executar(funcao, wrappers):
+    # Mesmo ciclo de uma requisição: conexões vencidas ou com erro são fechadas antes e depois
+    close_old_connections()
+    try:
+        with ExitStack() as pilha:
+            for alias, lista in wrappers.items():
+                conexao = connections[alias]
+                for wrapper in lista:
+                    if wrapper not in conexao.execute_wrappers:
+                        pilha.enter_context(conexao.execute_wrapper(wrapper))
+            return funcao()
+    finally:
+        close_old_connections()
+
+
+def _em_sequencia(consultas):
+    return {nome: funcao() for nome, funcao in consultas.items()}
+
+
+async def em_paralelo(**consultas):
+    """
+    Executa as funções síncronas de `consultas` ao mesmo tempo e devolve {nome: resultado}:
+
+        resultados = await em_paralelo(total=lambda: Produto.objects.count(), ...)
+
+    As funções devem devolver valores prontos (listas, números), não querysets preguiçosos.
+    """
+    em_transacao, wrappers = await sync_to_async(_estado_da_requisicao)()
+    if em_transacao:
+        return await sync_to_async(_em_sequencia)(consultas)
+    loop = asyncio.get_running_loop()
+    # copy_context leva as ContextVars da requisição (leitura na réplica, por exemplo)
+    tarefas = [
+        loop.run_in_executor(_executor(), contextvars.copy_context().run, _executar, funcao, wrappers)
+        for funcao in consultas.values()
+    ]
+    return dict(zip(consultas, await asyncio.gather(*tarefas)))
@@ -0,0 +1,155 @@
+# perfilador.py
+"""
+Perfilador por amostragem para requisições individuais (core.middleware.PerfiladorMiddleware).
+
+Uma thread à parte lê a pilha da thread da requisição a cada PERFILADOR_INTERVALO segundos
+(sys._current_frames) e acumula as pilhas no formato "collapsed" (uma linha por pilha,
+`raiz;...;folha peso`), lido por flamegraph.pl, speedscope e inferno. O peso de cada
+amostra é o tempo, em microssegundos, desde a amostra anterior: se a thread amostradora
+demorar a pegar o GIL, a pilha vista pesa o tempo que passou, não uma amostra só.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from django.utils import timezone
+
+EXTENSAO = '.folded'
+
+# 20261018-055012-123456_GET_dashboard_200_85ms.folded
+_NOME_ARQUIVO = re.compile(
+    r'^(?P<data>\d{8}-\d{6}-\d{6})_(?P<metodo>[A-Z]+)_(?P<view>[\w.-]+)_(?P<status>\d{3})_(?P<ms>\d+)ms'
+    + re.escape(EXTENSAO) + '$'
+)
+
+
+# Rótulos já calculados, por code object; limitado para não reter o código de módulos descartados
+@lru_cache(maxsize=4096)
+def _rotulo(codigo):
+    # "funcao (arquivo:linha)"; o arquivo relativo ao site-packages ou à raiz do projeto
+    arquivo = codigo.co_filename
+    for raiz in sys.path:
+        if raiz and arquivo.startswith(raiz.rstrip(os.sep) + os.sep):
+            arquivo = arquivo[len(raiz.rstrip(os.sep)) + 1:]
+            break
+    return f'{codigo.co_name} ({arquivo}:{codigo.co_firstlineno})'.replace(';', ',')
+
+
+class Amostrador:
+    """
+    Amostra a pilha da thread atual enquanto o bloco roda. Só entram os frames abaixo de
+    `raiz` (o frame de quem abriu o bloco), para o flame graph começar na requisição.
+
+        with Amostrador(sys._getframe(), intervalo=0.001) as amostrador:
+            ...
+        amostrador.colapsado()
+
+    Numa corrotina a thread é a do event loop e `raiz` só está na pilha enquanto a corrotina
+    roda; as amostras sem ela (outras tarefas, loop ocioso) contam com o rótulo `fora` ou,
+    sem ele, são descartadas.
+    """
+
+    def __init__(self, raiz, intervalo=0.001, fora=None):
+        self.raiz = raiz
+        self.intervalo = intervalo
+        self.fora = fora
+        self.thread_id = threading.get_ident()
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, name='perfilador', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+    def _amostrar(self):
+        anterior = time.perf_counter()
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            agora = time.perf_counter()
+            pilha = []
+            while frame is not None and frame is not self.raiz:
+                pilha.append(_rotulo(frame.f_code))
+                frame = frame.f_back
+            if frame is None:
+                # A raiz não está na pilha
+                pilha = [self.fora] if self.fora else []
+            if pilha:
+                self.pilhas[';'.join(reversed(pilha))] += max(1, round((agora - anterior) * 1_000_000))
+                self.amostras += 1
+            anterior = agora
+
+    def colapsado(self):
+        return ''.join(f'{pilha} {peso}\n' for pilha, peso in sorted(self.pilhas.items()))
+
+
+def gravar(diretorio, request, response, milissegundos, conteudo, maximo):
+    """Grava o perfil e apaga os mais antigos além de `maximo` arquivos. Devolve o nome do arquivo."""
+    os.makedirs(diretorio, exist_ok=True)
+    view = request.resolver_match.view_name if request.resolver_match else 'sem-rota'
+    nome = '{}_{}_{}_{}_{}ms{}'.format(
+        timezone.localtime().strftime('%Y%m%d-%H%M%S-%f'),
+        request.method,
+        re.sub(r'[^\w.-]', '-', view),
+        response.status_code,
+        round(milissegundos),
+        EXTENSAO,
+    )
+    caminho = os.path.join(diretorio, nome)
+    # Escreve num temporário e renomeia: quem lista o diretório nunca vê um arquivo pela metade
+    with open(caminho + '.tmp', 'w') as arquivo:
+        arquivo.write(conteudo)
+    os.replace(caminho + '.tmp', caminho)
+
+    arquivos = sorted(nome for nome in os.listdir(diretorio) if _NOME_ARQUIVO.match(nome))
+    for antigo in arquivos[:-maximo]:
+        try:
+            os.remove(os.path.join(diretorio, antigo))
+        except FileNotFoundError:
+            # Outro processo já apagou
+            pass
+    return nome
+
+
+def listar(diretorio):
+    """Perfis gravados, do mais recente para o mais antigo."""
+    try:
+        nomes = os.listdir(diretorio)
+    except FileNotFoundError:
+        return []
+    perfis = []
+    for nome in sorted(nomes, reverse=True):
+        encontrado = _NOME_ARQUIVO.match(nome)
+        if not encontrado:
+            continue
+        try:
+            tamanho = os.path.getsize(os.path.join(diretorio, nome))
+        except FileNotFoundError:
+            continue
+        perfis.append({
+            'nome': nome,
+            'data': timezone.make_aware(datetime.strptime(encontrado['data'], '%Y%m%d-%H%M%S-%f')),
+            'metodo': encontrado['metodo'],
+            'view': encontrado['view'],
+            'status': int(encontrado['status']),
+            'milissegundos': int(encontrado['ms']),
+            'tamanho': tamanho,
+        })
+    return perfis
+
+
+def caminho_do_perfil(diretorio, nome):
+    """Caminho do arquivo `nome` no diretório, ou None se o nome não for de um perfil (evita ../)."""
+    if not _NOME_ARQUIVO.match(nome):
+        return None
+    caminho = os.path.join(diretorio, nome)
+    return caminho if os.path.isfile(caminho) else None
@@ -0,0 +1,179 @@
+# replicas.py
+"""
+Leituras em réplicas do banco (BANCOS_REPLICA em settings, vindas de DB_REPLICAS).
+
+Só vão para a réplica as leituras feitas dentro de `ler_da_replica()` (ou de uma view com
+`@leitura_na_replica`); o resto continua no banco principal, assim como as de `ler_do_primario()`. A leitura volta
+para o principal quando:
+- a requisição já escreveu algo ou não é GET/HEAD;
+- o mesmo navegador escreveu há menos de REPLICA_JANELA_PRIMARIO segundos (cookie posto
+  pelo ReplicaMiddleware), para ninguém ler a própria escrita desatualizada;
+- há uma transação aberta no principal.
+
+O estado fica em ContextVars, que acompanham a requisição em threads e em código assíncrono.
+"""
+import random
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+COOKIE = 'usar_primario'
+
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+
+_na_replica = ContextVar('na_replica', default=False)
+_requisicao = ContextVar('requisicao_replica', default=None)
+
+
+class _EstadoRequisicao:
+    def __init__(self, fixado):
+        self.fixado = fixado
+        self.escreveu = False
+
+
+def replicas():
+    return getattr(settings, 'BANCOS_REPLICA', [])
+
+
+@contextmanager
+def ler_da_replica():
+    """Manda para uma réplica as leituras feitas dentro do bloco (se houver réplicas configuradas)."""
+    token = _na_replica.set(True)
+    try:
+        yield
+    finally:
+        _na_replica.reset(token)
+
+
+@contextmanager
+def ler_do_primario():
+    """
+    Leituras do bloco no principal, mesmo dentro de `ler_da_replica()`. Para o que vai para
+    um cache: um valor lido de uma réplica atrasada logo depois de uma invalidação voltaria
+    ao cache e ficaria lá até expirar.
+    """
+    token = _na_replica.set(False)
+    try:
+        yield
+    finally:
+        _na_replica.reset(token)
+
+
+def leitura_na_replica(view):
+    """Decorator de view: GET/HEAD leem da réplica; os demais métodos ficam no principal."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def _view_assincrona(request, *args, **kwargs):
+            if request.method not in METODOS_SEGUROS:
+                return await view(request, *args, **kwargs)
+            with ler_da_replica():
+                return await view(request, *args, **kwargs)
+        return _view_assincrona
+
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        if request.method not in METODOS_SEGUROS:
+            return view(request, *args, **kwargs)
+        with ler_da_replica():
+            return view(request, *args, **kwargs)
+    return _view
+
+
+class RoteadorReplicas:
+    """Router (DATABASE_ROUTERS): leituras marcadas na réplica, escritas sempre no principal."""
+
+    def db_for_read(self, model, **hints):
+        bancos = replicas()
+        if not bancos or not _na_replica.get():
+            return None
+        estado = _requisicao.get()
+        if estado is not None and (estado.fixado or estado.escreveu):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(bancos)
+
+    def db_for_write(self, model, **hints):
+        estado = _requisicao.get()
+        if estado is not None:
+            estado.escreveu = True
+        # Explícito: sem isso o Django gravaria no banco de onde a instância foi lida
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bancos = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # As réplicas recebem o esquema pela replicação
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Marca a requisição que escreveu (ou que não é de leitura) com um cookie válido por
+    REPLICA_JANELA_PRIMARIO segundos; enquanto ele existir, as leituras do mesmo navegador
+    ficam no principal. Sem réplicas configuradas sai da cadeia.
+
+    Síncrono e assíncrono: o estado fica numa ContextVar, que o sync_to_async copia para a
+    thread onde o ORM roda.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.janela = getattr(settings, 'REPLICA_JANELA_PRIMARIO', 10)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        estado, token = self._iniciar(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _requisicao.reset(token)
+        return self._concluir(request, response, estado)
+
+    async def __acall__(self, request):
+        estado, token = self._iniciar(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _requisicao.reset(token)
+        return self._concluir(request, response, estado)
+
+    def _iniciar(self, request):
+        seguro = request.method in METODOS_SEGUROS
+        estado = _EstadoRequisicao(fixado=not seguro or COOKIE in request.COOKIES)
+        return estado, _requisicao.set(estado)
+
+    def _concluir(self, request, response, estado):
+        if estado.escreveu or request.method not in METODOS_SEGUROS:
+            response.set_cookie(COOKIE, '1', max_age=self.janela, httponly=True, samesite='Lax')
+        return response
+
+
+def copiar_sqlite(origem, destino):
+    """Copia o banco SQLite do alias `origem` para o arquivo `destino` (API de backup, com o banco em uso)."""
+    conexao = connections[origem]
+    conexao.ensure_connection()
+    copia = sqlite3.connect(destino)
+    try:
+        conexao.connection.backup(copia)
+    finally:
+        copia.close()
@@ -0,0 +1,101 @@
+# series.py
+from datetime import datetime, time, timedelta
+from django.db.models import Count, Sum, DateField
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncQuarter
+from django.utils import timezone
+from .models import Pedido
+
+GRANULARIDADES = {
+    'dia': TruncDay,
+    'semana': TruncWeek,
+    'mes': TruncMonth,
+    'trimestre': TruncQuarter,
+}
+
+# Limite de períodos por consulta (um ano e meio de dados diários)
+MAX_PERIODOS = 550
+
+
+def inicio_do_periodo(dia, granularidade):
+    if granularidade == 'dia':
+        return dia
+    if granularidade == 'semana':
+        return dia - timedelta(days=dia.weekday())
+    if granularidade == 'mes':
+        return dia.replace(day=1)
+    return dia.replace(month=(dia.month - 1) // 3 * 3 + 1, day=1)
+
+
+def proximo_periodo(inicio, granularidade):
+    if granularidade == 'dia':
+        return inicio + timedelta(days=1)
+    if granularidade == 'semana':
+        return inicio + timedelta(days=7)
+    meses = 1 if granularidade == 'mes' else 3
+    mes = inicio.month - 1 + meses
+    return inicio.replace(year=inicio.year + mes // 12, month=mes % 12 + 1)
+
+
+def periodos(inicio, fim, granularidade):
+    """Lista o início de cada período entre as datas inicio e fim (inclusivas)."""
+    atual = inicio_do_periodo(inicio, granularidade)
+    lista = []
+    while atual <= fim:
+        lista.append(atual)
+        atual = proximo_periodo(atual, granularidade)
+    return lista
+
+
+def ultimos_meses(hoje, quantidade=6):
+    """Primeiro dia dos últimos `quantidade` meses de calendário, terminando no mês de `hoje`."""
+    if isinstance(hoje, datetime):
+        hoje = timezone.localdate(hoje)
+    fim = inicio_do_periodo(hoje, 'mes')
+    inicio = fim
+    for _ in range(quantidade - 1):
+        inicio = (inicio - timedelta(days=1)).replace(day=1)
+    return periodos(inicio, fim, 'mes')
+
+
+def serie_receita(fornecedor, inicio, fim, granularidade='mes', status=None):
+    """
+    Receita, número de pedidos e ticket médio por período em uma única consulta agrupada.
+    Períodos sem pedidos são preenchidos com zero.
+    """
+    if granularidade not in GRANULARIDADES:
+        raise ValueError(f"Granularidade inválida: {granularidade}")
+    if inicio > fim:
+        raise ValueError("A data inicial deve ser anterior à data final.")
+    lista_periodos = periodos(inicio, fim, granularidade)
+    if len(lista_periodos) > MAX_PERIODOS:
+        raise ValueError(f"Intervalo muito longo: no máximo {MAX_PERIODOS} períodos por consulta.")
+
+    tz = timezone.get_current_timezone()
+    pedidos = Pedido.objects.filter(
+        produto__fornecedor=fornecedor,
+        data_pedido__gte=timezone.make_aware(datetime.combine(inicio, time.min), tz),
+        data_pedido__lt=timezone.make_aware(datetime.combine(fim + timedelta(days=1), time.min), tz),
+    )
+    if status:
+        pedidos = pedidos.filter(status=status)
+
+    linhas = pedidos.annotate(
+        periodo=GRANULARIDADES[granularidade]('data_pedido', output_field=DateField(), tzinfo=tz)
+    ).values('periodo').annotate(
+        receita=Sum('valor_total'),
+        pedidos=Count('id')
+    ).order_by()
+    totais = {linha['periodo']: linha for linha in linhas}
+
+    serie = []
+    for periodo in lista_periodos:
+        linha = totais.get(periodo, {})
+        receita = linha.get('receita') or 0
+        quantidade = linha.get('pedidos') or 0
+        serie.append({
+            'periodo': periodo,
+            'receita': receita,
+            'pedidos': quantidade,
+            'ticket_medio': receita / quantidade if quantidade else 0,
+        })
+    return serie
@@ -0,0 +1,375 @@
+# signals.py
+import sqlite3
+from collections import defaultdict
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_migrate
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from .models import Perfil, Pedido, Produto, Avaliacao, Categoria, Mensagem, Conversa, VendaMensal, ResumoAvaliacoes
+from .busca import busca_produtos
+from . import catalogo, contadores, eventos, indices, metricas
+from .autenticacao import invalidar_usuario
+from .cache import cache_relatorios
+
+
+# Enviado quando o status de pedidos muda, inclusive em UPDATEs que não passam por save()
+# (ver core.estoque). `alteracoes` é uma lista de (pedido, status_anterior).
+pedido_status_alterado = Signal()
+
+# Enviado após importações em lote (bulk_create/bulk_update não disparam post_save)
+produtos_importados = Signal()
+
+
+def _exclusao_direta(origin, model):
+    # Em exclusões em cascata (produto, perfil) os resumos são removidos junto com o registro pai
+    return getattr(origin, 'model', type(origin)) is model
+
+
+def _fornecedor_do_produto(produto_id):
+    return Produto.objects.filter(pk=produto_id).values_list('fornecedor_id', flat=True).first()
+
+
+# Vendas mensais ---------------------------------------------------------------------------------
+
+@receiver(pre_save, sender=Pedido)
+def guardar_estado_pedido(sender, instance, **kwargs):
+    # Guarda os valores atuais do banco para calcular a diferença no post_save
+    instance._estado_anterior = None
+    if instance.pk:
+        instance._estado_anterior = Pedido.objects.filter(pk=instance.pk).values(
+            'produto_id', 'status', 'valor_total', 'data_pedido'
+        ).first()
+
+
+@receiver(post_save, sender=Pedido)
+def atualizar_venda_mensal(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        VendaMensal.registrar(
+            instance.produto.fornecedor_id,
+            instance.produto_id,
+            instance.data_pedido,
+            instance.status,
+            instance.valor_total,
+            1
+        )
+        return
+    anterior = getattr(instance, '_estado_anterior', None)
+    if not anterior:
+        return
+    if anterior['produto_id'] != instance.produto_id or anterior['valor_total'] != instance.valor_total:
+        # Troca de produto/valor contabilizada no status anterior; a mudança de status vem pelo sinal
+        VendaMensal.registrar(
+            _fornecedor_do_produto(anterior['produto_id']),
+            anterior['produto_id'],
+            anterior['data_pedido'],
+            anterior['status'],
+            -anterior['valor_total'],
+            -1
+        )
+        VendaMensal.registrar(
+            instance.produto.fornecedor_id,
+            instance.produto_id,
+            instance.data_pedido,
+            anterior['status'],
+            instance.valor_total,
+            1
+        )
+    if anterior['status'] != instance.status:
+        pedido_status_alterado.send(sender=Pedido, alteracoes=[(instance, anterior['status'])])
+
+
+@receiver(pedido_status_alterado)
+def mover_venda_mensal(sender, alteracoes, **kwargs):
+    # Agrupa por produto/mês/status para fazer um UPDATE por grupo em atualizações em lote
+    deltas = defaultdict(lambda: [0, 0])
+    for pedido, status_anterior in alteracoes:
+        mes = timezone.localtime(pedido.data_pedido).date().replace(day=1)
+        chave = (pedido.produto.fornecedor_id, pedido.produto_id, mes)
+        deltas[chave + (status_anterior,)][0] -= pedido.valor_total
+        deltas[chave + (status_anterior,)][1] -= 1
+        deltas[chave + (pedido.status,)][0] += pedido.valor_total
+        deltas[chave + (pedido.status,)][1] += 1
+    for (fornecedor_id, produto_id, mes, status), (receita, pedidos) in deltas.items():
+        if pedidos or receita:
+            VendaMensal.registrar(fornecedor_id, produto_id, mes, status, receita, pedidos)
+
+
+@receiver(post_delete, sender=Pedido)
+def remover_venda_mensal(sender, instance, origin=None, **kwargs):
+    if not _exclusao_direta(origin, Pedido):
+        return
+    VendaMensal.registrar(
+        instance.produto.fornecedor_id,
+        instance.produto_id,
+        instance.data_pedido,
+        instance.status,
+        -instance.valor_total,
+        -1
+    )
+
+
+# Resumo de avaliações --------------------------------------------------------------------------
+
+@receiver(pre_save, sender=Avaliacao)
+def guardar_nota_anterior(sender, instance, **kwargs):
+    instance._nota_anterior = None
+    if instance.pk:
+        instance._nota_anterior = Avaliacao.objects.filter(pk=instance.pk).values('fornecedor_id', 'nota').first()
+
+
+@receiver(post_save, sender=Avaliacao)
+def atualizar_resumo_avaliacoes(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, '_nota_anterior', None)
+    if anterior and (anterior['fornecedor_id'], anterior['nota']) == (instance.fornecedor_id, instance.nota):
+        return
+    with transaction.atomic():
+        if anterior:
+            ResumoAvaliacoes.registrar(anterior['fornecedor_id'], anterior['nota'], -1)
+        ResumoAvaliacoes.registrar(instance.fornecedor_id, instance.nota)
+
+
+@receiver(post_delete, sender=Avaliacao)
+def remover_do_resumo_avaliacoes(sender, instance, **kwargs):
+    # Também em cascata (pedido ou comprador excluído); se o fornecedor sai, o resumo já não existe
+    ResumoAvaliacoes.registrar(instance.fornecedor_id, instance.nota, -1)
+
+
+# Cache de relatórios ----------------------------------------------------------------------------
+
+@receiver(post_save, sender=Pedido)
+@receiver(post_delete, sender=Pedido)
+def invalidar_relatorio_pedido(sender, instance, **kwargs):
+    cache_relatorios.invalidar(instance.produto.fornecedor_id)
+
+
+@receiver(pedido_status_alterado)
+def invalidar_relatorio_status(sender, alteracoes, **kwargs):
+    for fornecedor_id in {pedido.produto.fornecedor_id for pedido, _ in alteracoes}:
+        cache_relatorios.invalidar(fornecedor_id)
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+@receiver(post_save, sender=Avaliacao)
+@receiver(post_delete, sender=Avaliacao)
+def invalidar_relatorio(sender, instance, **kwargs):
+    cache_relatorios.invalidar(instance.fornecedor_id)
+
+
+@receiver(produtos_importados)
+def invalidar_relatorio_importacao(sender, fornecedor, **kwargs):
+    cache_relatorios.invalidar(fornecedor.id)
+
+
+# Cache de fragmentos do catálogo ----------------------------------------------------------------
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+def invalidar_fragmentos_produto(sender, instance, **kwargs):
+    catalogo.invalidar_produtos([instance.pk])
+
+
+@receiver(produtos_importados)
+def invalidar_fragmentos_importacao(sender, produtos, **kwargs):
+    catalogo.invalidar_produtos([produto.pk for produto in produtos])
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_fragmentos_categoria(sender, instance, **kwargs):
+    # Também cobre a exclusão, que põe categoria = NULL nos produtos com um UPDATE, sem post_save
+    catalogo.invalidar_categorias()
+
+
+# Índices de Meta.indexes em tabelas criadas antes deles (ver core.indices) ----------------------
+
+@receiver(post_migrate)
+def criar_indices_ausentes(sender, using, **kwargs):
+    if sender.name == 'core':
+        indices.criar_ausentes(using)
+
+
+# Conexões ---------------------------------------------------------------------------------------
+
+@receiver(connection_created)
+def limite_de_parametros_sqlite(sender, connection, **kwargs):
+    # O Django supõe o limite de 999 parâmetros por consulta das versões antigas do SQLite e
+    # divide bulk_create/bulk_update em vários INSERT/UPDATE de ~100 linhas; o limite real
+    # da biblioteca (32766 por padrão desde o SQLite 3.32) permite um comando por lote
+    if connection.vendor == 'sqlite':
+        connection.features.max_query_params = connection.connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+
+
+# Índice de busca de produtos --------------------------------------------------------------------
+
+@receiver(post_migrate)
+def preparar_busca_produtos(sender, using, **kwargs):
+    if sender.name == 'core':
+        busca_produtos(using).preparar()
+
+
+@receiver(post_save, sender=Produto)
+def indexar_produto(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        busca_produtos(using).indexar([instance])
+
+
+@receiver(produtos_importados)
+def indexar_produtos_importados(sender, produtos, **kwargs):
+    busca_produtos().indexar(produtos)
+
+
+@receiver(post_delete, sender=Produto)
+def remover_produto_da_busca(sender, instance, using=None, **kwargs):
+    busca_produtos(using).remover([instance.pk])
+
+
+@receiver(post_save, sender=Categoria)
+def reindexar_categoria(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        busca_produtos(using).indexar(instance.produto_set.select_related('categoria'))
+
+
+@receiver(pre_delete, sender=Categoria)
+def guardar_produtos_da_categoria(sender, instance, **kwargs):
+    instance._produtos_ids = list(instance.produto_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Categoria)
+def reindexar_produtos_sem_categoria(sender, instance, using=None, **kwargs):
+    ids = getattr(instance, '_produtos_ids', [])
+    busca_produtos(using).indexar(Produto.objects.using(using).filter(id__in=ids).select_related('categoria'))
+
+
+# Resumo de conversas ----------------------------------------------------------------------------
+
+@receiver(post_save, sender=Mensagem)
+def atualizar_conversa(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Conversa.registrar_mensagem(instance)
+
+
+@receiver(post_delete, sender=Mensagem)
+def recalcular_conversa(sender, instance, origin=None, **kwargs):
+    if _exclusao_direta(origin, Mensagem):
+        Conversa.recalcular(instance.remetente_id, instance.destinatario_id)
+
+
+# Contadores dos badges (core.contadores) ------------------------------------------------------
+# Antes dos eventos em tempo real: os on_commit rodam na ordem, e publicar_nao_lidas lê o contador
+
+@receiver(post_save, sender=Mensagem)
+def contar_mensagem_nao_lida(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not instance.lida:
+        contadores.somar(instance.destinatario_id, 'nao_lidas', 1)
+
+
+@receiver(post_delete, sender=Mensagem)
+def descontar_mensagem_nao_lida(sender, instance, **kwargs):
+    if not instance.lida:
+        contadores.somar(instance.destinatario_id, 'nao_lidas', -1)
+
+
+def _somar_pendente(pedido, delta):
+    contadores.somar(pedido.comprador_id, 'pendentes_comprador', delta)
+    contadores.somar(pedido.produto.fornecedor_id, 'pendentes_fornecedor', delta)
+
+
+@receiver(post_save, sender=Pedido)
+def contar_pedido_pendente(sender, instance, created, raw=False, **kwargs):
+    # Mudanças de status chegam por pedido_status_alterado
+    if created and not raw and instance.status == 'pendente':
+        _somar_pendente(instance, 1)
+
+
+@receiver(pedido_status_alterado)
+def recontar_pedidos_pendentes(sender, alteracoes, **kwargs):
+    for pedido, status_anterior in alteracoes:
+        delta = (pedido.status == 'pendente') - (status_anterior == 'pendente')
+        if delta:
+            _somar_pendente(pedido, delta)
+
+
+@receiver(post_delete, sender=Pedido)
+def descontar_pedido_pendente(sender, instance, **kwargs):
+    # Também em cascata: os pedidos saem antes do produto, que ainda pode ser lido
+    if instance.status == 'pendente':
+        _somar_pendente(instance, -1)
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+def recontar_estoque_baixo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        contadores.descartar(instance.fornecedor_id, 'estoque_baixo')
+
+
+@receiver(produtos_importados)
+def recontar_estoque_baixo_importacao(sender, fornecedor, **kwargs):
+    contadores.descartar(fornecedor.id, 'estoque_baixo')
+
+
+# Eventos em tempo real --------------------------------------------------------------------------
+
+@receiver(post_save, sender=Mensagem)
+def publicar_mensagem(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    dados = {
+        'id': instance.id,
+        'remetente_id': instance.remetente_id,
+        'destinatario_id': instance.destinatario_id,
+        'conteudo': instance.conteudo,
+        'data_envio': instance.data_envio,
+    }
+    eventos.publicar(instance.destinatario_id, 'mensagem', **dados)
+    eventos.publicar(instance.remetente_id, 'mensagem', **dados)
+    eventos.publicar_nao_lidas(instance.destinatario_id)
+
+
+@receiver(post_save, sender=Pedido)
+def publicar_novo_pedido(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        eventos.publicar(instance.produto.fornecedor_id, 'pedido', id=instance.id, status=instance.status, status_anterior=None)
+
+
+@receiver(pedido_status_alterado)
+def publicar_status_pedido(sender, alteracoes, **kwargs):
+    for pedido, status_anterior in alteracoes:
+        for perfil_id in (pedido.comprador_id, pedido.produto.fornecedor_id):
+            eventos.publicar(perfil_id, 'pedido', id=pedido.id, status=pedido.status, status_anterior=status_anterior)
+
+
+# Usuário da sessão em cache (core.autenticacao.PerfilBackend) -----------------------------------
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_usuario_em_cache(sender, instance, **kwargs):
+    invalidar_usuario(instance.pk)
+
+
+@receiver(post_save, sender=Perfil)
+@receiver(post_delete, sender=Perfil)
+def invalidar_perfil_em_cache(sender, instance, **kwargs):
+    # Inclui o PerfilForm salvo em configuracoes
+    invalidar_usuario(instance.usuario_id)
+
+
+# Métricas ---------------------------------------------------------------------------------------
+
+@receiver(pedido_status_alterado)
+def contar_transicoes_de_status(sender, alteracoes, **kwargs):
+    transicoes = [(status_anterior, pedido.status) for pedido, status_anterior in alteracoes]
+
+    def contar():
+        for de, para in transicoes:
+            metricas.TRANSICOES_PEDIDO.somar(de=de, para=para)
+
+    # Só conta o que foi gravado; fora de transação on_commit executa na hora
+    transaction.on_commit(contar)
@@ -0,0 +1,49 @@
+# cache_catalogo.py
+"""
+{% cache %} do Django com acertos e falhas contados em core.metricas (cache 'fragmentos').
+
+Mesma sintaxe da tag original; os templates do catálogo carregam esta biblioteca no lugar
+de `cache`. A falha é reconhecida pelo conteúdo ter sido renderizado.
+
+O conteúdo de uma falha é renderizado com as leituras no banco principal (ver
+core.replicas.ler_do_primario): numa view com @leitura_na_replica, logo depois de uma troca
+de versão, uma réplica atrasada poria o catálogo antigo no cache com a chave nova. Para isso
+os dados do fragmento devem ser consultas preguiçosas, avaliadas só dentro da tag.
+"""
+from django.template import Library, NodeList
+from django.templatetags import cache
+
+from ..metricas import contar_cache
+from ..replicas import ler_do_primario
+
+register = Library()
+
+
+class _Conteudo(NodeList):
+    # Só é renderizado quando o fragmento não estava no cache
+    def __init__(self, nodelist, no):
+        super().__init__(nodelist)
+        self.no = no
+
+    def render(self, context):
+        context.render_context[self.no] = True
+        with ler_do_primario():
+            return super().render(context)
+
+
+class CacheContado(cache.CacheNode):
+    def __init__(self, nodelist, *args):
+        super().__init__(_Conteudo(nodelist, self), *args)
+
+    def render(self, context):
+        # render_context é de cada renderização; o push isola fragmentos aninhados
+        with context.render_context.push():
+            valor = super().render(context)
+            contar_cache('fragmentos', self not in context.render_context)
+        return valor
+
+
+@register.tag('cache')
+def do_cache(parser, token):
+    no = cache.do_cache(parser, token)
+    return CacheContado(no.nodelist, no.expire_time_var, no.fragment_name, no.vary_on, no.cache_name)
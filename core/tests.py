@@ -1,3 +1,1641 @@
-from django.test import TestCase
+import multiprocessing
+import asyncio
+import base64
+import contextlib
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from datetime import date, datetime, time
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from agroconnect.banco import banco_do_ambiente
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.template import engines
+from django.template.loaders import cached
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import carga, contadores, estoque, eventos, importacao, indices, metricas, perfilador, replicas, views
+from .busca import busca_produtos
+from .cache import CacheRelatorios, cache_relatorios
+from .instrumentacao import OrcamentoExcedido, orcamento_de_consultas
+from .middleware import InstrumentacaoSQLMiddleware, PerfiladorMiddleware
+from .models import (
+    Avaliacao, Categoria, Conversa, Mensagem, Pedido, Perfil, Produto, ProdutoBusca, ResumoAvaliacoes, VendaMensal,
+)
+from .paginacao import PaginadorKeyset
+from .series import serie_receita
 
-# Create your tests here.
+
+# "SCAN tabela" sem índice; "SCAN ... VIRTUAL TABLE" é a busca FTS5 e usa o próprio índice
+VARREDURA_COMPLETA = re.compile(r'^SCAN (\w+)\b(?! VIRTUAL TABLE)')
+
+# Tabelas listadas inteiras de propósito (menus de seleção), não por falta de índice
+TABELAS_LISTADAS_INTEIRAS = {'core_categoria', 'core_perfil'}
+
+
+class DadosDeExemplo(TestCase):
+    """Fornecedores, compradores, produtos, pedidos, avaliações e mensagens para os testes de views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nome='Grãos')
+        cls.fornecedores = [cls._perfil(f'fornecedor{i}', 'fornecedor') for i in range(3)]
+        cls.compradores = [cls._perfil(f'comprador{i}', 'comprador') for i in range(3)]
+        cls.fornecedor, cls.comprador = cls.fornecedores[0], cls.compradores[0]
+
+        for fornecedor in cls.fornecedores:
+            for i in range(5):
+                produto = Produto.objects.create(
+                    fornecedor=fornecedor, categoria=cls.categoria, nome=f'Feijão {fornecedor.id}-{i}',
+                    descricao='feijão carioca', preco=10, quantidade=i * 5
+                )
+                for comprador in cls.compradores:
+                    pedido = Pedido.objects.create(produto=produto, comprador=comprador, quantidade=1, valor_total=10)
+                    if i % 2:
+                        pedido.status = 'entregue'
+                        pedido.save()
+                        Avaliacao.objects.create(pedido=pedido, avaliador=comprador, fornecedor=fornecedor, nota=i)
+                    Mensagem.objects.create(remetente=comprador, destinatario=fornecedor, conteudo='Olá')
+                    Mensagem.objects.create(remetente=fornecedor, destinatario=comprador, conteudo='Oi')
+        cls.pedido = Pedido.objects.filter(comprador=cls.comprador).first()
+        cls.produto = cls.pedido.produto
+
+    @classmethod
+    def _perfil(cls, username, tipo):
+        usuario = User.objects.create_user(username=username, password='senha')
+        return Perfil.objects.create(usuario=usuario, tipo=tipo, telefone='1', endereco='Rua A')
+
+    def setUp(self):
+        # Os contadores dos badges ficam em cache por id de perfil, e os ids se repetem entre testes.
+        # Recontados, como em produção depois da primeira leitura
+        caches['contadores'].clear()
+        contadores.reconciliar()
+
+
+class VendaMensalTests(DadosDeExemplo):
+    """O consolidado mensal acompanha os pedidos a cada criação, mudança de status e exclusão."""
+
+    def _consolidado(self, produto):
+        return {
+            venda.status: (venda.receita, venda.total_pedidos)
+            for venda in VendaMensal.objects.filter(produto=produto) if venda.total_pedidos
+        }
+
+    def _dos_pedidos(self, produto):
+        return {
+            linha['status']: (linha['receita'], linha['total'])
+            for linha in produto.pedidos.values('status').annotate(receita=Sum('valor_total'), total=Count('id'))
+        }
+
+    def test_deltas_de_criacao_status_e_exclusao(self):
+        produto = self.produto
+        self.assertEqual(self._consolidado(produto), self._dos_pedidos(produto))
+
+        pedido = Pedido.objects.create(produto=produto, comprador=self.comprador, quantidade=2, valor_total=25)
+        self.assertEqual(self._consolidado(produto), self._dos_pedidos(produto))
+
+        pedido.status = 'aceito'
+        pedido.save()
+        self.assertEqual(self._consolidado(produto)['aceito'], (Decimal('25'), 1))
+        self.assertEqual(self._consolidado(produto), self._dos_pedidos(produto))
+
+        pedido.delete()
+        self.assertNotIn('aceito', self._consolidado(produto))
+        self.assertEqual(self._consolidado(produto), self._dos_pedidos(produto))
+
+    def test_serie_mensal_do_dashboard(self):
+        mes = timezone.localdate()
+        serie = VendaMensal.serie_mensal(self.fornecedor, [(mes.year, mes.month)])
+        receita = Pedido.objects.filter(produto__fornecedor=self.fornecedor).aggregate(total=Sum('valor_total'))['total']
+        self.assertEqual(serie[(mes.year, mes.month)]['receita'], receita)
+
+
+class SerieReceitaTests(DadosDeExemplo):
+
+    def test_periodos_sem_pedidos_preenchidos_com_zero(self):
+        inicio = date(2024, 3, 1)
+        pedidos = list(Pedido.objects.filter(produto__fornecedor=self.fornecedor).order_by('id')[:3])
+        for pedido, dia in zip(pedidos, (1, 4, 4)):
+            data = timezone.make_aware(datetime.combine(date(2024, 3, dia), time(12)))
+            Pedido.objects.filter(pk=pedido.pk).update(data_pedido=data)
+
+        serie = serie_receita(self.fornecedor, inicio, date(2024, 3, 5), 'dia')
+        self.assertEqual([ponto['periodo'] for ponto in serie], [date(2024, 3, dia) for dia in range(1, 6)])
+        self.assertEqual([ponto['pedidos'] for ponto in serie], [1, 0, 0, 2, 0])
+        self.assertEqual(serie[3]['receita'], sum(pedido.valor_total for pedido in pedidos[1:]))
+        self.assertEqual(serie[1]['ticket_medio'], 0)
+
+        mensal = serie_receita(self.fornecedor, date(2024, 1, 15), date(2024, 3, 5), 'mes')
+        self.assertEqual([ponto['periodo'] for ponto in mensal], [date(2024, mes, 1) for mes in (1, 2, 3)])
+        self.assertEqual([ponto['pedidos'] for ponto in mensal], [0, 0, 3])
+
+    def test_api_rejeita_parametros_invalidos(self):
+        self.client.force_login(self.fornecedor.usuario)
+        url = reverse('serie_receita_api')
+        for parametros in (
+            {'granularidade': 'hora'},
+            {'inicio': '2024-03-10', 'fim': '2024-03-01'},
+            {'inicio': '10/03/2024'},
+            {'inicio': '2000-01-01', 'fim': '2024-01-01', 'granularidade': 'dia'},
+        ):
+            with self.subTest(**parametros):
+                resposta = self.client.get(url, parametros)
+                self.assertEqual(resposta.status_code, 400)
+                self.assertIn('erro', resposta.json())
+
+        serie = self.client.get(url, {'granularidade': 'semana', 'inicio': '2024-03-01', 'fim': '2024-03-31'}).json()['serie']
+        self.assertEqual([ponto['periodo'] for ponto in serie], ['2024-02-26', '2024-03-04', '2024-03-11', '2024-03-18', '2024-03-25'])
+
+        self.client.force_login(self.comprador.usuario)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class CacheRelatoriosTests(DadosDeExemplo):
+
+    def setUp(self):
+        super().setUp()
+        caches['relatorios'].clear()
+        self.addCleanup(caches['relatorios'].clear)
+
+    def _em_cache(self, fornecedor_id):
+        return caches['relatorios'].get(f'relatorio:{fornecedor_id}') is not None
+
+    def test_invalidado_pelos_sinais_e_de_novo_no_commit(self):
+        self.client.force_login(self.fornecedor.usuario)
+        self.client.get(reverse('relatorios'))
+        self.assertTrue(self._em_cache(self.fornecedor.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto.nome = 'Feijão preto'
+            self.produto.save()
+            self.assertFalse(self._em_cache(self.fornecedor.id))
+            # Uma requisição concorrente gera o relatório com os dados de antes do commit
+            cache_relatorios.obter(self.fornecedor.id, lambda: {'antigo': True})
+        self.assertFalse(self._em_cache(self.fornecedor.id))
+
+        self.client.get(reverse('relatorios'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Pedido.objects.create(produto=self.produto, comprador=self.comprador, quantidade=1, valor_total=10)
+        self.assertFalse(self._em_cache(self.fornecedor.id))
+
+    def test_descarta_o_menos_usado(self):
+        cache = CacheRelatorios(max_entradas=2, intervalo_uso=0)
+        for fornecedor_id in (1, 2, 1, 3):
+            cache.obter(fornecedor_id, lambda: {'fornecedor': fornecedor_id})
+        self.assertEqual([self._em_cache(f) for f in (1, 2, 3)], [True, False, True])
+
+    def test_acerto_nao_regrava_o_indice(self):
+        cache = CacheRelatorios(max_entradas=2, intervalo_uso=60)
+        cache.obter(1, lambda: {'fornecedor': 1})
+        with mock.patch.object(cache.cache, 'set', wraps=cache.cache.set) as gravacoes:
+            for _ in range(3):
+                self.assertEqual(cache.obter(1, lambda: self.fail('deveria vir do cache')), {'fornecedor': 1})
+        gravacoes.assert_not_called()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Sem acentos só no índice FTS5 do SQLite (no Postgres depende de unaccent).')
+class BuscaProdutosTests(DadosDeExemplo):
+
+    def test_busca_ignora_acentos(self):
+        ids = set(Produto.objects.values_list('id', flat=True))
+        self.assertEqual(set(busca_produtos().buscar('feijao')), ids)
+        self.assertEqual(set(busca_produtos().buscar('FEIJÃO carioca')), ids)
+        self.assertEqual(busca_produtos().buscar('soja'), [])
+
+        self.client.force_login(self.comprador.usuario)
+        resposta = self.client.get(reverse('listar_produtos'), {'search': 'feijao'})
+        self.assertTrue(resposta.context['page_obj'])
+        self.assertContains(resposta, 'Feijão')
+
+    def test_reindexa_ao_salvar_e_excluir(self):
+        self.produto.nome = 'Lentilha'
+        self.produto.descricao = 'lentilha vermelha'
+        self.produto.save()
+        busca = busca_produtos()
+        self.assertEqual(busca.buscar('lentilha'), [self.produto.id])
+        self.assertNotIn(self.produto.id, busca.buscar('feijao'))
+
+        self.categoria.nome = 'Leguminosas'
+        self.categoria.save()
+        self.assertEqual(len(busca.buscar('leguminosas')), Produto.objects.count())
+
+        self.produto.delete()
+        self.assertEqual(busca.buscar('lentilha'), [])
+
+    def test_vetor_do_postgres_fora_do_sqlite(self):
+        # ProdutoBusca (vetor com índice GIN) só existe no PostgreSQL; a exclusão não a consulta
+        self.assertNotIn(ProdutoBusca._meta.db_table, connection.introspection.table_names())
+        self.assertEqual(indices.ausentes(), [])
+        with CaptureQueriesContext(connection) as consultas:
+            self.produto.delete()
+        self.assertFalse(any(ProdutoBusca._meta.db_table in consulta['sql'] for consulta in consultas))
+
+
+class PaginacaoKeysetTests(DadosDeExemplo):
+
+    def setUp(self):
+        super().setUp()
+        # Todos os pedidos do comprador no mesmo instante: o desempate é pelo id
+        Pedido.objects.filter(comprador=self.comprador).update(data_pedido=timezone.now())
+        self.pedidos = Pedido.objects.filter(comprador=self.comprador)
+        self.ids = list(self.pedidos.order_by('-id').values_list('id', flat=True))
+        self.paginador = PaginadorKeyset(self.pedidos, ('-data_pedido', '-id'), por_pagina=4)
+
+    def test_proximas_e_anteriores(self):
+        paginas, pagina = [], self.paginador.pagina()
+        self.assertFalse(pagina.has_previous)
+        while True:
+            paginas.append([pedido.id for pedido in pagina])
+            if not pagina.has_next:
+                break
+            pagina = self.paginador.pagina(pagina.cursor_proximo)
+        self.assertEqual([len(ids) for ids in paginas], [4, 4, 4, 3])
+        self.assertEqual(sum(paginas, []), self.ids)
+
+        voltando = []
+        while pagina.has_previous:
+            pagina = self.paginador.pagina(pagina.cursor_anterior)
+            voltando.append([pedido.id for pedido in pagina])
+        self.assertEqual(voltando, paginas[-2::-1])
+
+    def test_cursor_invalido_volta_para_a_primeira_pagina(self):
+        adulterados = [
+            'nao-e-base64!',
+            base64.urlsafe_b64encode(b'{"d":"p","v":["abc","xyz"]}').decode(),
+            base64.urlsafe_b64encode(b'{"d":"x","v":[]}').decode(),
+            base64.urlsafe_b64encode(b'[1, 2]').decode(),
+        ]
+        for cursor in adulterados:
+            with self.subTest(cursor=cursor):
+                self.assertEqual([pedido.id for pedido in self.paginador.pagina(cursor)], self.ids[:4])
+
+        self.client.force_login(self.comprador.usuario)
+        resposta = self.client.get(reverse('meus_pedidos'), {'cursor': adulterados[1]})
+        self.assertEqual(resposta.status_code, 200)
+
+
+class ConversaTests(DadosDeExemplo):
+
+    def _conversa(self):
+        return Conversa._filtro_par(self.fornecedor.id, self.comprador.id).get()
+
+    def _resumos(self):
+        return set(Conversa.objects.values_list(
+            'perfil_a_id', 'perfil_b_id', 'ultima_mensagem_id', 'nao_lidas_a', 'nao_lidas_b'
+        ))
+
+    def test_contadores_de_nao_lidas(self):
+        conversa = self._conversa()
+        self.assertEqual((conversa.nao_lidas_para(self.fornecedor), conversa.nao_lidas_para(self.comprador)), (5, 5))
+
+        mensagem = Mensagem.objects.create(remetente=self.comprador, destinatario=self.fornecedor, conteudo='Tem feijão?')
+        conversa = self._conversa()
+        self.assertEqual(conversa.ultima_mensagem_id, mensagem.id)
+        self.assertEqual(conversa.nao_lidas_para(self.fornecedor), 6)
+
+        self.client.force_login(self.fornecedor.usuario)
+        self.client.get(reverse('detalhes_conversa', args=[self.comprador.id]))
+        conversa = self._conversa()
+        self.assertEqual((conversa.nao_lidas_para(self.fornecedor), conversa.nao_lidas_para(self.comprador)), (0, 5))
+
+        mensagem.delete()
+        conversa = self._conversa()
+        self.assertNotEqual(conversa.ultima_mensagem_id, mensagem.id)
+        self.assertEqual(conversa.ultima_data, Mensagem.objects.get(pk=conversa.ultima_mensagem_id).data_envio)
+
+    def test_reconstruir_conversas(self):
+        Mensagem.objects.filter(destinatario=self.comprador).order_by('id').first().mark_as_read()
+        esperados = self._resumos()
+        self.assertEqual(len(esperados), 9)
+
+        Conversa.objects.all().delete()
+        call_command('reconstruir_conversas', stdout=StringIO())
+        self.assertEqual(self._resumos(), esperados)
+
+
+class HistoricoDeMensagensTests(DadosDeExemplo):
+
+    def setUp(self):
+        super().setUp()
+        Mensagem.objects.bulk_create([
+            Mensagem(remetente=self.comprador, destinatario=self.fornecedor, conteudo=f'Mensagem {i}', lida=True)
+            for i in range(40)
+        ])
+        self.ids = list(views._mensagens_da_conversa(self.comprador, self.fornecedor.id).order_by('id').values_list('id', flat=True))
+        self.client.force_login(self.comprador.usuario)
+
+    def test_janela_e_mensagens_anteriores(self):
+        resposta = self.client.get(reverse('detalhes_conversa', args=[self.fornecedor.id]))
+        recentes = [mensagem.id for mensagem in resposta.context['mensagens']]
+        self.assertEqual(recentes, self.ids[-views.MENSAGENS_POR_PAGINA:])
+        self.assertTrue(resposta.context['tem_anteriores'])
+
+        url = reverse('mensagens_anteriores', args=[self.fornecedor.id])
+        dados = self.client.get(url, {'antes': recentes[0]}).json()
+        self.assertEqual([mensagem['id'] for mensagem in dados['mensagens']] + recentes, self.ids)
+        self.assertFalse(dados['tem_anteriores'])
+        enviadas = set(Mensagem.objects.filter(remetente=self.comprador).values_list('id', flat=True))
+        self.assertEqual([mensagem['enviada'] for mensagem in dados['mensagens']],
+                         [mensagem['id'] in enviadas for mensagem in dados['mensagens']])
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'antes': 'x'}).status_code, 400)
+
+    def test_mensagens_novas(self):
+        url = reverse('mensagens_novas', args=[self.fornecedor.id])
+        self.assertEqual(self.client.get(url, {'depois': self.ids[-1]}).json(), {'mensagens': []})
+
+        nova = Mensagem.objects.create(remetente=self.fornecedor, destinatario=self.comprador, conteudo='Temos sim')
+        dados = self.client.get(url, {'depois': self.ids[-1]}).json()
+        self.assertEqual([(mensagem['id'], mensagem['enviada']) for mensagem in dados['mensagens']], [(nova.id, False)])
+        nova.refresh_from_db()
+        self.assertTrue(nova.lida)
+
+        self.assertEqual(self.client.get(url, {'depois': 'x'}).status_code, 400)
+
+
+class EventosTests(DadosDeExemplo):
+    """Barramento de eventos (core.eventos) e o stream SSE de /eventos/ sob ASGI."""
+
+    def _nova_mensagem(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Mensagem.objects.create(remetente=self.fornecedor, destinatario=self.comprador, conteudo='Novidade')
+
+    async def test_barramento(self):
+        barramento = eventos.BarramentoLocal()
+        with barramento.assinar(self.comprador.id) as assinatura:
+            self.assertTrue(barramento.tem_assinantes(self.comprador.id))
+            # Publicado de outra thread, entregue no loop da assinatura
+            await sync_to_async(barramento.publicar, thread_sensitive=False)(self.comprador.id, {'tipo': 'teste'})
+            self.assertEqual(await assinatura.proximo(timeout=1), {'tipo': 'teste'})
+            self.assertIsNone(await assinatura.proximo(timeout=0.01))
+        self.assertFalse(barramento.tem_assinantes(self.comprador.id))
+
+    async def test_mensagem_publica_mensagem_e_nao_lidas(self):
+        with eventos.barramento().assinar(self.comprador.id) as destinatario, \
+                eventos.barramento().assinar(self.fornecedor.id) as remetente:
+            mensagem = await sync_to_async(self._nova_mensagem)()
+            evento = await destinatario.proximo(timeout=1)
+            self.assertEqual((evento['tipo'], evento['id'], evento['conteudo']), ('mensagem', mensagem.id, 'Novidade'))
+            self.assertEqual(await destinatario.proximo(timeout=1), {'tipo': 'nao_lidas', 'total': 16})
+            self.assertEqual((await remetente.proximo(timeout=1))['id'], mensagem.id)
+            self.assertIsNone(await remetente.proximo(timeout=0.01))
+
+    async def test_stream_sse(self):
+        await sync_to_async(self.async_client.force_login)(self.comprador.usuario)
+        resposta = await self.async_client.get(reverse('eventos'))
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        fluxo = aiter(resposta.streaming_content)
+        self.assertEqual(await anext(fluxo), b'event: nao_lidas\ndata: {"tipo": "nao_lidas", "total": 15}\n\n')
+        self.assertTrue(eventos.barramento().tem_assinantes(self.comprador.id))
+
+        mensagem = await sync_to_async(self._nova_mensagem)()
+        self.assertTrue((await anext(fluxo)).startswith(f'event: mensagem\ndata: {{"tipo": "mensagem", "id": {mensagem.id},'.encode()))
+        self.assertEqual(await anext(fluxo), b'event: nao_lidas\ndata: {"tipo": "nao_lidas", "total": 16}\n\n')
+
+        # Cliente desconectado: o ASGIHandler cancela a tarefa que envia o stream
+        tarefa = asyncio.ensure_future(anext(fluxo))
+        await asyncio.sleep(0.01)
+        tarefa.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await tarefa
+        self.assertFalse(eventos.barramento().tem_assinantes(self.comprador.id))
+
+
+    # DOM mínimo para rodar o script de base.html no Node: badges, eventos do document e um
+    # EventSource que recebe os eventos da linha de comando
+    DOM_FALSO = """
+        const [badges, recebidos, script] = process.argv.slice(1);
+        const elementos = Object.entries(JSON.parse(badges)).map(([nome, b]) => {
+            const el = {nome, textContent: b.texto, classes: new Set(b.oculto ? ['d-none'] : [])};
+            el.classList = {toggle: (classe, ligar) => ligar ? el.classes.add(classe) : el.classes.delete(classe)};
+            return el;
+        });
+        const ouvintes = {};
+        global.CustomEvent = class { constructor(tipo, opcoes) { this.type = tipo; this.detail = opcoes.detail; } };
+        global.document = {
+            addEventListener: (tipo, f) => (ouvintes[tipo] = ouvintes[tipo] || []).push(f),
+            dispatchEvent: (e) => (ouvintes[e.type] || []).forEach((f) => f(e)),
+            querySelectorAll: (seletor) => {
+                const [, operador, valor] = seletor.match(/^\\[data-badge(\\^?)="(\\w+)"\\]$/);
+                return elementos.filter((el) => operador ? el.nome.startsWith(valor) : el.nome === valor);
+            },
+        };
+        const fontes = [];
+        global.window = global;
+        global.EventSource = class { constructor() { this.ouvintes = {}; fontes.push(this); }
+            addEventListener(tipo, f) { this.ouvintes[tipo] = f; } };
+        eval(script);
+        for (const [tipo, dados] of JSON.parse(recebidos)) {
+            fontes[0].ouvintes[tipo]({data: JSON.stringify(dados)});
+        }
+        console.log(JSON.stringify(Object.fromEntries(
+            elementos.map((el) => [el.nome, {texto: String(el.textContent), oculto: el.classes.has('d-none')}])
+        )));
+    """
+
+    @skipUnless(shutil.which('node'), 'O script da página roda no Node.js.')
+    def test_badges_atualizados_pelos_eventos(self):
+        self.async_client.force_login(self.fornecedor.usuario)
+        html = async_to_sync(self.async_client.get)(reverse('listar_pedidos')).content.decode()
+        script = next(trecho for trecho in re.findall(r'<script>(.*?)</script>', html, re.S) if 'new EventSource' in trecho)
+        badges = {
+            nome: {'texto': texto, 'oculto': 'd-none' in classes}
+            for classes, nome, texto in re.findall(r'<span class="([^"]*)" data-badge="(\w+)">(\d+)</span>', html)
+        }
+        self.assertEqual(set(badges), {'nao_lidas', 'pendentes_fornecedor', 'estoque_baixo'})
+
+        recebidos = [
+            ('nao_lidas', {'tipo': 'nao_lidas', 'total': 0}),
+            ('pedido', {'tipo': 'pedido', 'id': 1, 'status': 'pendente', 'status_anterior': None}),
+            ('pedido', {'tipo': 'pedido', 'id': 2, 'status': 'aceito', 'status_anterior': 'pendente'}),
+            ('pedido', {'tipo': 'pedido', 'id': 3, 'status': 'recusado', 'status_anterior': 'pendente'}),
+            ('pedido', {'tipo': 'pedido', 'id': 2, 'status': 'entregue', 'status_anterior': 'aceito'}),
+        ]
+        saida = subprocess.run(
+            ['node', '-e', self.DOM_FALSO, json.dumps(badges), json.dumps(recebidos), script],
+            capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(json.loads(saida), {
+            'nao_lidas': {'texto': '0', 'oculto': True},
+            'pendentes_fornecedor': {'texto': '8', 'oculto': False},
+            'estoque_baixo': {'texto': '2', 'oculto': False},
+        })
+
+class ProdutoComEstoque(DadosDeExemplo):
+    """Um produto com 20 unidades do fornecedor, para os testes de aceite."""
+
+    def setUp(self):
+        super().setUp()
+        self.milho = Produto.objects.create(
+            fornecedor=self.fornecedor, nome='Milho', descricao='milho', preco=5, quantidade=20
+        )
+
+    def _pedido(self, quantidade, comprador=None):
+        return Pedido.objects.create(
+            produto=self.milho, comprador=comprador or self.comprador, quantidade=quantidade, valor_total=quantidade * 5
+        )
+
+    def _estoque(self):
+        return Produto.objects.get(pk=self.milho.pk).quantidade
+
+
+class EstoqueTests(ProdutoComEstoque):
+
+    def test_sem_sobrevenda(self):
+        pedidos = [self._pedido(8) for _ in range(3)]
+        estoque.aceitar_pedido(pedidos[0].id, self.fornecedor)
+        estoque.aceitar_pedido(pedidos[1].id, self.fornecedor)
+        with self.assertRaises(estoque.EstoqueInsuficiente):
+            estoque.aceitar_pedido(pedidos[2].id, self.fornecedor)
+        self.assertEqual(self._estoque(), 4)
+        # O aceite sem estoque é desfeito por inteiro
+        self.assertEqual(Pedido.objects.get(pk=pedidos[2].pk).status, 'pendente')
+
+        with self.assertRaises(Pedido.DoesNotExist):
+            estoque.aceitar_pedido(pedidos[2].id, self.fornecedores[1])
+
+    def test_aceite_concorrente(self):
+        pedido = self._pedido(5)
+        baixar_estoque = estoque.baixar_estoque
+
+        def baixar_com_aceite_concorrente(produto_id, quantidade):
+            # Um segundo aceite chega depois do UPDATE do status e antes do commit do primeiro;
+            # no banco ele esperaria a trava da linha e veria o mesmo status
+            with self.assertRaises(estoque.PedidoJaProcessado):
+                estoque.aceitar_pedido(pedido.id, self.fornecedor)
+            return baixar_estoque(produto_id, quantidade)
+
+        with mock.patch.object(estoque, 'baixar_estoque', baixar_com_aceite_concorrente):
+            estoque.aceitar_pedido(pedido.id, self.fornecedor)
+        with self.assertRaises(estoque.PedidoJaProcessado):
+            estoque.aceitar_pedido(pedido.id, self.fornecedor)
+        self.assertEqual(self._estoque(), 15)
+        self.assertEqual(Pedido.objects.get(pk=pedido.pk).status, 'aceito')
+
+
+class PedidosEmLoteTests(ProdutoComEstoque):
+
+    def _lote(self, pedidos, decisao='aceitar'):
+        self.client.force_login(self.fornecedor.usuario)
+        return self.client.post(
+            reverse('processar_pedidos_lote'), {'decisao': decisao, 'pedidos': pedidos},
+            headers={'Accept': 'application/json'}
+        )
+
+    def test_resultado_por_pedido(self):
+        atendidos = [self._pedido(8), self._pedido(8)]
+        sem_estoque = self._pedido(8)
+        ja_aceito = self._pedido(1)
+        estoque.aceitar_pedido(ja_aceito.id, self.fornecedor)
+        de_outro = Pedido.objects.filter(produto__fornecedor=self.fornecedores[1], status='pendente').first()
+
+        resposta = self._lote([p.id for p in (sem_estoque, *atendidos, ja_aceito, de_outro)] + [0])
+        self.assertEqual(resposta.json()['resultados'], {
+            str(atendidos[0].id): 'aceito',
+            str(atendidos[1].id): 'aceito',
+            str(sem_estoque.id): 'estoque_insuficiente',
+            str(ja_aceito.id): 'ja_processado',
+            str(de_outro.id): 'nao_encontrado',
+            '0': 'nao_encontrado',
+        })
+        self.assertEqual(self._estoque(), 3)
+        self.assertEqual(Pedido.objects.get(pk=sem_estoque.pk).status, 'pendente')
+        self.assertEqual(Pedido.objects.get(pk=de_outro.pk).status, 'pendente')
+
+        resposta = self._lote([sem_estoque.id], 'recusar')
+        self.assertEqual(resposta.json()['resultados'], {str(sem_estoque.id): 'recusado'})
+        self.assertEqual(self._lote([], 'recusar').status_code, 400)
+
+    def test_conflito_de_estoque_desfaz_o_lote(self):
+        pedidos = [self._pedido(5), self._pedido(5)]
+        # O estoque mudou entre a leitura e a baixa
+        with mock.patch.object(estoque, 'baixar_estoque', return_value=False):
+            resposta = self._lote([p.id for p in pedidos])
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(list(Pedido.objects.filter(pk__in=[p.id for p in pedidos]).values_list('status', flat=True)),
+                         ['pendente', 'pendente'])
+        self.assertEqual(self._estoque(), 20)
+
+
+class ImportacaoTests(DadosDeExemplo):
+
+    def _importar(self, conteudo, nome='produtos.csv', **cabecalhos):
+        self.client.force_login(self.fornecedor.usuario)
+        return self.client.post(
+            reverse('importar_produtos'), {'arquivo': SimpleUploadedFile(nome, conteudo)}, headers=cabecalhos
+        )
+
+    def test_relatorio_de_erros_e_upsert(self):
+        alterado, igual = Produto.objects.filter(fornecedor=self.fornecedor).order_by('id')[:2]
+        linhas = [
+            'nome,descricao,preco,quantidade,categoria',
+            'Soja,soja em grão,50,100,Grãos',
+            f'{alterado.nome},nova descrição,12,7,grãos',
+            'Arroz,,abc,5,',
+            'Trigo,trigo,10,5,Inexistente',
+            f'{igual.nome},{igual.descricao},{igual.preco},{igual.quantidade},Grãos',
+        ]
+        resposta = self._importar('\n'.join(linhas).encode(), Accept='application/json')
+        resultado = resposta.json()
+        self.assertEqual(
+            {chave: resultado[chave] for chave in ('linhas', 'criados', 'atualizados', 'inalterados', 'total_erros')},
+            {'linhas': 5, 'criados': 1, 'atualizados': 1, 'inalterados': 1, 'total_erros': 2},
+        )
+        self.assertEqual([(erro['linha'], sorted(erro['erros'])) for erro in resultado['erros']],
+                         [(4, ['descricao', 'preco']), (5, ['categoria'])])
+        self.assertIsNone(resultado['interrupcao'])
+
+        alterado.refresh_from_db()
+        self.assertEqual((alterado.descricao, alterado.preco, alterado.quantidade), ('nova descrição', 12, 7))
+        soja = Produto.objects.get(fornecedor=self.fornecedor, nome='Soja')
+        self.assertEqual(soja.categoria, self.categoria)
+        self.assertIn(soja.id, busca_produtos().buscar('soja'))
+
+        # Reenviar o mesmo arquivo não cria duplicatas
+        resultado = self._importar('\n'.join(linhas).encode(), Accept='application/json').json()
+        self.assertEqual((resultado['criados'], resultado['atualizados'], resultado['inalterados']), (0, 0, 3))
+
+    def test_consultas_por_lote_e_nao_por_linha(self):
+        existentes = list(Produto.objects.filter(fornecedor=self.fornecedor))
+        self.client.force_login(self.fornecedor.usuario)
+        for novos in (1, 300):
+            linhas = ['nome,descricao,preco,quantidade,categoria'] + [
+                f'{produto.nome},descrição {novos},3,4,Grãos' for produto in existentes
+            ] + [f'Novo {novos}-{i},novo,1,1,grãos' for i in range(novos)]
+            arquivo = SimpleUploadedFile('produtos.csv', '\n'.join(linhas).encode())
+            # Sessão e usuário, categorias; no lote: produtos existentes, SAVEPOINT, INSERT, UPDATE,
+            # índice de busca e RELEASE
+            with self.assertNumQueries(9):
+                resultado = self.client.post(
+                    reverse('importar_produtos'), {'arquivo': arquivo}, headers={'Accept': 'application/json'}
+                ).json()
+            self.assertEqual((resultado['criados'], resultado['atualizados']), (novos, len(existentes)))
+
+    def test_arquivo_fora_de_utf8_mantem_o_resultado_parcial(self):
+        linhas = ['nome,descricao,preco,quantidade'] + [f'Produto {i},descrição {i},1,1' for i in range(1200)]
+        conteudo = '\n'.join(linhas).encode() + b'\nCaf\xe9,latin-1,1,1\n'
+
+        resultado = self._importar(conteudo, Accept='application/json').json()
+        self.assertGreaterEqual(resultado['criados'], importacao.TAMANHO_LOTE)
+        self.assertEqual(resultado['criados'], resultado['linhas'])
+        self.assertIn('UTF-8', resultado['interrupcao'])
+        self.assertEqual(Produto.objects.filter(nome__startswith='Produto ').count(), resultado['criados'])
+
+        resposta = self._importar(conteudo)
+        self.assertEqual(resposta.context['resultado'].inalterados, resultado['criados'])
+        self.assertIn(resultado['interrupcao'], resposta.context['form'].errors['arquivo'])
+
+
+class ExportacaoTests(DadosDeExemplo):
+
+    def _csv(self, tipo, **parametros):
+        self.client.force_login(self.fornecedor.usuario)
+        resposta = self.client.get(reverse('exportar', args=[tipo]), parametros)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta['Content-Type'], 'text/csv; charset=utf-8')
+        linhas = list(csv.reader(io.StringIO(b''.join(resposta.streaming_content).decode())))
+        return linhas[0], linhas[1:]
+
+    def test_pedidos_filtrados_e_so_do_fornecedor(self):
+        cabecalho, linhas = self._csv('pedidos', status='entregue')
+        self.assertEqual(cabecalho, ['id', 'data_pedido', 'produto', 'comprador', 'quantidade', 'valor_total', 'status'])
+        entregues = Pedido.objects.filter(produto__fornecedor=self.fornecedor, status='entregue')
+        self.assertEqual(sorted(int(linha[0]) for linha in linhas), sorted(entregues.values_list('id', flat=True)))
+        self.assertEqual({linha[6] for linha in linhas}, {'entregue'})
+        self.assertTrue(all(linha[2].startswith(f'Feijão {self.fornecedor.id}-') for linha in linhas))
+
+        antigo = entregues.first()
+        Pedido.objects.filter(pk=antigo.pk).update(data_pedido=timezone.make_aware(datetime(2020, 1, 5, 12)))
+        _, linhas = self._csv('pedidos', inicio='2020-01-01', fim='2020-01-31')
+        self.assertEqual([int(linha[0]) for linha in linhas], [antigo.id])
+
+    def test_parametros_invalidos(self):
+        self.client.force_login(self.fornecedor.usuario)
+        for parametros in ({'status': 'sumido'}, {'inicio': '2024-02-01', 'fim': '2024-01-01'}, {'inicio': 'ontem'}):
+            with self.subTest(**parametros):
+                self.assertEqual(self.client.get(reverse('exportar', args=['pedidos']), parametros).status_code, 400)
+        self.assertEqual(self.client.get(reverse('exportar', args=['clientes'])).status_code, 404)
+        self.client.force_login(self.comprador.usuario)
+        self.assertEqual(self.client.get(reverse('exportar', args=['pedidos'])).status_code, 403)
+
+    def test_produtos_com_as_colunas_da_importacao(self):
+        cabecalho, linhas = self._csv('produtos')
+        self.assertEqual(cabecalho, ['nome', 'descricao', 'preco', 'quantidade', 'estoque_minimo', 'categoria'])
+        self.assertEqual(len(linhas), Produto.objects.filter(fornecedor=self.fornecedor).count())
+
+        arquivo = io.StringIO()
+        csv.writer(arquivo).writerows([cabecalho] + linhas)
+        resultado = importacao.importar_produtos(
+            importacao.ler_linhas(io.BytesIO(arquivo.getvalue().encode()), 'csv'), self.fornecedor
+        )
+        self.assertEqual((resultado.inalterados, resultado.total_erros), (len(linhas), 0))
+
+    def test_receita_mensal(self):
+        cabecalho, linhas = self._csv('receita-mensal')
+        self.assertEqual(cabecalho, ['ano', 'mes', 'produto', 'status', 'pedidos', 'receita'])
+        pedidos = Pedido.objects.filter(produto__fornecedor=self.fornecedor)
+        self.assertEqual(sum(int(linha[4]) for linha in linhas), pedidos.count())
+        self.assertEqual(sum(Decimal(linha[5]) for linha in linhas), pedidos.aggregate(total=Sum('valor_total'))['total'])
+
+        _, linhas = self._csv('receita-mensal', status='pendente')
+        self.assertEqual({linha[3] for linha in linhas}, {'pendente'})
+
+
+class ResumoAvaliacoesTests(DadosDeExemplo):
+
+    def _resumo(self):
+        resumo = ResumoAvaliacoes.do_fornecedor(self.fornecedor)
+        return resumo.total, resumo.soma, [quantidade for _, quantidade, _ in resumo.histograma]
+
+    def test_criacao_alteracao_e_exclusao(self):
+        self.assertEqual(self._resumo(), (6, 12, [0, 0, 3, 0, 3]))
+
+        pedido = Pedido.objects.filter(produto__fornecedor=self.fornecedor, avaliacoes__isnull=True).first()
+        avaliacao = Avaliacao.objects.create(pedido=pedido, avaliador=pedido.comprador, fornecedor=self.fornecedor, nota=5)
+        self.assertEqual(self._resumo(), (7, 17, [1, 0, 3, 0, 3]))
+
+        avaliacao.nota = 2
+        avaliacao.save()
+        self.assertEqual(self._resumo(), (7, 14, [0, 0, 3, 1, 3]))
+
+        avaliacao.delete()
+        self.assertEqual(self._resumo(), (6, 12, [0, 0, 3, 0, 3]))
+
+        # Em cascata, pela exclusão do pedido
+        Avaliacao.objects.filter(fornecedor=self.fornecedor, nota=3).first().pedido.delete()
+        self.assertEqual(self._resumo(), (5, 9, [0, 0, 2, 0, 3]))
+
+        resumo = self._resumo()
+        ResumoAvaliacoes.recalcular([self.fornecedor.id])
+        self.assertEqual(self._resumo(), resumo)
+
+    def test_fornecedor_sem_avaliacoes(self):
+        novo = self._perfil('fornecedor_novo', 'fornecedor')
+        resumo = ResumoAvaliacoes.do_fornecedor(novo)
+        self.assertEqual((resumo.total, resumo.media), (0, 0))
+        self.assertFalse(ResumoAvaliacoes.objects.filter(fornecedor=novo).exists())
+
+        self.client.force_login(self.comprador.usuario)
+        resposta = self.client.get(reverse('perfil_fornecedor', args=[self.fornecedor.id]))
+        self.assertEqual(resposta.status_code, 200)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Os planos verificados são os do SQLite (EXPLAIN QUERY PLAN).')
+class PlanoDeConsultaTests(DadosDeExemplo):
+    """
+    Executa as views principais e roda EXPLAIN QUERY PLAN em cada SELECT emitido.
+    Falha se alguma consulta varrer uma tabela inteira.
+
+    O banco de teste não tem estatísticas (ANALYZE), então o SQLite planeja como se as tabelas
+    fossem grandes: o plano escolhido é o que valeria em produção.
+    """
+
+    def setUp(self):
+        # Contadores fora do cache: as contagens por perfil também são verificadas
+        caches['contadores'].clear()
+
+    def _varreduras(self, perfil, url):
+        self.client.force_login(perfil.usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url)
+            if resposta.streaming:
+                b''.join(resposta.streaming_content)
+        self.assertLess(resposta.status_code, 400, url)
+
+        varreduras = []
+        for consulta in consultas.captured_queries:
+            if not consulta['sql'].startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {consulta['sql']}")
+                for linha in cursor.fetchall():
+                    encontrado = VARREDURA_COMPLETA.match(linha[3])
+                    if encontrado and encontrado.group(1) not in TABELAS_LISTADAS_INTEIRAS:
+                        varreduras.append(f"{linha[3]}\n    {consulta['sql']}")
+        return varreduras
+
+    def _verificar(self, perfil, urls):
+        for url in urls:
+            with self.subTest(url=url):
+                varreduras = self._varreduras(perfil, url)
+                self.assertEqual(varreduras, [], 'Varredura completa de tabela:\n' + '\n'.join(varreduras))
+
+    def test_views_do_fornecedor(self):
+        self._verificar(self.fornecedor, [
+            reverse('dashboard'),
+            reverse('listar_pedidos'),
+            reverse('pedidos_pendentes'),
+            reverse('relatorios'),
+            reverse('serie_receita_api') + '?granularidade=dia',
+            reverse('listar_produtos'),
+            reverse('listar_produtos') + '?search=feijao',
+            reverse('mensagens'),
+            reverse('detalhes_conversa', args=[self.comprador.id]),
+            reverse('exportar', args=['pedidos']) + '?status=entregue&inicio=2020-01-01',
+            reverse('exportar', args=['produtos']),
+            reverse('exportar', args=['receita-mensal']),
+        ])
+
+    def test_views_do_comprador(self):
+        ultima = Mensagem.objects.filter(destinatario=self.comprador).order_by('id').first()
+        self._verificar(self.comprador, [
+            reverse('dashboard'),
+            reverse('meus_pedidos'),
+            reverse('meus_pedidos') + '?status=pendente',
+            reverse('listar_produtos'),
+            reverse('listar_produtos') + f'?categoria={self.categoria.id}',
+            reverse('detalhes_pedido', args=[self.pedido.id]),
+            reverse('perfil_fornecedor', args=[self.fornecedor.id]),
+            reverse('mensagens'),
+            reverse('detalhes_conversa', args=[self.fornecedor.id]),
+            reverse('mensagens_novas', args=[self.fornecedor.id]) + f'?depois={ultima.id}',
+        ])
+
+
+
+class CriarIndicesTests(TransactionTestCase):
+    """Banco criado antes de um índice de Meta.indexes: o syncdb não o cria, `criar_indices` sim."""
+
+    def test_cria_so_os_ausentes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX pedido_comprador_data')
+        saida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('criar_indices', '--verificar', stdout=saida)
+        self.assertIn('core_pedido: pedido_comprador_data (comprador, data_pedido)', saida.getvalue())
+
+        saida = StringIO()
+        call_command('criar_indices', stdout=saida)
+        self.assertIn('1 índices criados.', saida.getvalue())
+        call_command('criar_indices', '--verificar', stdout=StringIO())
+
+        # Idempotente: sem nada a criar na segunda vez
+        self.assertEqual(indices.criar_ausentes(), [])
+
+    def test_migrate_cria_os_ausentes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX mensagem_dest_rem_lida')
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        self.assertEqual(indices.ausentes(), [])
+
+
+class OrcamentoDeConsultasTests(DadosDeExemplo):
+    """
+    Orçamento de consultas por URL. Contam também a sessão e o usuário logado com o perfil
+    (2 consultas, ver core.autenticacao.PerfilBackend).
+    Nenhuma forma de consulta pode se repetir: repetição com os dados de exemplo indica N+1.
+    """
+
+    def _verificar(self, perfil, orcamentos):
+        self.client.force_login(perfil.usuario)
+        for url, maximo in orcamentos.items():
+            with self.subTest(url=url), orcamento_de_consultas(maximo=maximo, repeticoes=1):
+                resposta = self.client.get(url)
+                self.assertLess(resposta.status_code, 400, url)
+
+    def test_views_do_fornecedor(self):
+        self._verificar(self.fornecedor, {
+            reverse('dashboard'): 8,
+            reverse('listar_pedidos'): 3,
+            reverse('pedidos_pendentes'): 3,
+            reverse('relatorios'): 10,
+            reverse('serie_receita_api'): 3,
+            reverse('listar_produtos'): 5,
+            reverse('listar_produtos') + '?search=feijao': 7,
+            reverse('detalhes_produto', args=[self.produto.id]): 3,
+            reverse('editar_produto', args=[self.produto.id]): 3,
+            reverse('criar_produto'): 3,
+            reverse('importar_produtos'): 2,
+            reverse('mensagens'): 4,
+            reverse('detalhes_conversa', args=[self.comprador.id]): 6,
+            reverse('configuracoes'): 2,
+        })
+
+    def test_views_do_comprador(self):
+        self._verificar(self.comprador, {
+            reverse('dashboard'): 4,
+            reverse('meus_pedidos'): 3,
+            # Com o fragmento da grade fora do cache: a página e a grade relida no principal
+            reverse('listar_produtos'): 5,
+            reverse('detalhes_produto', args=[self.produto.id]): 3,
+            reverse('fazer_pedido', args=[self.produto.id]): 3,
+            reverse('detalhes_pedido', args=[self.pedido.id]): 3,
+            reverse('perfil_fornecedor', args=[self.fornecedor.id]): 5,
+            reverse('mensagens'): 4,
+            reverse('detalhes_conversa', args=[self.fornecedor.id]): 6,
+        })
+
+    def test_orcamento_excedido(self):
+        with self.assertRaises(OrcamentoExcedido):
+            with orcamento_de_consultas(repeticoes=1):
+                for produto in Produto.objects.all()[:3]:
+                    produto.fornecedor.usuario
+
+    def test_cabecalho_server_timing(self):
+        self.client.force_login(self.fornecedor.usuario)
+        with self.assertLogs('core.sql', 'INFO') as logs:
+            resposta = self.client.get(reverse('dashboard'))
+        self.assertRegex(resposta['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ consultas", app;dur=[\d.]+')
+        self.assertEqual(logs.records[-1].sql['view'], 'dashboard')
+
+
+class ComandosDeDadosTests(TestCase):
+    """Testes de fumaça dos comandos gerar_dados_exemplo e benchmark_views, em escala mínima."""
+
+    def test_gerar_dados_exemplo(self):
+        saida = StringIO()
+        call_command('gerar_dados_exemplo', '--escala', '0.01', stdout=saida)
+        self.assertIn('gerados', saida.getvalue())
+        perfis = dict(Perfil.objects.values_list('tipo').annotate(total=Count('id')))
+        self.assertEqual(perfis, {'fornecedor': 1, 'comprador': 2, 'transportador': 1})
+        self.assertEqual(Pedido.objects.count(), 200)
+        self.assertEqual(Mensagem.objects.count(), 100)
+        # Resumos recalculados no fim
+        self.assertEqual(
+            VendaMensal.objects.aggregate(total=Sum('total_pedidos'))['total'], Pedido.objects.count()
+        )
+        self.assertTrue(Conversa.objects.exists())
+
+        with self.assertRaisesMessage(CommandError, "prefixo 'demo'"):
+            call_command('gerar_dados_exemplo', '--escala', '0.01', stdout=StringIO())
+        call_command('gerar_dados_exemplo', '--escala', '0.01', '--prefixo', 'outro', stdout=StringIO())
+        self.assertEqual(Perfil.objects.count(), 8)
+
+    def test_benchmark_views(self):
+        # O banco de teste do runner faz o papel do descartável (um create_test_db aninhado trocaria o banco)
+        # O transportador fica de fora: as telas dele ainda não têm template (respondem 500)
+        opcoes = ['--escala', '0.01', '--repeticoes', '1', '--tipo', 'comprador', '--tipo', 'fornecedor',
+                  '--rota', 'dashboard', '--rota', 'detalhes_conversa', '--json']
+        with mock.patch('core.management.commands.benchmark_views.banco_de_teste',
+                        side_effect=lambda nome: contextlib.nullcontext()) as banco:
+            saida = StringIO()
+            call_command('benchmark_views', *opcoes, stdout=saida)
+            banco.assert_called_once_with('benchmark_views')
+            relatorio = json.loads(saida.getvalue())
+            self.assertEqual(set(relatorio['usuarios']), {'fornecedor', 'comprador'})
+            self.assertIn('comprador:detalhes_conversa', relatorio['resultados'])
+            for rota, resultado in relatorio['resultados'].items():
+                with self.subTest(rota=rota):
+                    self.assertEqual(resultado['status'], 200)
+                    self.assertGreater(resultado['consultas'], 0)
+
+            call_command('benchmark_views', *opcoes, '--banco-configurado', stdout=StringIO())
+            banco.assert_called_once()
+
+
+@override_settings(ALLOWED_HOSTS=[carga.HOST])
+class CargaTests(TransactionTestCase):
+    """
+    Os fluxos do teste de carga contra as aplicações WSGI e ASGI, com um usuário por vez:
+    o que se verifica aqui é a integração (sessão, CSRF, redirecionamentos), não a concorrência.
+    """
+
+    def setUp(self):
+        fornecedor = DadosDeExemplo._perfil('fornecedor', 'fornecedor')
+        self.comprador = DadosDeExemplo._perfil('comprador', 'comprador')
+        self.produto = Produto.objects.create(
+            fornecedor=fornecedor, nome='Milho', descricao='milho', preco=5, quantidade=100
+        )
+        Mensagem.objects.create(remetente=self.comprador, destinatario=fornecedor, conteudo='Olá')
+
+    def _rodar(self, servidor, papel):
+        usuarios = carga.preparar_usuarios({papel: 1}, pensar=0)
+        resultado = carga.SERVIDORES[servidor](usuarios, acoes=2).como_dict()
+        self.assertEqual(resultado['acoes'], 2)
+        self.assertEqual(resultado['erros'], 0, resultado['status'])
+        return resultado
+
+    def test_fluxos_de_pedido(self):
+        for servidor in carga.SERVIDORES:
+            with self.subTest(servidor=servidor):
+                self._rodar(servidor, 'comprador')
+                self.assertIn('POST aceitar_pedido', self._rodar(servidor, 'fornecedor')['passos'])
+        self.assertEqual(Pedido.objects.filter(comprador=self.comprador).count(), 4)
+        self.assertEqual(Pedido.objects.filter(status='aceito').count(), 4)
+
+    def test_fluxo_de_mensagens(self):
+        for servidor in carga.SERVIDORES:
+            with self.subTest(servidor=servidor):
+                self._rodar(servidor, 'mensagens')
+        self.assertEqual(Mensagem.objects.count(), 5)
+
+    def test_comando_usa_banco_de_teste(self):
+        # O banco de teste do runner faz o papel do descartável (um create_test_db aninhado trocaria o banco)
+        opcoes = ['--usuarios', '1', '--mix', 'comprador=1', '--servidor', 'wsgi', '--acoes', '1', '--pensar', '0', '--json']
+        with mock.patch('core.management.commands.teste_carga.banco_de_teste',
+                        side_effect=lambda nome: contextlib.nullcontext()) as banco:
+            saida = StringIO()
+            call_command('teste_carga', *opcoes, '--escala', '0.01', stdout=saida)
+            banco.assert_called_once_with('teste_carga')
+            # Dados gerados dentro do banco de teste
+            self.assertTrue(User.objects.filter(username__startswith='demo').exists())
+            self.assertEqual(json.loads(saida.getvalue())[0]['erros'], 0)
+
+            call_command('teste_carga', *opcoes, '--banco-configurado', stdout=StringIO())
+            banco.assert_called_once()
+
+    def test_mix(self):
+        self.assertEqual(
+            carga.distribuir(10, carga.ler_mix('comprador=6,fornecedor=2,mensagens=2')),
+            {'comprador': 6, 'fornecedor': 2, 'mensagens': 2}
+        )
+        self.assertEqual(carga.distribuir(3, carga.ler_mix('comprador,fornecedor')), {'comprador': 2, 'fornecedor': 1})
+        with self.assertRaises(ValueError):
+            carga.ler_mix('transportador=1')
+
+
+class PerfiladorTests(DadosDeExemplo):
+
+    def setUp(self):
+        super().setUp()
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+        self.fornecedor.usuario.is_staff = True
+        self.fornecedor.usuario.save()
+        ajustes = override_settings(PERFILADOR_ATIVO=True, PERFILADOR_TAXA=0, PERFILADOR_DIRETORIO=self.diretorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_desligado_sai_da_cadeia(self):
+        with override_settings(PERFILADOR_ATIVO=False), self.assertRaises(MiddlewareNotUsed):
+            PerfiladorMiddleware(lambda request: None)
+
+    def test_cabecalho_de_staff(self):
+        self.client.force_login(self.fornecedor.usuario)
+        resposta = self.client.get(reverse('dashboard'), headers={'X-Perfilar': '1'})
+        nome = resposta['X-Perfil']
+        self.assertRegex(nome, r'_GET_dashboard_200_\d+ms\.folded$')
+
+        with open(os.path.join(self.diretorio, nome)) as arquivo:
+            linhas = arquivo.read().splitlines()
+        # Formato collapsed: "frame;frame;frame peso"
+        for linha in linhas:
+            self.assertRegex(linha, r'^[^;]+(;[^;]+)* \d+$')
+        self.assertTrue(any('dashboard (core/views.py:' in linha for linha in linhas))
+
+        resposta = self.client.get(reverse('perfis_capturados'))
+        self.assertContains(resposta, reverse('baixar_perfil', args=[nome]))
+        resposta = self.client.get(reverse('baixar_perfil', args=[nome]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self.client.get(reverse('baixar_perfil', args=['..%2Fsettings.py'])).status_code, 404)
+
+    def test_cabecalho_ignorado_sem_staff(self):
+        self.client.force_login(self.comprador.usuario)
+        resposta = self.client.get(reverse('dashboard'), headers={'X-Perfilar': '1'})
+        self.assertNotIn('X-Perfil', resposta)
+        self.assertEqual(os.listdir(self.diretorio), [])
+        self.assertEqual(self.client.get(reverse('perfis_capturados')).status_code, 302)
+
+    def test_amostragem_e_rotacao(self):
+        self.client.force_login(self.comprador.usuario)
+        with override_settings(PERFILADOR_TAXA=1, PERFILADOR_MAX_ARQUIVOS=2):
+            for _ in range(3):
+                self.assertIn('X-Perfil', self.client.get(reverse('listar_produtos')))
+        self.assertEqual(len(perfilador.listar(self.diretorio)), 2)
+
+
+class MetricasTests(DadosDeExemplo):
+
+    def setUp(self):
+        super().setUp()
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio)
+        ajustes = override_settings(METRICAS_DIRETORIO=diretorio, METRICAS_TOKEN='')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _metricas(self):
+        resposta = self.client.get(reverse('metricas'))
+        self.assertEqual(resposta['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return resposta.content.decode()
+
+    def test_latencia_e_consultas_por_rota(self):
+        self.client.force_login(self.fornecedor.usuario)
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        texto = self._metricas()
+        self.assertIn('# TYPE agroconnect_requisicao_segundos histogram', texto)
+        self.assertIn('agroconnect_requisicao_segundos_bucket{metodo="GET",view="dashboard",le="+Inf"} 2', texto)
+        self.assertIn('agroconnect_requisicao_segundos_count{metodo="GET",view="dashboard"} 2', texto)
+        self.assertIn('agroconnect_respostas_total{status="200",view="dashboard"} 2', texto)
+        consultas = re.search(r'agroconnect_consultas_sql_total\{view="dashboard"\} (\d+)', texto)
+        self.assertGreater(int(consultas.group(1)), 0)
+
+    def test_buckets_acumulados(self):
+        historico = metricas.Histograma('teste_segundos', 'Teste.', buckets=(0.1, 1))
+        self.addCleanup(metricas.registro.metricas.remove, historico)
+        for valor in (0.05, 0.5, 0.5, 5):
+            historico.observar(valor)
+        linhas = list(historico.linhas(metricas.registro.coletar()))
+        self.assertEqual(linhas, [
+            'agroconnect_teste_segundos_bucket{le="0.1"} 1',
+            'agroconnect_teste_segundos_bucket{le="1"} 3',
+            'agroconnect_teste_segundos_bucket{le="+Inf"} 4',
+            'agroconnect_teste_segundos_sum 6.05',
+            'agroconnect_teste_segundos_count 4',
+        ])
+
+    def test_transicoes_de_status(self):
+        pedido = Pedido.objects.filter(status='pendente', produto__quantidade__gt=0).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            estoque.aceitar_pedido(pedido.id, pedido.produto.fornecedor)
+        self.assertIn('agroconnect_pedido_transicoes_total{de="pendente",para="aceito"} 1', self._metricas())
+
+    def test_acertos_de_cache(self):
+        self.client.force_login(self.fornecedor.usuario)
+        self.client.get(reverse('relatorios'))
+        self.client.get(reverse('relatorios'))
+        texto = self._metricas()
+        self.assertIn('agroconnect_cache_consultas_total{cache="relatorios",resultado="acerto"} 1', texto)
+        self.assertIn('agroconnect_cache_consultas_total{cache="relatorios",resultado="falha"} 1', texto)
+
+    def test_acertos_de_contadores_e_fragmentos(self):
+        caches['template_fragments'].clear()
+        caches['contadores'].delete(f'contador:{self.comprador.id}:nao_lidas')
+        self.client.force_login(self.comprador.usuario)
+        self.client.get(reverse('listar_produtos'))
+        self.client.get(reverse('listar_produtos'))
+        texto = self._metricas()
+        # Badges nao_lidas e pendentes_comprador nas duas páginas; só o recontado falha
+        self.assertIn('agroconnect_cache_consultas_total{cache="contadores",resultado="acerto"} 3', texto)
+        self.assertIn('agroconnect_cache_consultas_total{cache="contadores",resultado="falha"} 1', texto)
+        # Menu de categorias e grade: renderizados na primeira página, do cache na segunda
+        self.assertIn('agroconnect_cache_consultas_total{cache="fragmentos",resultado="acerto"} 2', texto)
+        self.assertIn('agroconnect_cache_consultas_total{cache="fragmentos",resultado="falha"} 2', texto)
+
+    def test_soma_entre_processos(self):
+        metricas.CACHE.somar(cache='teste', resultado='acerto')
+        # Cada processo grava no próprio arquivo; a exposição soma todos
+        processo = multiprocessing.get_context('fork').Process(
+            target=metricas.CACHE.somar, kwargs={'valor': 2, 'cache': 'teste', 'resultado': 'acerto'}
+        )
+        processo.start()
+        processo.join()
+        self.assertEqual(len(os.listdir(metricas.registro.diretorio)), 2)
+        self.assertIn('agroconnect_cache_consultas_total{cache="teste",resultado="acerto"} 3', self._metricas())
+
+    def test_token(self):
+        with override_settings(METRICAS_TOKEN='segredo'):
+            self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+            resposta = self.client.get(reverse('metricas'), headers={'Authorization': 'Bearer segredo'})
+            self.assertEqual(resposta.status_code, 200)
+
+
+class PerfilBackendTests(DadosDeExemplo):
+
+    def test_perfil_carregado_com_o_usuario(self):
+        self.client.force_login(self.comprador.usuario)
+        # Sessão + usuário com perfil; request.user.perfil não faz outra consulta
+        with self.assertNumQueries(2):
+            resposta = self.client.get(reverse('configuracoes'))
+        self.assertEqual(resposta.context['user'].perfil, self.comprador)
+
+    @override_settings(PERFIL_CACHE_TIMEOUT=60)
+    def test_cache_invalidado_ao_salvar_perfil(self):
+        self.client.force_login(self.comprador.usuario)
+        self.client.get(reverse('configuracoes'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('configuracoes'))
+
+        self.client.post(reverse('configuracoes'), {'telefone': '999', 'endereco': 'Rua B', 'tipo': 'comprador'})
+        resposta = self.client.get(reverse('configuracoes'))
+        self.assertEqual(resposta.context['user'].perfil.telefone, '999')
+
+    @override_settings(PERFIL_CACHE_TIMEOUT=60)
+    def test_troca_de_senha_encerra_a_sessao(self):
+        self.client.force_login(self.comprador.usuario)
+        self.client.get(reverse('configuracoes'))
+        usuario = User.objects.get(pk=self.comprador.usuario_id)
+        usuario.set_password('outra-senha')
+        usuario.save()
+        self.assertEqual(self.client.get(reverse('configuracoes')).status_code, 302)
+
+    def test_cadastro_faz_login_com_o_perfil_backend(self):
+        resposta = self.client.post(reverse('sign_up'), {
+            'username': 'novo', 'email': 'novo@example.com', 'tipo': 'comprador', 'telefone': '1',
+            'endereco': 'Rua C', 'password1': 'Senha-forte-123', 'password2': 'Senha-forte-123',
+        })
+        self.assertRedirects(resposta, reverse('dashboard'))
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], 'core.autenticacao.PerfilBackend')
+        self.assertEqual(self.client.get(reverse('dashboard')).context['user'].perfil.tipo, 'comprador')
+
+
+class CatalogoEmCacheTests(DadosDeExemplo):
+
+    def setUp(self):
+        super().setUp()
+        caches['template_fragments'].clear()
+        self.addCleanup(caches['template_fragments'].clear)
+
+    def _consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta, [consulta['sql'] for consulta in consultas]
+
+    def test_listagem_em_cache_nao_consulta_categorias(self):
+        self.client.force_login(self.comprador.usuario)
+        url = reverse('listar_produtos')
+        primeira, consultas = self._consultas(url)
+        self.assertTrue(any('FROM "core_categoria"' in sql for sql in consultas))
+        segunda, consultas = self._consultas(url)
+        self.assertFalse(any('FROM "core_categoria"' in sql for sql in consultas))
+        sem_csrf = lambda resposta: re.sub(r'name="csrfmiddlewaretoken" value="\w+"', '', resposta.content.decode())
+        self.assertEqual(sem_csrf(segunda), sem_csrf(primeira))
+
+    def test_alteracoes_no_catalogo_trocam_a_chave(self):
+        self.client.force_login(self.comprador.usuario)
+        url = reverse('listar_produtos')
+        self.client.get(url)
+
+        produto = Produto.objects.filter(quantidade__gt=0).order_by('-data_criacao', '-id').first()
+        produto.nome = 'Feijão preto'
+        produto.save()
+        self.assertContains(self.client.get(url), 'Feijão preto')
+
+        self.categoria.nome = 'Leguminosas'
+        self.categoria.save()
+        self.assertContains(self.client.get(url), 'Leguminosas')
+
+    def test_baixa_de_estoque_atualiza_a_pagina_do_produto(self):
+        self.client.force_login(self.comprador.usuario)
+        produto = Produto.objects.filter(quantidade__gt=0).first()
+        url = reverse('detalhes_produto', args=[produto.id])
+        self.assertContains(self.client.get(url), f'<strong>Estoque:</strong> {produto.quantidade}')
+        self.assertTrue(estoque.baixar_estoque(produto.id, 1))
+        self.assertContains(self.client.get(url), f'<strong>Estoque:</strong> {produto.quantidade - 1}')
+
+    def test_fragmentos_separados_por_tipo(self):
+        # Fornecedores e compradores veem os mesmos produtos com ações diferentes
+        url = reverse('listar_produtos')
+        self.client.force_login(self.fornecedor.usuario)
+        self.assertContains(self.client.get(url), 'Editar')
+        self.client.force_login(self.comprador.usuario)
+        self.assertNotContains(self.client.get(url), 'Editar')
+
+    def test_loader_de_templates_em_cache(self):
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertIsInstance(loader, cached.Loader)
+
+
+class ContadoresTests(DadosDeExemplo):
+    """Contadores dos badges (core.contadores): atualizados pelos eventos, sem contar no banco."""
+
+    def _conferir(self, perfil, **esperados):
+        with self.assertNumQueries(0):
+            valores = contadores.obter(perfil.id, tuple(esperados))
+        self.assertEqual(valores, esperados)
+        for nome, valor in esperados.items():
+            self.assertEqual(contadores.contar_no_banco(nome, [perfil.id]).get(perfil.id, 0), valor)
+
+    def test_leitura_sem_cache_conta_no_banco(self):
+        caches['contadores'].clear()
+        with self.assertNumQueries(2):
+            contadores.obter(self.comprador.id, contadores.DO_TIPO['comprador'])
+        self._conferir(self.comprador, nao_lidas=15, pendentes_comprador=9)
+
+    def test_mensagens_nao_lidas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Mensagem.objects.create(remetente=self.fornecedor, destinatario=self.comprador, conteudo='Novidade')
+        self._conferir(self.comprador, nao_lidas=16)
+
+        self.client.force_login(self.comprador.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('detalhes_conversa', args=[self.fornecedor.id]))
+        self._conferir(self.comprador, nao_lidas=10)
+
+        mensagem = Mensagem.objects.filter(destinatario=self.comprador, lida=False).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            mensagem.mark_as_read()
+        self._conferir(self.comprador, nao_lidas=9)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Mensagem.objects.filter(destinatario=self.comprador, lida=False).first().delete()
+        self._conferir(self.comprador, nao_lidas=8)
+
+    def test_pedidos_pendentes_e_estoque_baixo(self):
+        produto = Produto.objects.filter(fornecedor=self.fornecedor, quantidade=20).get()
+        self._conferir(self.fornecedor, pendentes_fornecedor=9, estoque_baixo=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = Pedido.objects.create(produto=produto, comprador=self.comprador, quantidade=15, valor_total=150)
+        self._conferir(self.comprador, pendentes_comprador=10)
+        self._conferir(self.fornecedor, pendentes_fornecedor=10)
+
+        # O aceite baixa o estoque para 5, abaixo do mínimo
+        with self.captureOnCommitCallbacks(execute=True):
+            estoque.aceitar_pedido(pedido.id, self.fornecedor)
+        self._conferir(self.comprador, pendentes_comprador=9)
+        self.assertEqual(contadores.obter(self.fornecedor.id)['estoque_baixo'], 3)
+        self._conferir(self.fornecedor, pendentes_fornecedor=9, estoque_baixo=3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Pedido.objects.filter(produto__fornecedor=self.fornecedor, status='pendente').first().delete()
+            estoque.processar_em_lote(
+                list(Pedido.objects.filter(comprador=self.compradores[1], status='pendente').values_list('id', flat=True)),
+                self.fornecedor, 'recusado'
+            )
+        self._conferir(self.fornecedor, pendentes_fornecedor=5)
+
+    def test_dashboard_do_fornecedor_usa_o_contador(self):
+        caches['contadores'].set(f'contador:{self.fornecedor.id}:pendentes_fornecedor', 42)
+        self.client.force_login(self.fornecedor.usuario)
+        resposta = self.client.get(reverse('dashboard'))
+        self.assertEqual(resposta.context['pedidos_pendentes'], 42)
+        self.assertEqual(resposta.context['pedidos_concluidos'], 6)
+
+    def test_badges_na_sidebar(self):
+        self.client.force_login(self.fornecedor.usuario)
+        resposta = self.client.get(reverse('listar_pedidos'))
+        self.assertContains(resposta, 'data-badge="pendentes_fornecedor">9</span>', count=1)
+        self.assertContains(resposta, 'data-badge="nao_lidas">15</span>', count=1)
+        self.assertContains(resposta, 'data-badge="estoque_baixo">2</span>', count=1)
+
+    def test_badge_zerado_fica_oculto(self):
+        # Renderizado mesmo zerado, para os eventos em tempo real atualizarem
+        Mensagem.objects.filter(destinatario=self.fornecedor).update(lida=True)
+        contadores.descartar(self.fornecedor.id, 'nao_lidas')
+        self.client.force_login(self.fornecedor.usuario)
+        resposta = self.client.get(reverse('listar_pedidos'))
+        self.assertContains(resposta, 'float-end d-none" data-badge="nao_lidas">0</span>', count=1)
+
+    def test_stream_de_eventos_so_sob_asgi(self):
+        self.client.force_login(self.fornecedor.usuario)
+        self.assertNotContains(self.client.get(reverse('listar_pedidos')), 'new EventSource')
+
+        self.async_client.force_login(self.fornecedor.usuario)
+        resposta = async_to_sync(self.async_client.get)(reverse('listar_pedidos'))
+        self.assertContains(resposta, 'new EventSource', count=1)
+        self.assertContains(resposta, "[data-badge^=\"pendentes_\"]")
+
+    def test_reconciliar_contadores(self):
+        caches['contadores'].set(f'contador:{self.comprador.id}:nao_lidas', 99)
+        saida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconciliar_contadores', '--verificar', stdout=saida)
+        self.assertIn(f'Perfil {self.comprador.id}, nao_lidas: 99 em cache, 15 no banco', saida.getvalue())
+
+        call_command('reconciliar_contadores', stdout=StringIO())
+        self._conferir(self.comprador, nao_lidas=15)
+        call_command('reconciliar_contadores', '--verificar', stdout=StringIO())
+
+
+class PerfisDeBancoTests(SimpleTestCase):
+    # Só para ler os pragmas da conexão de teste
+    databases = {'default'}
+
+    def _banco(self, **ambiente):
+        with mock.patch.dict(os.environ, ambiente):
+            return banco_do_ambiente(Path('/srv/agroconnect'))
+
+    def test_sqlite_ajustado(self):
+        banco = self._banco(DB_PERFIL='sqlite', DB_TIMEOUT='5')
+        self.assertEqual(banco['NAME'], Path('/srv/agroconnect/db.sqlite3'))
+        self.assertIn('PRAGMA journal_mode=WAL', banco['OPTIONS']['init_command'])
+        self.assertIn('PRAGMA synchronous=NORMAL', banco['OPTIONS']['init_command'])
+        self.assertEqual(banco['OPTIONS']['timeout'], 5)
+        self.assertEqual(banco['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertTrue(banco['CONN_HEALTH_CHECKS'])
+
+    def test_postgres_com_pool(self):
+        banco = self._banco(DB_PERFIL='postgres-pool', DB_NAME='agro', DB_POOL_MAX='20')
+        self.assertEqual(banco['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(banco['CONN_MAX_AGE'], 0)
+        self.assertEqual(banco['OPTIONS']['pool']['max_size'], 20)
+
+    def test_perfil_desconhecido(self):
+        with self.assertRaises(ValueError):
+            self._banco(DB_PERFIL='mysql')
+
+    @skipUnless(connection.vendor == 'sqlite', 'Pragmas do SQLite.')
+    def test_pragmas_aplicados_na_conexao(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            # 1 = NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'A réplica de teste é uma cópia do arquivo SQLite.')
+class ReplicaTests(TransactionTestCase):
+    """
+    Uma cópia SQLite do banco de teste faz o papel da réplica: o que muda no principal depois
+    da cópia só aparece quando a leitura vai para o principal.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # O alias é criado aqui (e não em settings) para o runner não montar um banco de teste para
+        # ele; precisa existir antes da validação de `databases` feita pelo TestCase
+        cls.databases = {'default', 'replica_teste'}
+        cls.diretorio = tempfile.mkdtemp()
+        connections.settings['replica_teste'] = {
+            **connections['default'].settings_dict, 'NAME': os.path.join(cls.diretorio, 'replica.sqlite3'),
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica_teste'].close()
+        del connections['replica_teste']
+        del connections.settings['replica_teste']
+        shutil.rmtree(cls.diretorio)
+
+    def setUp(self):
+        self.fornecedor = DadosDeExemplo._perfil('fornecedor', 'fornecedor')
+        self.produto = Produto.objects.create(
+            fornecedor=self.fornecedor, nome='Milho', descricao='milho', preco=5, quantidade=10
+        )
+        connections['replica_teste'].close()
+        replicas.copiar_sqlite('default', connections.settings['replica_teste']['NAME'])
+        Produto.objects.filter(pk=self.produto.pk).update(nome='Milho verde')
+
+        ajustes = override_settings(BANCOS_REPLICA=['replica_teste'])
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _nome(self):
+        return Produto.objects.get(pk=self.produto.pk).nome
+
+    def test_context_manager(self):
+        self.assertEqual(self._nome(), 'Milho verde')
+        with replicas.ler_da_replica():
+            self.assertEqual(self._nome(), 'Milho')
+            produto = Produto.objects.get(pk=self.produto.pk)
+            produto.quantidade = 3
+            # Instância lida da réplica é gravada no principal
+            produto.save()
+        self.assertEqual(Produto.objects.get(pk=self.produto.pk).quantidade, 3)
+
+    def test_escritas_fixam_o_principal(self):
+        self.client.force_login(self.fornecedor.usuario)
+        url = reverse('listar_produtos')
+        # A página vem da réplica (a grade em cache é lida de novo no principal)
+        nomes = lambda resposta: [produto.nome for produto in resposta.context['page_obj']]
+        self.assertEqual(nomes(self.client.get(url)), ['Milho'])
+        self.assertNotIn(replicas.COOKIE, self.client.cookies)
+
+        resposta = self.client.post(reverse('criar_produto'), {
+            'nome': 'Feijão', 'descricao': 'feijão', 'preco': '8', 'quantidade': '5',
+        })
+        self.assertEqual(resposta.status_code, 302)
+        self.assertIn(replicas.COOKIE, resposta.cookies)
+        # Dentro da janela a listagem vem do principal: produto novo e nome atualizado
+        self.assertEqual(nomes(self.client.get(url)), ['Feijão', 'Milho verde'])
+
+
+    def test_middleware_assincrono(self):
+        async def view(request):
+            with replicas.ler_da_replica():
+                nome = await sync_to_async(self._nome)()
+            if 'gravar' in request.GET:
+                await sync_to_async(Produto.objects.filter(pk=self.produto.pk).update)(quantidade=1)
+            return HttpResponse(nome)
+
+        middleware = replicas.ReplicaMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        resposta = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertEqual(resposta.content, b'Milho')
+        self.assertNotIn(replicas.COOKIE, resposta.cookies)
+        # A escrita feita na thread do ORM marca a requisição
+        resposta = async_to_sync(middleware)(RequestFactory().get('/?gravar=1'))
+        self.assertIn(replicas.COOKIE, resposta.cookies)
+
+    def test_relatorio_em_cache_vem_do_principal(self):
+        # A réplica ainda não tem o produto novo quando o save invalida o relatório
+        caches['relatorios'].clear()
+        self.addCleanup(caches['relatorios'].clear)
+        Produto.objects.create(fornecedor=self.fornecedor, nome='Soja', descricao='soja', preco=4, quantidade=2)
+        self.client.force_login(self.fornecedor.usuario)
+        self.assertEqual(self.client.get(reverse('relatorios')).context['total_produtos'], 2)
+        self.assertEqual(caches['relatorios'].get(f'relatorio:{self.fornecedor.id}')['total_produtos'], 2)
+
+        # O mesmo para a view assíncrona
+        caches['relatorios'].clear()
+        resposta = async_to_sync(views.relatorios_assincrono)(self._requisicao_get('/relatorios/'))
+        self.assertContains(resposta, 'Soja')
+        self.assertEqual(caches['relatorios'].get(f'relatorio:{self.fornecedor.id}')['total_produtos'], 2)
+
+    def test_fragmentos_do_catalogo_vem_do_principal(self):
+        # A versão do catálogo já mudou, mas a réplica ainda tem o nome antigo
+        caches['template_fragments'].clear()
+        self.addCleanup(caches['template_fragments'].clear)
+        comprador = DadosDeExemplo._perfil('comprador', 'comprador')
+        self.client.force_login(comprador.usuario)
+        for url in (reverse('listar_produtos'), reverse('dashboard')):
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Milho verde')
+                # Do cache
+                self.assertContains(self.client.get(url), 'Milho verde')
+
+    def test_contador_conta_no_principal(self):
+        # A réplica ainda não tem o pedido quando o contador sai do cache
+        comprador = DadosDeExemplo._perfil('comprador', 'comprador')
+        Pedido.objects.create(produto=self.produto, comprador=comprador, quantidade=1, valor_total=5)
+        caches['contadores'].clear()
+        self.addCleanup(caches['contadores'].clear)
+        with replicas.ler_da_replica():
+            self.assertEqual(contadores.obter(self.fornecedor.id, ('pendentes_fornecedor',)), {'pendentes_fornecedor': 1})
+
+    def _requisicao_get(self, caminho):
+        requisicao = RequestFactory().get(caminho)
+        requisicao.user = User.objects.select_related('perfil').get(pk=self.fornecedor.usuario_id)
+
+        async def auser():
+            return requisicao.user
+
+        requisicao.auser = auser
+        return requisicao
+
+class ViewsAssincronasTests(TransactionTestCase):
+    """
+    As views assíncronas devem produzir a mesma página das síncronas. TransactionTestCase: as
+    threads do pool usam conexões próprias e só enxergam dados confirmados.
+    """
+
+    def setUp(self):
+        self.fornecedor = DadosDeExemplo._perfil('fornecedor', 'fornecedor')
+        self.comprador = DadosDeExemplo._perfil('comprador', 'comprador')
+        categoria = Categoria.objects.create(nome='Grãos')
+        for i in range(4):
+            produto = Produto.objects.create(
+                fornecedor=self.fornecedor, categoria=categoria, nome=f'Feijão {i}',
+                descricao='feijão', preco=10, quantidade=i * 5
+            )
+            Pedido.objects.create(
+                produto=produto, comprador=self.comprador, quantidade=1, valor_total=10,
+                status='entregue' if i % 2 else 'pendente'
+            )
+        Mensagem.objects.create(remetente=self.fornecedor, destinatario=self.comprador, conteudo='Oi')
+
+    def _requisicao(self, caminho, perfil):
+        request = RequestFactory().get(caminho)
+        request.user = User.objects.select_related('perfil').get(pk=perfil.usuario_id)
+
+        async def auser():
+            return request.user
+
+        request.auser = auser
+        return request
+
+    def _pagina(self, view, request):
+        caches['relatorios'].clear()
+        resposta = async_to_sync(view)(request) if iscoroutinefunction(view) else view(request)
+        self.assertEqual(resposta.status_code, 200)
+        return re.sub(r'name="csrfmiddlewaretoken" value="\w+"', '', resposta.content.decode())
+
+    def test_mesma_pagina_das_views_sincronas(self):
+        casos = [
+            (views.dashboard, views.dashboard_assincrono, '/dashboard/', self.fornecedor),
+            (views.dashboard, views.dashboard_assincrono, '/dashboard/', self.comprador),
+            (views.relatorios, views.relatorios_assincrono, '/relatorios/', self.fornecedor),
+        ]
+        for sincrona, assincrona, caminho, perfil in casos:
+            with self.subTest(caminho=caminho, tipo=perfil.tipo):
+                self.assertEqual(
+                    self._pagina(assincrona, self._requisicao(caminho, perfil)),
+                    self._pagina(sincrona, self._requisicao(caminho, perfil)),
+                )
+
+    def _threads_das_consultas(self):
+        threads = []
+
+        def registrar(execute, sql, params, many, context):
+            threads.append(threading.get_ident())
+            return execute(sql, params, many, context)
+
+        request = self._requisicao('/dashboard/', self.fornecedor)
+        # Badges da sidebar já em cache (core.contadores): só as consultas do dashboard
+        contadores.obter(self.fornecedor.id)
+        # Os wrappers da thread da requisição passam para as conexões do pool
+        with connection.execute_wrapper(registrar):
+            self._pagina(views.dashboard_assincrono, request)
+        return threads
+
+    def test_consultas_em_paralelo(self):
+        threads = self._threads_das_consultas()
+        self.assertEqual(len(threads), 6)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_em_sequencia_dentro_de_transacao(self):
+        with transaction.atomic():
+            threads = self._threads_das_consultas()
+        self.assertEqual(threads, [threading.get_ident()] * 6)
+
+
+class MiddlewaresAssincronosTests(DadosDeExemplo):
+    """Sob ASGI os middlewares do projeto rodam no event loop, sem adaptação sync_to_async."""
+
+    def _requisicao(self, usuario, **cabecalhos):
+        request = RequestFactory().get('/teste/', headers=cabecalhos)
+        request.user = usuario
+
+        async def auser():
+            return usuario
+
+        request.auser = auser
+        return request
+
+    def test_cadeia_sem_adaptacao(self):
+        # Com DEBUG o Django registra cada middleware que precisou ser adaptado (e os que saíram da cadeia)
+        ajustes = override_settings(
+            DEBUG=True, PERFILADOR_ATIVO=True, PERFILADOR_DIRETORIO=tempfile.gettempdir(),
+            # ReplicaMiddleware só entra na cadeia com réplicas
+            BANCOS_REPLICA=['replica'],
+        )
+        with ajustes, self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+
+    def test_consultas_da_view_assincrona(self):
+        async def view(request):
+            total = await sync_to_async(Produto.objects.count)()
+            return HttpResponse(str(total))
+
+        middleware = InstrumentacaoSQLMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        resposta = async_to_sync(middleware)(self._requisicao(self.fornecedor.usuario))
+        self.assertIn('desc="1 consultas"', resposta['Server-Timing'])
+
+    def test_perfil_com_frames_da_view_assincrona(self):
+        def ocupar_event_loop():
+            fim = perf_counter() + 0.05
+            while perf_counter() < fim:
+                pass
+
+        async def view(request):
+            ocupar_event_loop()
+            await asyncio.sleep(0.05)
+            return HttpResponse('ok')
+
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio)
+        self.fornecedor.usuario.is_staff = True
+        with override_settings(PERFILADOR_ATIVO=True, PERFILADOR_TAXA=0, PERFILADOR_DIRETORIO=diretorio):
+            middleware = PerfiladorMiddleware(view)
+        resposta = async_to_sync(middleware)(self._requisicao(self.fornecedor.usuario, **{'X-Perfilar': '1'}))
+        with open(os.path.join(diretorio, resposta['X-Perfil'])) as arquivo:
+            conteudo = arquivo.read()
+        self.assertIn('ocupar_event_loop (', conteudo)
+        self.assertIn('(aguardando) ', conteudo)
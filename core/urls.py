@@ -1,21 +1,29 @@
 #urls.py
+from django.conf import settings
 from django.urls import path
 from . import views
 from django.contrib.auth import views as auth_views
 
+# Sob ASGI (VIEWS_ASSINCRONAS=1) o dashboard e os relatórios fazem as consultas em paralelo
+dashboard = views.dashboard_assincrono if settings.VIEWS_ASSINCRONAS else views.dashboard
+relatorios = views.relatorios_assincrono if settings.VIEWS_ASSINCRONAS else views.relatorios
+
 urlpatterns = [
-    path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/', dashboard, name='dashboard'),
     path('pedidos/', views.listar_pedidos, name='listar_pedidos'),
-    path('relatorios/', views.relatorios, name='relatorios'),
+    path('relatorios/', relatorios, name='relatorios'),
+    path('relatorios/receita/', views.serie_receita_api, name='serie_receita_api'),
+    path('exportar/<str:tipo>.csv', views.exportar, name='exportar'),
     path('configuracoes/', views.configuracoes, name='configuracoes'),
     path('criar_produto/', views.criar_produto, name='criar_produto'),
     path('editar_produto/<int:produto_id>/', views.editar_produto, name='editar_produto'), 
+    path('importar_produtos/', views.importar_produtos, name='importar_produtos'),
     path('remover_produto/<int:produto_id>/', views.remover_produto, name='remover_produto'), 
     path('accounts/sign_up/', views.sign_up, name='sign_up'),
     path('accounts/profile/', views.profile_view, name='profile'),
     path('pedidos/aceitar/<int:pedido_id>/', views.aceitar_pedido, name='aceitar_pedido'),
     path('pedidos/recusar/<int:pedido_id>/', views.recusar_pedido, name='recusar_pedido'),
-    path('comprador/', views.dashboard, name='dashboard_comprador'),
+    path('comprador/', dashboard, name='dashboard_comprador'),
     path('pedido/<int:produto_id>/', views.fazer_pedido, name='fazer_pedido'),
     path('pedido/<int:pedido_id>/detalhes/', views.detalhes_pedido, name='detalhes_pedido'),
     path('fornecedor/<int:fornecedor_id>/', views.perfil_fornecedor, name='perfil_fornecedor'),
@@ -24,12 +32,17 @@ urlpatterns = [
     path('produtos/', views.listar_produtos, name='listar_produtos'),
     path('produto/<int:produto_id>/', views.detalhes_produto, name='detalhes_produto'),
     path('fornecedores/pedidos-pendentes/', views.pedidos_pendentes, name='pedidos_pendentes'),
+    path('fornecedores/pedidos-pendentes/lote/', views.processar_pedidos_lote, name='processar_pedidos_lote'),
     path('aceitar-pedido/<int:pedido_id>/', views.aceitar_pedido, name='aceitar_pedido'),
     path('recusar-pedido/<int:pedido_id>/', views.recusar_pedido, name='recusar_pedido'),
     path('meus-pedidos/', views.meus_pedidos, name='meus_pedidos'),
     path('mensagens/', views.mensagens, name='mensagens'),
     path('mensagens/<int:usuario_id>/', views.detalhes_conversa, name='detalhes_conversa'),
+    path('mensagens/<int:usuario_id>/anteriores/', views.mensagens_anteriores, name='mensagens_anteriores'),
+    path('mensagens/<int:usuario_id>/novas/', views.mensagens_novas, name='mensagens_novas'),
     path('nova-mensagem/', views.nova_mensagem, name='nova_mensagem'),
+    path('eventos/', views.eventos_stream, name='eventos'),
+    path('metrics', views.metricas_prometheus, name='metricas'),
     path('alterar-senha/', auth_views.PasswordChangeView.as_view(), name='password_change')
     
 ]
\ No newline at end of file
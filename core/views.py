@@ -1,15 +1,31 @@
 # views.py
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import Http404
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth import login
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Avg, Q, Sum, F
-from .models import Perfil, Produto, Pedido, Transporte, Mensagem, Avaliacao, Categoria
-from .forms import SignUpForm, ProdutoForm, PerfilForm, MensagemForm, AvaliacaoForm, PedidoForm
-from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.views.decorators.http import require_POST
+from django.db import OperationalError, transaction
+from django.db.models import Count, Q, Sum, F, Case, When
+from .models import Perfil, Produto, Pedido, Transporte, Mensagem, Avaliacao, Categoria, Conversa, VendaMensal, ResumoAvaliacoes
+from .forms import SignUpForm, ProdutoForm, PerfilForm, MensagemForm, AvaliacaoForm, PedidoForm, ImportarProdutosForm
+from .series import GRANULARIDADES, serie_receita, ultimos_meses
+from .cache import cache_relatorios
+from .busca import busca_produtos
+from .paginacao import paginar
+from .replicas import leitura_na_replica
+from .paralelo import em_paralelo
+from .eventos import barramento, publicar_nao_lidas
+from . import catalogo, contadores, estoque, exportacao, importacao, metricas, perfilador
+from django.contrib import admin, messages
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date
+from collections import Counter
+import json
 
 
 
@@ -30,99 +46,128 @@ def sign_up(request):
                 endereco=form.cleaned_data['endereco']
             )
 
-            login(request, user)
+            # Com mais de um backend em AUTHENTICATION_BACKENDS o login precisa do backend
+            login(request, user, backend='core.autenticacao.PerfilBackend')
             return redirect('dashboard')
     else:
         form = SignUpForm() # ou UserCreationForm()
     return render(request, 'registration/sign_up.html', {'form' : form})
 
+def _consultas_dashboard_fornecedor(perfil, periodos):
+    # Consultas independentes entre si: em sequência no dashboard, em paralelo no dashboard_assincrono
+    pedidos = Pedido.objects.filter(produto__fornecedor=perfil)
+    return {
+        'total_produtos': lambda: Produto.objects.filter(fornecedor=perfil).count(),
+        # Pendentes do contador em cache (core.contadores); concluídos saem da distribuição de status
+        'pendentes': lambda: contadores.obter(perfil.id, ('pendentes_fornecedor',))['pendentes_fornecedor'],
+        'receita_total': lambda: pedidos.aggregate(total=Sum('valor_total'))['total'],
+        # Gráfico de Vendas Mensais (lido do consolidado VendaMensal, uma consulta para os 6 meses)
+        'serie': lambda: VendaMensal.serie_mensal(perfil, [(mes.year, mes.month) for mes in periodos]),
+        'status': lambda: list(pedidos.values('status').annotate(total=Count('id'))),
+        'ultimos_pedidos': lambda: list(
+            pedidos.select_related('comprador__usuario', 'produto').order_by('-data_pedido')[:5]
+        ),
+        'estoque_baixo': lambda: list(
+            Produto.objects.filter(fornecedor=perfil, quantidade__lt=10).order_by('quantidade')[:5]
+        ),
+    }
+
+def _contexto_dashboard_fornecedor(resultados, periodos):
+    serie = resultados['serie']
+    por_status = {s['status']: s['total'] for s in resultados['status']}
+    return {
+        'total_produtos': resultados['total_produtos'],
+        'pedidos_pendentes': resultados['pendentes'],
+        'pedidos_concluidos': por_status.get('entregue', 0),
+        'receita_total': resultados['receita_total'],
+        'meses': [mes.strftime("%b/%Y") for mes in periodos],
+        'vendas_mensais': [float(serie[(mes.year, mes.month)]['receita']) for mes in periodos],
+        # Distribuição de Status
+        'status_labels': [s['status'].capitalize() for s in resultados['status']],
+        'status_values': [s['total'] for s in resultados['status']],
+        # Dados para as tabelas
+        'ultimos_pedidos': resultados['ultimos_pedidos'],
+        'estoque_baixo': resultados['estoque_baixo'],
+    }
+
+def _consultas_dashboard_comprador(perfil):
+    return {
+        'meus_pedidos': lambda: list(
+            Pedido.objects.filter(comprador=perfil).select_related('produto').order_by('-data_pedido')[:5]
+        ),
+    }
+
+def _contadores_dashboard_comprador(perfil):
+    # Contadores em cache (core.contadores), sem COUNT no banco a cada acesso
+    valores = contadores.obter(perfil.id, ('pendentes_comprador', 'nao_lidas'))
+    return {
+        'pedidos_pendentes': valores['pendentes_comprador'],
+        'mensagens_nao_lidas': valores['nao_lidas'],
+    }
+
+def _produtos_disponiveis(perfil):
+    # Produtos disponíveis (exclui os do próprio usuário se for fornecedor). Consulta preguiçosa:
+    # só roda quando a grade não está no cache de fragmentos, que é por tipo de perfil
+    # (compradores não têm produtos, então a grade é a mesma para todos)
+    return {
+        'produtos_disponiveis': Produto.objects.exclude(
+            fornecedor=perfil
+        ).filter(quantidade__gt=0).order_by('-data_criacao')[:8],
+        **catalogo.contexto_cache(perfil),
+    }
+
+def _dashboard_transportador(request, perfil):
+    transportes = Transporte.objects.filter(transportador=perfil).select_related('pedido__produto')
+    return render(request, 'dashboard_transportador.html', {'transportes': transportes})
+
 @login_required
+@leitura_na_replica
 def dashboard(request):
     perfil = request.user.perfil
-    hoje = timezone.now()
 
     if perfil.tipo == 'fornecedor':
-        # Métricas Básicas
-        total_produtos = Produto.objects.filter(fornecedor=perfil).count()
-        pedidos_pendentes = Pedido.objects.filter(produto__fornecedor=perfil, status='pendente').count()
-        pedidos_concluidos = Pedido.objects.filter(produto__fornecedor=perfil, status='entregue').count()
-        receita_total = Pedido.objects.filter(produto__fornecedor=perfil).aggregate(total=Sum('valor_total'))
-        
-        # Gráfico de Vendas Mensais
-        meses = []
-        vendas_mensais = []
-        for i in range(5, -1, -1):
-            mes = hoje - timedelta(days=30*i)
-            total = Pedido.objects.filter(
-                produto__fornecedor=perfil,
-                data_pedido__month=mes.month,
-                data_pedido__year=mes.year
-            ).aggregate(Sum('valor_total'))['valor_total__sum'] or 0
-            meses.append(mes.strftime("%b/%Y"))
-            vendas_mensais.append(float(total))
-        
-        # Distribuição de Status
-        status = Pedido.objects.filter(produto__fornecedor=perfil).values('status').annotate(
-            total=Count('id'))
-        status_labels = [s['status'].capitalize() for s in status]
-        status_values = [s['total'] for s in status]
-        
-        # Dados para as tabelas
-        context = {
-            'total_produtos': total_produtos,
-            'pedidos_pendentes': pedidos_pendentes,
-            'pedidos_concluidos': pedidos_concluidos,
-            'receita_total': receita_total.get('total', 0),
-            'meses': meses,
-            'vendas_mensais': vendas_mensais,
-            'status_labels': status_labels,
-            'status_values': status_values,
-            'ultimos_pedidos': Pedido.objects.filter(
-                produto__fornecedor=perfil
-            ).select_related('comprador', 'produto').order_by('-data_pedido')[:5],
-            'estoque_baixo': Produto.objects.filter(
-                fornecedor=perfil, 
-                quantidade__lt=10
-            ).order_by('quantidade')[:5]
-        }
-        return render(request, 'fornecedor/dashboard_fornecedor.html', context)
-    
+        periodos = ultimos_meses(timezone.now(), 6)
+        consultas = _consultas_dashboard_fornecedor(perfil, periodos)
+        resultados = {nome: consulta() for nome, consulta in consultas.items()}
+        return render(request, 'fornecedor/dashboard_fornecedor.html', _contexto_dashboard_fornecedor(resultados, periodos))
+
     elif perfil.tipo == 'comprador':
-        perfil = request.user.perfil
-    
-        # Produtos disponíveis (exclui os do próprio usuário se for fornecedor)
-        produtos_disponiveis = Produto.objects.exclude(
-            fornecedor=perfil
-        ).filter(quantidade__gt=0).order_by('-data_criacao')[:8]
-    
-        # Pedidos recentes
-        meus_pedidos = Pedido.objects.filter(
-            comprador=perfil
-        ).select_related('produto').order_by('-data_pedido')[:5]
-
-        # Pedidos pendentes
-        pedidos_pendentes = Pedido.objects.filter(
-            comprador=request.user.perfil,
-            status='pendente'
-        ).count()
-
-        # Mensagens nao lidas
-        mensagens_nao_lidas = Mensagem.objects.filter(
-            destinatario=request.user.perfil,
-            lida=False
-        ).count()
-    
-        context = {
-            'produtos_disponiveis': produtos_disponiveis,
-            'meus_pedidos': meus_pedidos,
-            'pedidos_pendentes': pedidos_pendentes,
-            'mensagens_nao_lidas':mensagens_nao_lidas
-        }
+        context = {nome: consulta() for nome, consulta in _consultas_dashboard_comprador(perfil).items()}
+        context.update(_contadores_dashboard_comprador(perfil))
+        context.update(_produtos_disponiveis(perfil))
         return render(request, 'comprador/dashboard_comprador.html', context)
-    
+
+    elif perfil.tipo == 'transportador':
+        return _dashboard_transportador(request, perfil)
+
+async def _perfil_da_requisicao(request):
+    # login_required carregou o usuário por request.auser(); request.user, lido pelo context
+    # processor de auth no template, tem cache próprio e consultaria o banco de novo
+    request.user = await request.auser()
+    # Perfil já carregado pelo PerfilBackend; sessões antigas (ModelBackend) ainda consultam o banco
+    return await sync_to_async(getattr)(request.user, 'perfil')
+
+@login_required
+@leitura_na_replica
+async def dashboard_assincrono(request):
+    # Mesmo dashboard com as consultas independentes em paralelo (core.paralelo); para ASGI
+    perfil = await _perfil_da_requisicao(request)
+
+    if perfil.tipo == 'fornecedor':
+        periodos = ultimos_meses(timezone.now(), 6)
+        resultados = await em_paralelo(**_consultas_dashboard_fornecedor(perfil, periodos))
+        return await sync_to_async(render)(
+            request, 'fornecedor/dashboard_fornecedor.html', _contexto_dashboard_fornecedor(resultados, periodos)
+        )
+
+    elif perfil.tipo == 'comprador':
+        context = await em_paralelo(**_consultas_dashboard_comprador(perfil))
+        context.update(await sync_to_async(_contadores_dashboard_comprador)(perfil))
+        context.update(await sync_to_async(_produtos_disponiveis)(perfil))
+        return await sync_to_async(render)(request, 'comprador/dashboard_comprador.html', context)
+
     elif perfil.tipo == 'transportador':
-        transportes = Transporte.objects.filter(transportador=perfil)
-        return render(request, 'dashboard_transportador.html', {'transportes': transportes})
+        return await sync_to_async(_dashboard_transportador)(request, perfil)
 
 #Produtos --------------------------------------------------------------------------------------------------------------
 @login_required
@@ -140,15 +185,18 @@ def criar_produto(request):
 
 def detalhes_produto(request, produto_id):
     perfil = request.user.perfil
-    produto = get_object_or_404(Produto, id=produto_id)
+    produto = get_object_or_404(Produto.objects.select_related('fornecedor__usuario'), id=produto_id)
+
+    context = {'produto': produto, **catalogo.contexto_cache(perfil, produto.id)}
 
     if perfil.tipo == 'fornecedor':
-        return render(request, 'fornecedor/produtos/detalhes_produto.html', {'produto': produto})
+        return render(request, 'fornecedor/produtos/detalhes_produto.html', context)
     
     elif perfil.tipo == 'comprador':
-        return render(request, 'comprador/produtos/detalhes_produto.html', {'produto': produto})
+        return render(request, 'comprador/produtos/detalhes_produto.html', context)
 
 @login_required
+@leitura_na_replica
 def listar_produtos(request):
     perfil = request.user.perfil
     # Obter parâmetros de filtro
@@ -159,23 +207,41 @@ def listar_produtos(request):
     produtos = Produto.objects.filter(quantidade__gt=0)
     
     # Aplicar filtros
-    if search_query:
-        produtos = produtos.filter(
-            Q(nome__icontains=search_query) |
-            Q(descricao__icontains=search_query)
-        )
-    
     if categoria_id:
         produtos = produtos.filter(categoria__id=categoria_id)
     
-    # Obter categorias para o dropdown
+    if search_query:
+        # Busca no índice de texto completo, paginando pela posição de relevância
+        ids = busca_produtos().buscar(search_query)
+        if ids:
+            produtos = produtos.filter(id__in=ids).annotate(
+                relevancia=Case(*[When(id=produto_id, then=posicao) for posicao, produto_id in enumerate(ids)])
+            )
+            ordenacao = ('relevancia', 'id')
+        else:
+            produtos = produtos.none()
+            ordenacao = ('-data_criacao', '-id')
+    else:
+        ordenacao = ('-data_criacao', '-id')
+    
+    page_obj, filtros_paginacao = paginar(request, produtos, ordenacao, 12)
+    ids_pagina = [produto.id for produto in page_obj]
+    
+    # A grade e as categorias do dropdown são consultas preguiçosas: só rodam quando o fragmento
+    # não está em cache, e então no banco principal (a página acima pode ter vindo da réplica)
+    grade = produtos.filter(id__in=ids_pagina).select_related('fornecedor__usuario', 'categoria').order_by(*ordenacao)
     categorias = Categoria.objects.all()
     
     context = {
-        'produtos': produtos.order_by('-data_criacao'),
+        'produtos': grade,
+        'page_obj': page_obj,
+        'filtros_paginacao': filtros_paginacao,
         'categorias': categorias,
         'search_query': search_query,
-        'categoria_selecionada': int(categoria_id) if categoria_id else None
+        'categoria_selecionada': int(categoria_id) if categoria_id else None,
+        # A grade em cache é a da página atual: a chave leva os ids exibidos
+        'ids_pagina': ','.join(map(str, ids_pagina)),
+        **catalogo.contexto_cache(perfil),
     }
 
     if perfil.tipo == 'fornecedor':
@@ -200,6 +266,33 @@ def editar_produto(request, produto_id):
     
     return render(request, 'fornecedor/produtos/editar_produto.html', {'produto': produto})
 
+@login_required
+def importar_produtos(request):
+    perfil = request.user.perfil
+    if perfil.tipo != 'fornecedor':
+        return redirect('dashboard')
+
+    resultado = None
+    form = ImportarProdutosForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        arquivo = form.cleaned_data['arquivo']
+        formato = form.cleaned_data['formato'] or importacao.formato_do_arquivo(arquivo.name)
+        try:
+            resultado = importacao.importar_produtos(importacao.ler_linhas(arquivo, formato), perfil)
+        except importacao.ArquivoInvalido as erro:
+            form.add_error('arquivo', str(erro))
+        else:
+            if resultado.interrupcao:
+                # Resultado parcial: o que foi gravado antes do erro continua no relatório
+                form.add_error('arquivo', resultado.interrupcao)
+
+    if request.method == 'POST' and request.accepts('application/json') and not request.accepts('text/html'):
+        if resultado is None:
+            return JsonResponse({'erros': form.errors}, status=400)
+        return JsonResponse(resultado.como_dict())
+
+    return render(request, 'fornecedor/produtos/importar_produtos.html', {'form': form, 'resultado': resultado})
+
 @login_required
 def remover_produto(request, produto_id):
     produto = get_object_or_404(Produto, id=produto_id, fornecedor=request.user.perfil)
@@ -214,45 +307,33 @@ def listar_pedidos(request):
     # Filtra pedidos dos produtos do fornecedor logado
     pedidos = Pedido.objects.filter(
         produto__fornecedor=request.user.perfil
-    ).select_related('comprador', 'produto').order_by('-data_pedido')
+    ).select_related('comprador__usuario', 'produto')
 
-    # Paginação
-    paginator = Paginator(pedidos, 10)  # 10 pedidos por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginação por cursor (10 pedidos por página)
+    page_obj, filtros_paginacao = paginar(request, pedidos, ('-data_pedido', '-id'), 10)
+    context = {
+        'pedidos': page_obj,
+        'page_obj': page_obj,
+        'filtros_paginacao': filtros_paginacao
+    }
 
     if perfil.tipo == 'fornecedor':
-        return render(request, 'fornecedor/pedido/listar_pedidos.html', {
-        'pedidos': pedidos
-    })
+        return render(request, 'fornecedor/pedido/listar_pedidos.html', context)
     
     elif perfil.tipo == 'comprador':
-        return render(request, 'comprador/pedido/listar_pedidos.html', {
-        'pedidos': pedidos
-    })
+        return render(request, 'comprador/pedido/listar_pedidos.html', context)
 
 @login_required
 def aceitar_pedido(request, pedido_id):
-    pedido = get_object_or_404(
-        Pedido.objects.select_related('produto'),
-        id=pedido_id,
-        produto__fornecedor=request.user.perfil
-    )
-    
-    if pedido.status == 'pendente':
-        # Verificar estoque
-        if pedido.produto.quantidade >= pedido.quantidade:
-            # Atualizar estoque
-            pedido.produto.quantidade -= pedido.quantidade
-            pedido.produto.save()
-            
-            # Atualizar status do pedido
-            pedido.status = 'aceito'
-            pedido.save()
-            messages.success(request, 'Pedido aceito e estoque atualizado!')
-        else:
-            messages.error(request, 'Estoque insuficiente para aceitar o pedido!')
-    else:
+    try:
+        # Baixa de estoque atômica (UPDATE condicional) junto com a mudança de status
+        estoque.aceitar_pedido(pedido_id, request.user.perfil)
+        messages.success(request, 'Pedido aceito e estoque atualizado!')
+    except Pedido.DoesNotExist:
+        raise Http404("Pedido não encontrado.")
+    except estoque.EstoqueInsuficiente:
+        messages.error(request, 'Estoque insuficiente para aceitar o pedido!')
+    except estoque.PedidoJaProcessado:
         messages.error(request, 'Este pedido já foi processado anteriormente.')
     
     return redirect('pedidos_pendentes')
@@ -272,7 +353,7 @@ def recusar_pedido(request, pedido_id):
 
 @login_required
 def fazer_pedido(request, produto_id):
-    produto = get_object_or_404(Produto, id=produto_id)
+    produto = get_object_or_404(Produto.objects.select_related('fornecedor__usuario'), id=produto_id)
     
     if request.method == 'POST':
         form = PedidoForm(request.POST, produto=produto)
@@ -343,6 +424,46 @@ def recusar_pedido(request, pedido_id):
     
     return redirect('pedidos_pendentes')
 
+RESULTADOS_LOTE = {
+    'aceito': 'aceitos',
+    'recusado': 'recusados',
+    'estoque_insuficiente': 'sem estoque suficiente',
+    'ja_processado': 'já processados',
+    'nao_encontrado': 'não encontrados',
+}
+
+@login_required
+@require_POST
+def processar_pedidos_lote(request):
+    # Aceita ou recusa de uma vez os pedidos marcados em pedidos_pendentes
+    decisao = {'aceitar': 'aceito', 'recusar': 'recusado'}.get(request.POST.get('decisao'))
+    try:
+        pedido_ids = [int(pedido_id) for pedido_id in request.POST.getlist('pedidos')]
+    except ValueError:
+        pedido_ids = None
+    
+    resultados, erro, status_erro = None, None, 400
+    if not decisao or not pedido_ids:
+        erro = 'Selecione pelo menos um pedido e uma ação válida.'
+    else:
+        try:
+            resultados = estoque.processar_em_lote(pedido_ids, request.user.perfil, decisao)
+        except (estoque.ConflitoDeEstoque, OperationalError):
+            erro, status_erro = 'O estoque foi alterado durante o processamento. Nenhum pedido foi alterado; tente novamente.', 409
+    
+    if request.accepts('application/json') and not request.accepts('text/html'):
+        if erro:
+            return JsonResponse({'erro': erro}, status=status_erro)
+        return JsonResponse({'resultados': {str(k): v for k, v in resultados.items()}})
+    
+    if erro:
+        messages.error(request, erro)
+    else:
+        contagem = Counter(resultados.values())
+        resumo = ', '.join(f'{total} {RESULTADOS_LOTE[resultado]}' for resultado, total in contagem.items())
+        messages.success(request, f'Pedidos processados: {resumo}.')
+    return redirect('pedidos_pendentes')
+
 @login_required
 def meus_pedidos(request):
     perfil = request.user.perfil
@@ -350,26 +471,19 @@ def meus_pedidos(request):
     # Filtra os pedidos do comprador logado
     pedidos = Pedido.objects.filter(
         comprador=perfil
-    ).select_related('produto', 'produto__fornecedor').order_by('-data_pedido')
+    ).select_related('produto', 'produto__fornecedor__usuario')
     
     # Filtro por status
     status = request.GET.get('status')
     if status in dict(Pedido.STATUS_CHOICES).keys():
         pedidos = pedidos.filter(status=status)
     
-    # Paginação (10 itens por página)
-    paginator = Paginator(pedidos, 10)
-    page_number = request.GET.get('page')
-    
-    try:
-        page_obj = paginator.page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+    # Paginação por cursor (10 itens por página)
+    page_obj, filtros_paginacao = paginar(request, pedidos, ('-data_pedido', '-id'), 10)
     
     context = {
         'page_obj': page_obj,
+        'filtros_paginacao': filtros_paginacao,
         'selected_status': status,
         'status_choices': Pedido.STATUS_CHOICES
     }
@@ -386,45 +500,19 @@ def meus_pedidos(request):
 def mensagens(request):
     perfil_usuario = request.user.perfil
     
-    # Obter todas as conversas
-    conversas = Mensagem.objects.filter(
-        Q(remetente=perfil_usuario) | Q(destinatario=perfil_usuario)
-    ).values('remetente', 'destinatario').distinct()
-    
-    threads = []
-    for conversa in conversas:
-        rem_id = conversa['remetente']
-        dest_id = conversa['destinatario']
-        
-        # Determinar o outro usuário da conversa
-        if rem_id == perfil_usuario.id:
-            outro_usuario_id = dest_id
-        else:
-            outro_usuario_id = rem_id
-            
-        try:
-            outro_usuario = Perfil.objects.get(id=outro_usuario_id)
-            ultima_msg = Mensagem.objects.filter(
-                Q(remetente=perfil_usuario, destinatario=outro_usuario) |
-                Q(remetente=outro_usuario, destinatario=perfil_usuario)
-            ).latest('data_envio')
-            
-            threads.append({
-                'user': outro_usuario,
-                'ultima_msg': ultima_msg,
-                'nao_lidas': Mensagem.objects.filter(
-                    destinatario=perfil_usuario,
-                    remetente=outro_usuario,
-                    lida=False
-                ).count()
-            })
-            
-        except (Perfil.DoesNotExist, Mensagem.DoesNotExist):
-            continue
+    # Conversas a partir do resumo (uma consulta, já ordenada pela última mensagem)
+    threads = [
+        {
+            'user': conversa.outro(perfil_usuario),
+            'ultima_msg': conversa.ultima_mensagem,
+            'nao_lidas': conversa.nao_lidas_para(perfil_usuario)
+        }
+        for conversa in Conversa.da_caixa(perfil_usuario).filter(ultima_mensagem__isnull=False)
+    ]
     
     context = {
-        'threads': sorted(threads, key=lambda x: x['ultima_msg'].data_envio, reverse=True),
-        'todos_usuarios': Perfil.objects.exclude(id=perfil_usuario.id)
+        'threads': threads,
+        'todos_usuarios': Perfil.objects.exclude(id=perfil_usuario.id).select_related('usuario')
     }
 
     if perfil_usuario.tipo == 'fornecedor':
@@ -481,17 +569,41 @@ def enviar_mensagem(request, fornecedor_id):
             form = MensagemForm()
     return render(request, 'enviar_mensagem.html', {'form':form, 'fornecedor': fornecedor})
 
+# Quantidade de mensagens exibidas ao abrir uma conversa e em cada página anterior
+MENSAGENS_POR_PAGINA = 30
+
+def _mensagens_da_conversa(perfil, outro_id):
+    return Mensagem.objects.filter(
+        Q(remetente=perfil, destinatario_id=outro_id) |
+        Q(remetente_id=outro_id, destinatario=perfil)
+    )
+
+def _marcar_conversa_como_lida(perfil, outro_id):
+    lidas = Mensagem.objects.filter(
+        destinatario=perfil,
+        remetente_id=outro_id,
+        lida=False
+    ).update(lida=True)
+    if lidas:
+        Conversa.marcar_lidas(perfil.id, outro_id)
+        contadores.somar(perfil.id, 'nao_lidas', -lidas)
+        publicar_nao_lidas(perfil.id)
+
+def _mensagem_json(mensagem, perfil):
+    return {
+        'id': mensagem.id,
+        'conteudo': mensagem.conteudo,
+        'data_envio': mensagem.data_envio,
+        'enviada': mensagem.remetente_id == perfil.id
+    }
+
 @login_required
 def detalhes_conversa(request, usuario_id):
     perfil_usuario = request.user.perfil
-    outro_usuario = get_object_or_404(Perfil, id=usuario_id)
+    outro_usuario = get_object_or_404(Perfil.objects.select_related('usuario'), id=usuario_id)
     
     # Marcar mensagens como lidas
-    Mensagem.objects.filter(
-        destinatario=perfil_usuario,
-        remetente=outro_usuario,
-        lida=False
-    ).update(lida=True)
+    _marcar_conversa_como_lida(perfil_usuario, outro_usuario.id)
     
     if request.method == 'POST':
         form = MensagemForm(request.POST)
@@ -504,14 +616,15 @@ def detalhes_conversa(request, usuario_id):
     else:
         form = MensagemForm()
     
-    mensagens = Mensagem.objects.filter(
-        Q(remetente=perfil_usuario, destinatario=outro_usuario) |
-        Q(remetente=outro_usuario, destinatario=perfil_usuario)
-    ).order_by('data_envio')
+    # Apenas as mensagens mais recentes; as anteriores são carregadas sob demanda
+    mensagens = list(_mensagens_da_conversa(perfil_usuario, outro_usuario.id).order_by('-id')[:MENSAGENS_POR_PAGINA + 1])
+    tem_anteriores = len(mensagens) > MENSAGENS_POR_PAGINA
+    mensagens = mensagens[:MENSAGENS_POR_PAGINA][::-1]
     
     context = {
         'outro_usuario': outro_usuario,
         'mensagens': mensagens,
+        'tem_anteriores': tem_anteriores,
         'form': form
     }
     if perfil_usuario.tipo == 'fornecedor':
@@ -520,82 +633,220 @@ def detalhes_conversa(request, usuario_id):
     elif perfil_usuario.tipo == 'comprador':
         return render(request, 'comprador/conversas/detalhes_conversa.html', context)
 
+@login_required
+def mensagens_anteriores(request, usuario_id):
+    # Página de mensagens anteriores à mensagem `antes` (cursor pelo id)
+    perfil_usuario = request.user.perfil
+    try:
+        antes = int(request.GET['antes'])
+    except (KeyError, ValueError):
+        return JsonResponse({'erro': 'Parâmetro "antes" inválido.'}, status=400)
+    
+    mensagens = list(
+        _mensagens_da_conversa(perfil_usuario, usuario_id).filter(id__lt=antes).order_by('-id')[:MENSAGENS_POR_PAGINA + 1]
+    )
+    return JsonResponse({
+        'mensagens': [_mensagem_json(m, perfil_usuario) for m in reversed(mensagens[:MENSAGENS_POR_PAGINA])],
+        'tem_anteriores': len(mensagens) > MENSAGENS_POR_PAGINA
+    })
+
+@login_required
+def mensagens_novas(request, usuario_id):
+    # Mensagens posteriores à mensagem `depois`, para consulta periódica do cliente
+    perfil_usuario = request.user.perfil
+    try:
+        depois = int(request.GET.get('depois', 0))
+    except ValueError:
+        return JsonResponse({'erro': 'Parâmetro "depois" inválido.'}, status=400)
+    
+    mensagens = list(
+        _mensagens_da_conversa(perfil_usuario, usuario_id).filter(id__gt=depois).order_by('id')[:MENSAGENS_POR_PAGINA]
+    )
+    if any(m.destinatario_id == perfil_usuario.id and not m.lida for m in mensagens):
+        _marcar_conversa_como_lida(perfil_usuario, usuario_id)
+    return JsonResponse({
+        'mensagens': [_mensagem_json(m, perfil_usuario) for m in mensagens]
+    })
+
+# Eventos -----------------------------------------------------------------------------------------
+
+# Intervalo (s) entre comentários de keep-alive no fluxo de eventos
+INTERVALO_PING_EVENTOS = 15
+
+def _evento_sse(evento):
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento, cls=DjangoJSONEncoder)}\n\n"
+
+async def _fluxo_eventos(perfil_id, nao_lidas):
+    with barramento().assinar(perfil_id) as assinatura:
+        yield _evento_sse({'tipo': 'nao_lidas', 'total': nao_lidas})
+        while True:
+            evento = await assinatura.proximo(timeout=INTERVALO_PING_EVENTOS)
+            yield ': ping\n\n' if evento is None else _evento_sse(evento)
+
+@login_required
+async def eventos_stream(request):
+    # Server-sent events: novas mensagens, não lidas e mudanças de status de pedidos
+    user = await request.auser()
+    try:
+        perfil = await Perfil.objects.aget(usuario=user)
+    except Perfil.DoesNotExist:
+        # 204 faz o EventSource parar de reconectar
+        return HttpResponse(status=204)
+    nao_lidas = (await sync_to_async(contadores.obter)(perfil.id, ('nao_lidas',)))['nao_lidas']
+
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI não há conexão longa: envia o estado atual e pede reconexão (polling)
+        resposta = HttpResponse(
+            'retry: 15000\n' + _evento_sse({'tipo': 'nao_lidas', 'total': nao_lidas}),
+            content_type='text/event-stream'
+        )
+    else:
+        resposta = StreamingHttpResponse(_fluxo_eventos(perfil.id, nao_lidas), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
 # Outras Config -------------------------------------------------------------------------------------
 
 @login_required
+@leitura_na_replica
 def relatorios(request):
     perfil = request.user.perfil
-    hoje = timezone.now()
-    
-    # Métricas Principais
-    total_produtos = Produto.objects.filter(fornecedor=perfil).count()
-    pedidos_concluidos = Pedido.objects.filter(produto__fornecedor=perfil, status='entregue').count()
-    receita_total = Pedido.objects.filter(produto__fornecedor=perfil).aggregate(
-        total=Sum('valor_total')
-    )['total'] or 0
-    
-    # Dados para Gráficos
-    meses = []
-    receita_mensal = []
-    pedidos_mensais = []
-    for i in range(5, -1, -1):
-        mes = hoje - timedelta(days=30*i)
-        periodo = Pedido.objects.filter(
-            produto__fornecedor=perfil,
-            data_pedido__month=mes.month,
-            data_pedido__year=mes.year
-        )
-        meses.append(mes.strftime("%b/%Y"))
-        receita_mensal.append(float(periodo.aggregate(Sum('valor_total'))['valor_total__sum'] or 0))
-        pedidos_mensais.append(periodo.count())
-    
-    # Categorias
-    categorias = Categoria.objects.annotate(
-        total_vendas=Count('produto__pedidos'),
-        receita_total=Sum('produto__pedidos__valor_total')
-    ).filter(produto__fornecedor=perfil)
-    
-    # Top Produtos
-    top_produtos = Produto.objects.filter(fornecedor=perfil).annotate(
-        total_vendas=Count('pedidos'),
-        receita_total=Sum('pedidos__valor_total')
-    ).order_by('-receita_total')[:5]
-    
-    context = {
-        'total_produtos': total_produtos,
+    context = cache_relatorios.obter(perfil.id, lambda: contexto_relatorios(perfil))
+    return render(request, 'fornecedor/relatorios.html', context)
+
+@login_required
+@leitura_na_replica
+async def relatorios_assincrono(request):
+    # Mesmo relatório com as consultas independentes em paralelo (core.paralelo); para ASGI
+    perfil = await _perfil_da_requisicao(request)
+    context = await cache_relatorios.aobter(perfil.id, lambda: acontexto_relatorios(perfil))
+    return await sync_to_async(render)(request, 'fornecedor/relatorios.html', context)
+
+def _consultas_relatorios(perfil, periodos):
+    # Listas materializadas para poder ir para o cache
+    pedidos = Pedido.objects.filter(produto__fornecedor=perfil)
+    return {
+        # Métricas Principais
+        'total_produtos': lambda: Produto.objects.filter(fornecedor=perfil).count(),
+        'pedidos_concluidos': lambda: pedidos.filter(status='entregue').count(),
+        'receita_total': lambda: pedidos.aggregate(total=Sum('valor_total'))['total'] or 0,
+        # Dados para Gráficos (lidos do consolidado VendaMensal)
+        'serie': lambda: VendaMensal.serie_mensal(perfil, [(mes.year, mes.month) for mes in periodos]),
+        # Categorias
+        'categorias': lambda: list(Categoria.objects.annotate(
+            total_vendas=Count('produto__pedidos'),
+            receita_total=Sum('produto__pedidos__valor_total')
+        ).filter(produto__fornecedor=perfil)),
+        # Top Produtos
+        'top_produtos': lambda: list(Produto.objects.filter(fornecedor=perfil).annotate(
+            total_vendas=Count('pedidos'),
+            receita_total=Sum('pedidos__valor_total')
+        ).order_by('-receita_total')[:5]),
+        'ultimas_transacoes': lambda: list(
+            pedidos.select_related('comprador__usuario').order_by('-data_pedido')[:10]
+        ),
+        'produtos_estoque_baixo': lambda: Produto.objects.filter(
+            fornecedor=perfil,
+            quantidade__lt=F('estoque_minimo')
+        ).count(),
+    }
+
+def _contexto_relatorios(resultados, periodos):
+    serie = resultados['serie']
+    receita_total = resultados['receita_total']
+    pedidos_concluidos = resultados['pedidos_concluidos']
+    return {
+        'total_produtos': resultados['total_produtos'],
         'pedidos_concluidos': pedidos_concluidos,
         'receita_total': receita_total,
         'ticket_medio': receita_total / pedidos_concluidos if pedidos_concluidos else 0,
-        'meses': meses,
-        'receita_mensal': receita_mensal,
-        'pedidos_mensais': pedidos_mensais,
-        'categorias_labels': [c.nome for c in categorias],
-        'categorias_values': [float(c.receita_total or 0) for c in categorias],
-        'top_produtos': top_produtos,
-        'ultimas_transacoes': Pedido.objects.filter(
-            produto__fornecedor=perfil
-        ).select_related('comprador').order_by('-data_pedido')[:10],
-        'produtos_estoque_baixo': Produto.objects.filter(
-        fornecedor=perfil,
-        quantidade__lt=F('estoque_minimo')
-    ).count()
+        'meses': [mes.strftime("%b/%Y") for mes in periodos],
+        'receita_mensal': [float(serie[(mes.year, mes.month)]['receita']) for mes in periodos],
+        'pedidos_mensais': [serie[(mes.year, mes.month)]['pedidos'] for mes in periodos],
+        'categorias_labels': [c.nome for c in resultados['categorias']],
+        'categorias_values': [float(c.receita_total or 0) for c in resultados['categorias']],
+        'top_produtos': resultados['top_produtos'],
+        'ultimas_transacoes': resultados['ultimas_transacoes'],
+        'produtos_estoque_baixo': resultados['produtos_estoque_baixo'],
     }
-    return render(request, 'fornecedor/relatorios.html', context)
+
+def contexto_relatorios(perfil):
+    # Contexto calculado do relatório, pronto para o cache
+    periodos = ultimos_meses(timezone.now(), 6)
+    resultados = {nome: consulta() for nome, consulta in _consultas_relatorios(perfil, periodos).items()}
+    return _contexto_relatorios(resultados, periodos)
+
+async def acontexto_relatorios(perfil):
+    periodos = ultimos_meses(timezone.now(), 6)
+    resultados = await em_paralelo(**_consultas_relatorios(perfil, periodos))
+    return _contexto_relatorios(resultados, periodos)
+
+@login_required
+@leitura_na_replica
+def serie_receita_api(request):
+    perfil = request.user.perfil
+    if perfil.tipo != 'fornecedor':
+        return JsonResponse({'erro': 'Apenas fornecedores podem consultar relatórios.'}, status=403)
+
+    hoje = timezone.localdate()
+    granularidade = request.GET.get('granularidade', 'mes')
+    try:
+        fim = date.fromisoformat(request.GET['fim']) if request.GET.get('fim') else hoje
+        inicio = date.fromisoformat(request.GET['inicio']) if request.GET.get('inicio') else ultimos_meses(fim, 6)[0]
+        serie = serie_receita(perfil, inicio, fim, granularidade, request.GET.get('status') or None)
+    except ValueError as erro:
+        return JsonResponse({'erro': str(erro), 'granularidades': list(GRANULARIDADES)}, status=400)
+
+    return JsonResponse({
+        'inicio': inicio,
+        'fim': fim,
+        'granularidade': granularidade,
+        'serie': serie,
+    })
+
+@login_required
+def exportar(request, tipo):
+    perfil = request.user.perfil
+    if perfil.tipo != 'fornecedor':
+        return JsonResponse({'erro': 'Apenas fornecedores podem exportar dados.'}, status=403)
+    if tipo not in exportacao.EXPORTACOES:
+        raise Http404
+
+    try:
+        filtros = exportacao.ler_filtros(request.GET)
+    except ValueError as erro:
+        return JsonResponse({'erro': str(erro)}, status=400)
+
+    # O arquivo é gerado enquanto é enviado; nunca fica inteiro em memória
+    response = StreamingHttpResponse(
+        exportacao.EXPORTACOES[tipo](perfil, **filtros),
+        content_type='text/csv; charset=utf-8'
+    )
+    nome = '_'.join([tipo] + [str(valor) for valor in filtros.values() if valor])
+    response['Content-Disposition'] = f'attachment; filename="{nome}.csv"'
+    return response
 
 @login_required
 def profile_view(request):
     return render(request, 'registration/profile.html')
 
 @login_required
+@leitura_na_replica
 def perfil_fornecedor(request, fornecedor_id):
-    fornecedor = get_object_or_404(Perfil, id=fornecedor_id, tipo='fornecedor')
-    avaliacoes = Avaliacao.objects.filter(fornecedor=fornecedor)
-    media_avaliacoes = fornecedor.avaliacoes_recebidas.aggregate(Avg('nota'))['nota__avg']
+    fornecedor = get_object_or_404(Perfil.objects.select_related('usuario'), id=fornecedor_id, tipo='fornecedor')
+    # Média e histograma vêm do resumo mantido pelos sinais; só a página atual de avaliações é lida
+    resumo = ResumoAvaliacoes.do_fornecedor(fornecedor)
+    avaliacoes = Avaliacao.objects.filter(fornecedor=fornecedor).select_related('avaliador__usuario', 'pedido__produto')
+    page_obj, filtros_paginacao = paginar(request, avaliacoes, ('-data_criacao', '-id'), 10)
     
     context = {
         'fornecedor': fornecedor,
-        'avaliacoes': avaliacoes,
-        'rating_medio': avaliacoes.aggregate(Avg('nota'))['nota__avg'] or 0
+        'resumo': resumo,
+        'avaliacoes': page_obj,
+        'page_obj': page_obj,
+        'filtros_paginacao': filtros_paginacao,
+        'rating_medio': resumo.media
     }
     return render(request, 'perfil_fornecedor.html', context)
 
@@ -632,7 +883,9 @@ def avaliar_fornecedor(request, pedido_id):
             avaliacao.pedido = pedido
             avaliacao.avaliador = request.user.perfil
             avaliacao.fornecedor = pedido.produto.fornecedor
-            avaliacao.save()
+            # A avaliação e o resumo do fornecedor são gravados juntos
+            with transaction.atomic():
+                avaliacao.save()
             return redirect('detalhes_pedido', pedido_id=pedido.id)
     else:
         form = AvaliacaoForm()
@@ -640,4 +893,32 @@ def avaliar_fornecedor(request, pedido_id):
     return render(request, 'avaliar_fornecedor.html', {
         'form': form,
         'pedido': pedido
-    })
\ No newline at end of file
+    })
+
+# Métricas ----------------------------------------------------------------------------------------
+
+def metricas_prometheus(request):
+    token = settings.METRICAS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse('Token inválido.', status=403, content_type='text/plain')
+    return HttpResponse(metricas.registro.exposicao(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Perfis de requisição (admin) --------------------------------------------------------------------
+
+@staff_member_required
+def perfis_capturados(request):
+    return render(request, 'admin/perfis.html', {
+        **admin.site.each_context(request),
+        'title': 'Perfis de requisições',
+        'perfis': perfilador.listar(settings.PERFILADOR_DIRETORIO),
+        'ativo': settings.PERFILADOR_ATIVO,
+        'cabecalho': settings.PERFILADOR_CABECALHO,
+        'taxa': settings.PERFILADOR_TAXA,
+    })
+
+@staff_member_required
+def baixar_perfil(request, nome):
+    caminho = perfilador.caminho_do_perfil(settings.PERFILADOR_DIRETORIO, nome)
+    if caminho is None:
+        raise Http404("Perfil não encontrado.")
+    return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=nome, content_type='text/plain')